@@ -5,5 +5,9 @@ import models.all_models
 import routes.routes
 
 if __name__ == '__main__':
-    trade_engine.init()
+    trade_engine.init(
+        app.config.get("SNAPSHOT_PATH"),
+        app.config.get("JOURNAL_PATH"),
+        app.config.get("SNAPSHOT_INTERVAL")
+    )
     app.run(debug=True)
@@ -0,0 +1,90 @@
+from locks.reader_writer.reader_writer_lock import ReaderWriterLock
+from locks.reader_writer.policy_reader_writer_lock import PolicyReaderWriterLock
+from locks.reader_writer.reader_writer_policy import ReaderWriterPolicy
+from timeit import default_timer
+import threading
+import random
+import sys
+
+
+# Mixed read/write contention on one lock. Every thread runs the same number of operations, a share of them
+# writes, and holds the lock for a short critical section. Run from the server directory with
+#     python -m benchmarks.reader_writer_lock_benchmark [threads] [operations] [write_fraction]
+def run(lock, thread_count, operation_count, write_fraction, work):
+    shared = [0]
+    latencies = []
+    latencies_lock = threading.Lock()
+    start_event = threading.Event()
+
+    def worker(seed):
+        randomizer = random.Random(seed)
+        thread_latencies = []
+        start_event.wait()
+
+        for i in range(operation_count):
+            is_write = randomizer.random() < write_fraction
+            start = default_timer()
+            if is_write:
+                lock.acquire_write()
+                thread_latencies.append(default_timer() - start)
+                for j in range(work):
+                    shared[0] += 1
+                lock.release_write()
+            else:
+                lock.acquire_read()
+                thread_latencies.append(default_timer() - start)
+                for j in range(work):
+                    shared[0] + 1
+                lock.release_read()
+
+        with latencies_lock:
+            latencies.extend(thread_latencies)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(thread_count)]
+    for thread in threads:
+        thread.start()
+
+    start = default_timer()
+    start_event.set()
+    for thread in threads:
+        thread.join()
+    elapsed = default_timer() - start
+
+    latencies.sort()
+    return {
+        "ops_per_second": thread_count * operation_count / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p99": latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)],
+        "max": latencies[-1]
+    }
+
+
+def main(thread_count=8, operation_count=20000, write_fraction=0.1, work=20):
+    locks = [
+        ("ReaderWriterLock", lambda: ReaderWriterLock()),
+        ("Policy writer preferring", lambda: PolicyReaderWriterLock(ReaderWriterPolicy.WRITER_PREFERRING)),
+        ("Policy reader preferring", lambda: PolicyReaderWriterLock(ReaderWriterPolicy.READER_PREFERRING)),
+        ("Policy fifo", lambda: PolicyReaderWriterLock(ReaderWriterPolicy.FIFO))
+    ]
+
+    print("threads=%d operations=%d write_fraction=%.2f" % (thread_count, operation_count, write_fraction))
+    print("%-26s %12s %10s %10s %10s" % ("lock", "ops/s", "p50 us", "p99 us", "max us"))
+
+    for (name, lock_factory) in locks:
+        result = run(lock_factory(), thread_count, operation_count, write_fraction, work)
+        print("%-26s %12.0f %10.1f %10.1f %10.1f" % (
+            name,
+            result["ops_per_second"],
+            result["p50"] * 1000000,
+            result["p99"] * 1000000,
+            result["max"] * 1000000
+        ))
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    main(
+        int(arguments[0]) if len(arguments) > 0 else 8,
+        int(arguments[1]) if len(arguments) > 1 else 20000,
+        float(arguments[2]) if len(arguments) > 2 else 0.1
+    )
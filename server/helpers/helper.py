@@ -1,3 +1,7 @@
+from bisect import bisect_left
+from functools import cmp_to_key
+
+
 def binary_search(array, target, comparer):
     lower = 0
     upper = len(array) - 1
@@ -13,6 +17,17 @@ def binary_search(array, target, comparer):
     return -lower - 1
 
 
+def binary_search_key(keys, target_key):
+    index = bisect_left(keys, target_key)
+    if index < len(keys) and keys[index] == target_key:
+        return index
+    return -index - 1
+
+
+def comparer_key(comparer):
+    return cmp_to_key(lambda item1, item2: -comparer(item1, item2))
+
+
 def insert_sorted(array, target, comparer):
     array.insert(target, binary_search(array, target, comparer))
 
@@ -0,0 +1,4 @@
+class DeadlockError(Exception):
+    def __init__(self, resource):
+        Exception.__init__(self, "Deadlock")
+        self.resource = resource
@@ -1,27 +1,77 @@
-from locks.thread_safe_dic import ThreadSafeDic
+from locks.striped_lock_table import StripedLockTable
 from enter import Enter
+from timed_lock import TimedLock
 import threading
 
 
 class LockDic:
-    def __init__(self):
-        self._dic = ThreadSafeDic()
+    def __init__(self, stripe_count=None, hot_keys=None, wait_for_graph=None):
+        self._table = StripedLockTable(TimedLock, stripe_count, hot_keys)
+        self._wait_for_graph = wait_for_graph
+        # Per thread hold counts, since two keys held by one thread can share a stripe.
+        self._held = threading.local()
+
+    def __get_held(self):
+        held = getattr(self._held, "counts", None)
+        if held is None:
+            held = self._held.counts = {}
+        return held
 
     def enter(self, key):
         return Enter(self, key)
 
-    def acquire(self, key):
-        if key not in self._dic:
-            with self._dic as dic:
-                if key not in dic:
-                    dic[key] = threading.Lock()
+    def get_lock_key(self, key):
+        return self._table.get_lock_key(key)
+
+    def add_hot_key(self, key):
+        self._table.add_hot_key(key)
+
+    def acquire(self, key, timeout=None):
+        # Blocks until the lock is taken, or returns False once timeout seconds have passed. Raises a
+        # DeadlockError when the wait for graph picks this thread's transaction as the victim of a cycle.
+        lock_key = self._table.get_lock_key(key)
+        held = self.__get_held()
+        count = held.get(lock_key, 0)
+
+        if count == 0:
+            lock = self._table.get_lock(lock_key)
+
+            if not lock.try_acquire():
+                if self._wait_for_graph is not None:
+                    is_acquired = self._wait_for_graph.wait(
+                        ("lock", lock_key),
+                        lock.acquire,
+                        timeout
+                    )
+                else:
+                    is_acquired = lock.acquire(timeout)
 
-        self._dic[key].acquire()
+                if not is_acquired:
+                    return False
+
+            if self._wait_for_graph is not None:
+                self._wait_for_graph.add_owner(("lock", lock_key))
+
+        held[lock_key] = count + 1
+        return True
+
+    def try_acquire(self, key):
+        return self.acquire(key, 0)
 
     def release(self, key):
-        self._dic[key].release()
+        lock_key = self._table.get_lock_key(key)
+        held = self.__get_held()
+        count = held[lock_key] - 1
+
+        if count == 0:
+            del held[lock_key]
+            if self._wait_for_graph is not None:
+                self._wait_for_graph.remove_owner(("lock", lock_key))
+            self._table.get_lock(lock_key).release()
+        else:
+            held[lock_key] = count
 
-    def clone(self):
+    def clone(self, root_name="root", root=None):
         return self
 
     def commit(self, db):
@@ -0,0 +1,37 @@
+from timeit import default_timer
+import threading
+
+
+class TimedLock:
+    # A mutex whose acquire can give up after a timeout. Python 2's Lock.acquire only takes a blocking flag,
+    # so the timed wait is built on Condition.wait.
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.is_locked = False
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else default_timer() + timeout
+
+        with self.condition:
+            while self.is_locked:
+                if deadline is None:
+                    self.condition.wait()
+                    continue
+
+                remaining = deadline - default_timer()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+
+            self.is_locked = True
+            return True
+
+    def try_acquire(self):
+        return self.acquire(0)
+
+    def release(self):
+        with self.condition:
+            if not self.is_locked:
+                raise Exception("LockNotHeld")
+            self.is_locked = False
+            self.condition.notify()
@@ -0,0 +1,92 @@
+from bisect import bisect_left
+
+
+# A set of lock keys kept in the canonical acquisition order. Keys are (kind, id) tuples such as ("e", 12) or
+# ("uu", 7), which compare natively, so the set never sorts through comparer callbacks. Keys are inserted in
+# place and two sets are compared by walking them side by side.
+class LockSet:
+    def __init__(self, keys=None):
+        self.keys = []
+        self.key_set = set()
+
+        if keys is not None:
+            for key in keys:
+                self.add(key)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __reversed__(self):
+        return reversed(self.keys)
+
+    def __contains__(self, key):
+        return key in self.key_set
+
+    def add(self, key):
+        if key in self.key_set:
+            return False
+
+        self.key_set.add(key)
+        keys = self.keys
+        if len(keys) == 0 or keys[-1] < key:
+            keys.append(key)
+        else:
+            keys.insert(bisect_left(keys, key), key)
+        return True
+
+    def add_kind(self, kind, key_id):
+        return self.add((kind, key_id))
+
+    def contains_all(self, other):
+        if other is None:
+            return True
+
+        key_set = self.key_set
+        for key in other.keys:
+            if key not in key_set:
+                return False
+        return True
+
+    def union(self, other):
+        if other is None or len(other.keys) == 0 or self.contains_all(other):
+            return self
+
+        keys = self.keys
+        other_keys = other.keys
+        result = LockSet()
+        merged = result.keys
+        index = 0
+        other_index = 0
+
+        while index < len(keys) and other_index < len(other_keys):
+            key = keys[index]
+            other_key = other_keys[other_index]
+            if key < other_key:
+                merged.append(key)
+                index += 1
+            elif other_key < key:
+                merged.append(other_key)
+                other_index += 1
+            else:
+                merged.append(key)
+                index += 1
+                other_index += 1
+
+        merged.extend(keys[index:])
+        merged.extend(other_keys[other_index:])
+        result.key_set.update(merged)
+        return result
+
+    def common_prefix_length(self, other):
+        keys = self.keys
+        other_keys = other.keys
+        length = min(len(keys), len(other_keys))
+        index = 0
+
+        while index < length and keys[index] == other_keys[index]:
+            index += 1
+
+        return index
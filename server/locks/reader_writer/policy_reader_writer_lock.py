@@ -0,0 +1,239 @@
+from locks.reader_writer.reader_writer_policy import ReaderWriterPolicy
+from timeit import default_timer
+from collections import deque
+import threading
+
+
+class Waiter:
+    READ = 0
+    UPGRADABLE = 1
+    WRITE = 2
+
+    def __init__(self, mode, lock):
+        self.mode = mode
+        self.granted = False
+        self.condition = threading.Condition(lock)
+
+
+# A reader writer lock guarded by a single mutex. An uncontended acquire or release takes the mutex once and
+# never touches a condition. Blocked threads queue with a condition of their own and are handed the lock by
+# the releasing thread, so a release wakes exactly the threads it lets in.
+#
+# An upgradable reader shares the lock with plain readers but excludes other upgradable readers, so it can
+# turn into the writer with upgrade without deadlocking. A waiting upgrade goes before every queued thread.
+class PolicyReaderWriterLock:
+    def __init__(self, policy=ReaderWriterPolicy.WRITER_PREFERRING):
+        self.policy = policy
+        self.is_fifo = policy is ReaderWriterPolicy.FIFO
+        # Readers wait for queued threads under the fifo and writer preferring policies.
+        self.readers_queue = policy is not ReaderWriterPolicy.READER_PREFERRING
+        self.lock = threading.Lock()
+        self.readers = 0
+        self.writer = False
+        self.upgradable = False
+        self.upgraded = False
+        self.waiting_writers = 0
+        self.waiters = deque()
+        self.upgrade_waiter = None
+
+    def __can_grant(self, mode):
+        if self.writer:
+            return False
+        if mode == Waiter.READ:
+            return True
+        if mode == Waiter.UPGRADABLE:
+            return not self.upgradable
+        return self.readers == 0
+
+    def __can_enter(self, mode):
+        # Whether a thread that just arrived may take the lock ahead of the queued ones.
+        if self.upgrade_waiter is not None and mode != Waiter.READ:
+            return False
+        if self.policy is ReaderWriterPolicy.FIFO:
+            return len(self.waiters) == 0 and self.upgrade_waiter is None and self.__can_grant(mode)
+        if self.policy is ReaderWriterPolicy.WRITER_PREFERRING and mode != Waiter.WRITE:
+            if self.waiting_writers > 0 or self.upgrade_waiter is not None:
+                return False
+        return self.__can_grant(mode)
+
+    def __enter(self, mode):
+        if mode == Waiter.WRITE:
+            self.writer = True
+        else:
+            self.readers += 1
+            if mode == Waiter.UPGRADABLE:
+                self.upgradable = True
+
+    def __wake(self, waiter):
+        waiter.granted = True
+        if waiter.mode == Waiter.WRITE:
+            self.waiting_writers -= 1
+        self.__enter(waiter.mode)
+        waiter.condition.notify()
+
+    def __grant(self):
+        upgrade_waiter = self.upgrade_waiter
+        if upgrade_waiter is not None:
+            if self.readers == 1 and not self.writer:
+                self.upgrade_waiter = None
+                self.readers = 0
+                self.writer = True
+                self.upgraded = True
+                upgrade_waiter.granted = True
+                upgrade_waiter.condition.notify()
+            return
+
+        waiters = self.waiters
+
+        if self.policy is ReaderWriterPolicy.FIFO:
+            while len(waiters) > 0 and self.__can_grant(waiters[0].mode):
+                self.__wake(waiters.popleft())
+            return
+
+        if self.policy is ReaderWriterPolicy.WRITER_PREFERRING and self.waiting_writers > 0:
+            if self.__can_grant(Waiter.WRITE):
+                for waiter in waiters:
+                    if waiter.mode == Waiter.WRITE:
+                        waiters.remove(waiter)
+                        self.__wake(waiter)
+                        break
+            return
+
+        # Let every reader in, then the first writer once nobody reads any more.
+        for waiter in list(waiters):
+            if waiter.mode != Waiter.WRITE and self.__can_grant(waiter.mode):
+                waiters.remove(waiter)
+                self.__wake(waiter)
+
+        if self.waiting_writers > 0 and self.__can_grant(Waiter.WRITE):
+            for waiter in waiters:
+                if waiter.mode == Waiter.WRITE:
+                    waiters.remove(waiter)
+                    self.__wake(waiter)
+                    break
+
+    @staticmethod
+    def __wait(waiter, timeout):
+        if timeout is None:
+            while not waiter.granted:
+                waiter.condition.wait()
+            return True
+
+        deadline = default_timer() + timeout
+        while not waiter.granted:
+            remaining = deadline - default_timer()
+            if remaining <= 0:
+                return False
+            waiter.condition.wait(remaining)
+        return True
+
+    def __acquire(self, mode, timeout):
+        with self.lock:
+            if self.__can_enter(mode):
+                self.__enter(mode)
+                return True
+
+            if timeout is not None and timeout <= 0:
+                return False
+
+            waiter = Waiter(mode, self.lock)
+            self.waiters.append(waiter)
+            if mode == Waiter.WRITE:
+                self.waiting_writers += 1
+
+            if PolicyReaderWriterLock.__wait(waiter, timeout):
+                return True
+
+            self.waiters.remove(waiter)
+            if mode == Waiter.WRITE:
+                self.waiting_writers -= 1
+            # A writer giving up can let the readers queued behind it in.
+            self.__grant()
+            return False
+
+    def acquire_read(self, timeout=None):
+        with self.lock:
+            if not self.writer and self.upgrade_waiter is None and (
+                    len(self.waiters) == 0 if self.is_fifo else not self.readers_queue or self.waiting_writers == 0):
+                self.readers += 1
+                return True
+        return self.__acquire(Waiter.READ, timeout)
+
+    def acquire_upgradable(self, timeout=None):
+        return self.__acquire(Waiter.UPGRADABLE, timeout)
+
+    def acquire_write(self, timeout=None):
+        with self.lock:
+            if not self.writer and self.readers == 0 and self.upgrade_waiter is None and len(self.waiters) == 0:
+                self.writer = True
+                return True
+        return self.__acquire(Waiter.WRITE, timeout)
+
+    def try_acquire_read(self):
+        return self.acquire_read(0)
+
+    def try_acquire_upgradable(self):
+        return self.acquire_upgradable(0)
+
+    def try_acquire_write(self):
+        return self.acquire_write(0)
+
+    def upgrade(self, timeout=None):
+        with self.lock:
+            if not self.upgradable or self.upgraded:
+                raise Exception("NotUpgradable")
+
+            if self.readers == 1:
+                self.readers = 0
+                self.writer = True
+                self.upgraded = True
+                return True
+
+            if timeout is not None and timeout <= 0:
+                return False
+
+            waiter = Waiter(Waiter.WRITE, self.lock)
+            self.upgrade_waiter = waiter
+
+            if PolicyReaderWriterLock.__wait(waiter, timeout):
+                return True
+
+            self.upgrade_waiter = None
+            self.__grant()
+            return False
+
+    def downgrade(self):
+        with self.lock:
+            if not self.upgraded:
+                raise Exception("NotUpgraded")
+            self.writer = False
+            self.upgraded = False
+            self.readers = 1
+            self.__grant()
+
+    def release_read(self):
+        with self.lock:
+            self.readers -= 1
+            if self.readers <= 1 and (len(self.waiters) > 0 or self.upgrade_waiter is not None):
+                self.__grant()
+
+    def release_upgradable(self):
+        with self.lock:
+            self.readers -= 1
+            self.upgradable = False
+            if len(self.waiters) > 0:
+                self.__grant()
+
+    def release_write(self):
+        # Releasing an upgraded lock gives up the upgradable read as well.
+        with self.lock:
+            self.writer = False
+            if self.upgraded:
+                self.upgraded = False
+                self.upgradable = False
+            if len(self.waiters) > 0:
+                self.__grant()
+
+    def get_state(self):
+        with self.lock:
+            return self.writer, len(self.waiters), self.readers
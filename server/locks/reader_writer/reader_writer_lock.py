@@ -1,3 +1,5 @@
+from locks.lock.timed_lock import TimedLock
+from timeit import default_timer
 import threading
 
 
@@ -7,7 +9,7 @@ class ReaderWriterLock:
     def __init__(self):
         self.lock = threading.Lock()
 
-        self.active_writer_lock = threading.Lock()
+        self.active_writer_lock = TimedLock()
         # The total number of writers including the active writer and
         # those blocking on active_writer_lock or readers_finished_cond.
         self.writer_count = 0
@@ -52,24 +54,41 @@ class ReaderWriterLock:
             self.active_readers = set()
             self.active_writer = None
 
-    def acquire_read(self):
+    def acquire_read(self, timeout=None):
         with self.lock:
             if self.DEBUG:
                 me = threading.currentThread()
                 assert me not in self.active_readers, 'This thread has already acquired read access and this lock isn\'t reader-reentrant!'
                 assert me != self.active_writer, 'This thread already has write access, release that before acquiring read access!'
-                self.active_readers.add(me)
             if self.writer_count:
+                deadline = None if timeout is None else default_timer() + timeout
                 self.waiting_reader_count += 1
-                self.writers_finished_cond.wait()
                 # Even if the last writer thread notifies us it can happen that a new
                 # incoming writer thread acquires the lock earlier than this reader
                 # thread so we test for the writer_count after each wait()...
                 # We also protect ourselves from spurious wakeups that happen with some POSIX libraries.
                 while self.writer_count:
-                    self.writers_finished_cond.wait()
+                    if not ReaderWriterLock.wait(self.writers_finished_cond, deadline):
+                        self.waiting_reader_count -= 1
+                        return False
                 self.waiting_reader_count -= 1
+            if self.DEBUG:
+                self.active_readers.add(me)
             self.active_reader_count += 1
+            return True
+
+    @staticmethod
+    def wait(condition, deadline):
+        if deadline is None:
+            condition.wait()
+            return True
+
+        remaining = deadline - default_timer()
+        if remaining <= 0:
+            return False
+
+        condition.wait(remaining)
+        return True
 
     def release_read(self):
         with self.lock:
@@ -82,21 +101,39 @@ class ReaderWriterLock:
             if not self.active_reader_count and self.writer_count:
                 self.readers_finished_cond.notifyAll()
 
-    def acquire_write(self):
+    def acquire_write(self, timeout=None):
+        deadline = None if timeout is None else default_timer() + timeout
+
         with self.lock:
             if self.DEBUG:
                 me = threading.currentThread()
                 assert me not in self.active_readers, 'This thread already has read access - release that before acquiring write access!'
                 assert me != self.active_writer, 'This thread already has write access and this lock isn\'t writer-reentrant!'
             self.writer_count += 1
-            if self.active_reader_count:
-                self.readers_finished_cond.wait()
-                while self.active_reader_count:
-                    self.readers_finished_cond.wait()
+            while self.active_reader_count:
+                if not ReaderWriterLock.wait(self.readers_finished_cond, deadline):
+                    self.__cancel_write()
+                    return False
+
+        if not self.active_writer_lock.acquire(None if deadline is None else max(deadline - default_timer(), 0.0)):
+            with self.lock:
+                self.__cancel_write()
+            return False
 
-        self.active_writer_lock.acquire()
         if self.DEBUG:
             self.active_writer = me
+        return True
+
+    def __cancel_write(self):
+        self.writer_count -= 1
+        if not self.writer_count and self.waiting_reader_count:
+            self.writers_finished_cond.notifyAll()
+
+    def try_acquire_read(self):
+        return self.acquire_read(0)
+
+    def try_acquire_write(self):
+        return self.acquire_write(0)
 
     def release_write(self):
         if not self.DEBUG:
@@ -1,13 +1,29 @@
-from locks.thread_safe_dic import ThreadSafeDic
+from locks.striped_lock_table import StripedLockTable
 from read_enter import ReadEnter
 from write_enter import WriteEnter
 from reader_writer_lock import ReaderWriterLock
 from transactional_data_structures.transactional import Transactional
+import threading
 
 
 class ReaderWriterLockDic(Transactional):
-    def __init__(self):
-        self._dic = ThreadSafeDic()
+    def __init__(self, stripe_count=None, hot_keys=None, wait_for_graph=None, lock_class=None):
+        # lock_class builds the stripe locks, e.g. lambda: PolicyReaderWriterLock(ReaderWriterPolicy.FIFO).
+        self._table = StripedLockTable(
+            ReaderWriterLock if lock_class is None else lock_class,
+            stripe_count,
+            hot_keys
+        )
+        self._wait_for_graph = wait_for_graph
+        # Per thread [is_writer, count] of every held lock, since two keys held by one thread can share a
+        # stripe. A thread holding a stripe for writing may also read it.
+        self._held = threading.local()
+
+    def __get_held(self):
+        held = getattr(self._held, "counts", None)
+        if held is None:
+            held = self._held.counts = {}
+        return held
 
     def read_enter(self, key):
         return ReadEnter(self, key)
@@ -15,28 +31,79 @@ class ReaderWriterLockDic(Transactional):
     def write_enter(self, key):
         return WriteEnter(self, key)
 
-    def acquire_read(self, key):
-        if key not in self._dic:
-            with self._dic as dic:
-                dic[key] = ReaderWriterLock()
+    def get_lock_key(self, key):
+        return self._table.get_lock_key(key)
 
-        dic[key].acquire_read()
+    def add_hot_key(self, key):
+        self._table.add_hot_key(key)
 
-    def release_read(self, key):
-        self._dic[key].release_read()
+    def __acquire(self, lock_key, is_writer, timeout):
+        lock = self._table.get_lock(lock_key)
+        acquire = lock.acquire_write if is_writer else lock.acquire_read
+
+        if not acquire(0):
+            if self._wait_for_graph is not None:
+                if not self._wait_for_graph.wait(("reader_writer", lock_key), acquire, timeout):
+                    return False
+            elif not acquire(timeout):
+                return False
+
+        if self._wait_for_graph is not None:
+            self._wait_for_graph.add_owner(("reader_writer", lock_key))
+
+        self.__get_held()[lock_key] = [is_writer, 1]
+        return True
+
+    def acquire_read(self, key, timeout=None):
+        lock_key = self._table.get_lock_key(key)
+        hold = self.__get_held().get(lock_key)
+
+        if hold is None:
+            return self.__acquire(lock_key, False, timeout)
+
+        hold[1] += 1
+        return True
 
-    def acquire_write(self, key):
-        if key not in self._dic:
-            with self._dic as dic:
-                if key not in dic:
-                    dic[key] = ReaderWriterLock()
+    def acquire_write(self, key, timeout=None):
+        lock_key = self._table.get_lock_key(key)
+        hold = self.__get_held().get(lock_key)
 
-        self._dic[key].acquire_write()
+        if hold is None:
+            return self.__acquire(lock_key, True, timeout)
+        elif not hold[0]:
+            raise Exception("LockUpgrade")
+
+        hold[1] += 1
+        return True
+
+    def try_acquire_read(self, key):
+        return self.acquire_read(key, 0)
+
+    def try_acquire_write(self, key):
+        return self.acquire_write(key, 0)
+
+    def release_read(self, key):
+        self.__release(key)
 
     def release_write(self, key):
-        self._dic[key].release_write()
+        self.__release(key)
+
+    def __release(self, key):
+        lock_key = self._table.get_lock_key(key)
+        held = self.__get_held()
+        hold = held[lock_key]
+        hold[1] -= 1
+
+        if hold[1] == 0:
+            del held[lock_key]
+            if self._wait_for_graph is not None:
+                self._wait_for_graph.remove_owner(("reader_writer", lock_key))
+            if hold[0]:
+                self._table.get_lock(lock_key).release_write()
+            else:
+                self._table.get_lock(lock_key).release_read()
 
-    def clone(self):
+    def clone(self, root_name="root", root=None):
         return self
 
     def commit(self, db):
@@ -0,0 +1,7 @@
+from enum import Enum
+
+
+class ReaderWriterPolicy(Enum):
+    WRITER_PREFERRING = 0
+    READER_PREFERRING = 1
+    FIFO = 2
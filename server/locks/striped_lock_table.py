@@ -0,0 +1,77 @@
+from zlib import crc32
+import numbers
+import threading
+
+
+# A bounded table of locks. Every lock kind ("e", "uu", ...) gets stripe_count locks and each key maps to one
+# of them, so the table no longer grows with the number of users and equities. Keys mapped to the same stripe
+# share its lock. Hot keys, which are configured before the table is used, get a lock of their own.
+#
+# get_lock_key returns the key of the lock guarding a key: the key itself for hot keys, otherwise
+# (kind, -1 - stripe). Ids are never negative, so stripe keys sort with the (kind, id) keys of their kind
+# and callers can order and deduplicate them like any other lock key.
+class StripedLockTable:
+    DEFAULT_STRIPE_COUNT = 256
+
+    def __init__(self, lock_class, stripe_count=None, hot_keys=None):
+        self.lock_class = lock_class
+        self.stripe_count = StripedLockTable.DEFAULT_STRIPE_COUNT if stripe_count is None else stripe_count
+        self.stripes = {}
+        self.stripes_lock = threading.Lock()
+        self.hot_locks = {}
+
+        if hot_keys is not None:
+            for key in hot_keys:
+                self.hot_locks[key] = lock_class()
+
+    @staticmethod
+    def get_kind(key):
+        # String keys follow the "uu" + user_id convention, a kind of at most two letters before the id.
+        index = 0
+        while index < len(key) and index < 2 and key[index].isalpha():
+            index += 1
+        return key[:index]
+
+    @staticmethod
+    def get_hash(key):
+        return crc32(repr(key).encode("utf-8")) & 0xffffffff
+
+    def add_hot_key(self, key):
+        hot_locks = dict(self.hot_locks)
+        hot_locks[key] = self.lock_class()
+        self.hot_locks = hot_locks
+
+    def get_lock_key(self, key):
+        if key in self.hot_locks:
+            return key
+
+        if isinstance(key, tuple):
+            (kind, key_id) = key
+            if isinstance(key_id, numbers.Integral):
+                if key_id < 0:
+                    return key
+                return kind, -1 - key_id % self.stripe_count
+        else:
+            kind = StripedLockTable.get_kind(key)
+
+        return kind, -1 - StripedLockTable.get_hash(key) % self.stripe_count
+
+    def get_lock(self, lock_key):
+        lock = self.hot_locks.get(lock_key)
+        if lock is not None:
+            return lock
+
+        (kind, stripe) = lock_key
+        stripes = self.stripes.get(kind)
+
+        if stripes is None:
+            with self.stripes_lock:
+                stripes = self.stripes.get(kind)
+                if stripes is None:
+                    stripes = [self.lock_class() for i in range(self.stripe_count)]
+                    self.stripes[kind] = stripes
+
+        return stripes[-1 - stripe]
+
+    def get_lock_count(self):
+        return len(self.hot_locks) + len(self.stripes) * self.stripe_count
@@ -0,0 +1,153 @@
+from locks.deadlock_error import DeadlockError
+from timeit import default_timer
+import itertools
+import threading
+
+
+class Transaction:
+    def __init__(self, sequence):
+        self.sequence = sequence
+
+
+class WaitStats:
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.timeouts = 0
+        self.deadlocks = 0
+
+    def record(self, elapsed, is_timeout, is_deadlock):
+        self.count += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+        if is_timeout:
+            self.timeouts += 1
+        if is_deadlock:
+            self.deadlocks += 1
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "total_time": self.total_time,
+            "max_time": self.max_time,
+            "timeouts": self.timeouts,
+            "deadlocks": self.deadlocks
+        }
+
+
+# Tracks which transaction holds and which waits for every lock of the lock dictionaries sharing it. Owners are
+# recorded without a lock, only a thread that has to wait takes the graph lock. A waiter wakes up every
+# CHECK_INTERVAL seconds and looks for a cycle through itself. The youngest transaction of a cycle is aborted
+# with a DeadlockError, the others keep waiting for it to let go.
+class WaitForGraph:
+    CHECK_INTERVAL = 0.05
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.sequences = itertools.count()
+        self.owners = {}
+        self.waits_for = {}
+        self.stats = {}
+
+    def begin_transaction(self):
+        transaction = Transaction(next(self.sequences))
+        self.local.transaction = transaction
+        return transaction
+
+    def end_transaction(self):
+        self.local.transaction = None
+
+    def get_transaction(self):
+        transaction = getattr(self.local, "transaction", None)
+        if transaction is None:
+            transaction = self.begin_transaction()
+        return transaction
+
+    def add_owner(self, resource):
+        owners = self.owners.get(resource)
+        if owners is None:
+            owners = self.owners.setdefault(resource, set())
+        owners.add(self.get_transaction())
+
+    def remove_owner(self, resource):
+        self.owners[resource].discard(self.get_transaction())
+
+    def wait(self, resource, try_acquire, timeout=None):
+        transaction = self.get_transaction()
+        start = default_timer()
+        is_acquired = False
+        is_deadlock = False
+
+        self.waits_for[transaction] = resource
+        try:
+            while True:
+                wait_time = WaitForGraph.CHECK_INTERVAL
+                if timeout is not None:
+                    wait_time = min(wait_time, max(start + timeout - default_timer(), 0.0))
+
+                if try_acquire(wait_time):
+                    is_acquired = True
+                    break
+
+                if timeout is not None and default_timer() - start >= timeout:
+                    break
+
+                if self.get_victim(transaction) is transaction:
+                    is_deadlock = True
+                    raise DeadlockError(resource)
+        finally:
+            del self.waits_for[transaction]
+
+            with self.lock:
+                if resource not in self.stats:
+                    self.stats[resource] = WaitStats()
+                self.stats[resource].record(default_timer() - start, not is_acquired and not is_deadlock, is_deadlock)
+
+        return is_acquired
+
+    def __get_blockers(self, transaction):
+        resource = self.waits_for.get(transaction)
+        if resource is None:
+            return ()
+        return tuple(owner for owner in tuple(self.owners.get(resource, ())) if owner is not transaction)
+
+    def get_cycle(self, transaction):
+        with self.lock:
+            path = [transaction]
+            visited = set(path)
+            stack = [iter(self.__get_blockers(transaction))]
+
+            while len(stack) > 0:
+                blocker = next(stack[-1], None)
+
+                if blocker is None:
+                    stack.pop()
+                    path.pop()
+                elif blocker is transaction:
+                    return path
+                elif blocker not in visited:
+                    visited.add(blocker)
+                    path.append(blocker)
+                    stack.append(iter(self.__get_blockers(blocker)))
+
+            return None
+
+    def get_victim(self, transaction):
+        cycle = self.get_cycle(transaction)
+        if cycle is None:
+            return None
+        return max(cycle, key=lambda cycle_transaction: cycle_transaction.sequence)
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {}
+
+    def get_stats(self):
+        with self.lock:
+            result = {}
+            for resource in self.stats:
+                result[resource] = self.stats[resource].snapshot()
+            return result
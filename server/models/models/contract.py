@@ -50,5 +50,13 @@ class Contract(db.Model):
     def modified_id_comparer(item1, item2):
         return 1 if item1.modified_id < item2.modified_id else -1 if item1.modified_id > item2.modified_id else 0
 
+    @staticmethod
+    def id_key(item):
+        return item.contract_id
+
+    @staticmethod
+    def modified_id_key(item):
+        return item.modified_id
+
 
 db.Index('ix_contract_user_id_equity_id', Contract.user_id, Contract.equity_id, Contract.contract_id)
\ No newline at end of file
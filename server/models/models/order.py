@@ -114,6 +114,10 @@ class Order(db.Model):
         self.trailing_price = ((10000.0 + ((1 if self.is_long else -1) * self.trailing_stop_percent)) / 10000.0)
         self.effective_price = self.trailing_price
 
+    @staticmethod
+    def open_quantity(item):
+        return item.quantity - item.filled_quantity
+
     @staticmethod
     def price_comparer(item1, item2):
         comp = -1 if item1.price > item2.price else 1 if item1.price < item2.price else 0
@@ -130,6 +134,14 @@ class Order(db.Model):
 
         return -1 if item1.order_id > item2.order_id else 1 if item1.order_id < item2.order_id else 0
 
+    @staticmethod
+    def price_key(item):
+        return item.price, item.order_id
+
+    @staticmethod
+    def price_key_dec(item):
+        return -item.price, item.order_id
+
     @staticmethod
     def trigger_price_comparer(item1, item2):
         comp = -1 if item1.trigger_price > item2.trigger_price else 1 if item1.trigger_price < item2.trigger_price else 0
@@ -146,6 +158,14 @@ class Order(db.Model):
 
         return -1 if item1.order_id > item2.order_id else 1 if item1.order_id < item2.order_id else 0
 
+    @staticmethod
+    def trigger_price_key(item):
+        return item.trigger_price, item.order_id
+
+    @staticmethod
+    def trigger_price_key_dec(item):
+        return -item.trigger_price, item.order_id
+
     @staticmethod
     def trailing_price_comparer(item1, item2):
         comp = -1 if item1.trailing_price > item2.trailing_price else 1 if item1.trailing_price < item2.trailing_price else 0
@@ -162,6 +182,14 @@ class Order(db.Model):
 
         return -1 if item1.order_id > item2.order_id else 1 if item1.order_id < item2.order_id else 0
 
+    @staticmethod
+    def trailing_price_key(item):
+        return item.trailing_price, item.order_id
+
+    @staticmethod
+    def trailing_price_key_dec(item):
+        return -item.trailing_price, item.order_id
+
     @staticmethod
     def trailing_price_max_comparer(item1, item2):
         comp = -1 if item1.trailing_price_max > item2.trailing_price_max else 1 if item1.trailing_price_max < item2.trailing_price_max else 0
@@ -178,6 +206,26 @@ class Order(db.Model):
 
         return -1 if item1.order_id > item2.order_id else 1 if item1.order_id < item2.order_id else 0
 
+    @staticmethod
+    def trailing_price_max_key(item):
+        return item.trailing_price_max, item.order_id
+
+    @staticmethod
+    def trailing_price_max_key_dec(item):
+        return -item.trailing_price_max, item.order_id
+
+    @staticmethod
+    def trailing_bucket_comparer(item1, item2):
+        comp = -1 if item1.trailing_stop_percent > item2.trailing_stop_percent else 1 if item1.trailing_stop_percent < item2.trailing_stop_percent else 0
+        if comp != 0:
+            return comp
+
+        return -1 if item1.order_id > item2.order_id else 1 if item1.order_id < item2.order_id else 0
+
+    @staticmethod
+    def trailing_bucket_key(item):
+        return item.trailing_stop_percent, item.order_id
+
     @staticmethod
     def effective_price_comparer(item1, item2):
         comp = -1 if item1.effective_price > item2.effective_price else 1 if item1.effective_price < item2.effective_price else 0
@@ -194,6 +242,14 @@ class Order(db.Model):
 
         return -1 if item1.order_id > item2.order_id else 1 if item1.order_id < item2.order_id else 0
 
+    @staticmethod
+    def effective_price_key(item):
+        return item.effective_price, item.order_id
+
+    @staticmethod
+    def effective_price_key_dec(item):
+        return -item.effective_price, item.order_id
+
     @staticmethod
     def id_comparer(item1, item2):
         return 1 if item1.order_id < item2.order_id else -1 if item1.order_id > item2.order_id else 0
@@ -202,6 +258,14 @@ class Order(db.Model):
     def modification_id_comparer(item1, item2):
         return 1 if item1.modification_id < item2.modification_id else -1 if item1.modification_id > item2.modification_id else 0
 
+    @staticmethod
+    def id_key(item):
+        return item.order_id
+
+    @staticmethod
+    def modification_id_key(item):
+        return item.modification_id
+
     @staticmethod
     def is_opened_long_limit(item):
         return item.is_opened() and item.is_limit() and item.is_long
@@ -236,27 +300,37 @@ class Order(db.Model):
         self.price = self.trigger_limit_price
         self.order_type = OrderType.MARKET if self.price < 0 else OrderType.LIMIT
 
+    @staticmethod
+    def get_trailing_stop(is_long, trailing_stop_percent, mark):
+        tsp = trailing_stop_percent if is_long else -trailing_stop_percent
+        pm = Equity.PERCENT_MULTIPLIER
+
+        return ((pm + tsp) / (pm + 0.0)) * mark
+
     def set_trailing_price(self, equity):
-        self.trailing_price_max = equity.current_price
+        self.set_trailing_mark(equity.current_price)
+
+    def set_trailing_mark(self, mark):
+        self.trailing_price_max = mark
 
         tsp = self.trailing_stop_percent if self.is_long else -self.trailing_stop_percent
         pm = Equity.PERCENT_MULTIPLIER
 
-        float_price = ((pm + tsp) / (pm + 0.0)) * equity.current_price
+        float_price = ((pm + tsp) / (pm + 0.0)) * mark
 
         if self.is_long:
             self.trailing_price = math.floor(float_price)
         else:
             self.trailing_price = math.ceil(float_price)
 
-        self.trailing_price = ((pm + tsp) / (pm + 0.0)) * equity.current_price
+        self.trailing_price = Order.get_trailing_stop(self.is_long, self.trailing_stop_percent, mark)
 
         if self.has_trailing_limit:
             tslp = self.trailing_stop_limit_percent if self.is_long else -self.trailing_stop_limit_percent
 
             pm = Equity.PERCENT_MULTIPLIER
 
-            float_price = ((pm + tslp) / (pm + 0.0)) * equity.current_price
+            float_price = ((pm + tslp) / (pm + 0.0)) * mark
 
             if self.is_long:
                 self.trailing_price_limit = math.ceil(float_price)
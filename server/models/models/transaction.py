@@ -16,6 +16,10 @@ class Transaction(db.Model):
     def id_comparer(item1, item2):
         return 1 if item1.transaction_id < item2.transaction_id else -1 if item1.transaction_id > item2.transaction_id else 0
 
+    @staticmethod
+    def id_key(item):
+        return item.transaction_id
+
     def clone(self):
         return copy.copy(self)
 
@@ -0,0 +1,173 @@
+from trade_engine.group_commit.change_set import ChangeSet
+from timeit import default_timer
+from zlib import crc32
+import threading
+import pickle
+import struct
+import os
+
+
+class ModelValue:
+    # Journaled stand in for a model argument, the model is rebuilt from its column values on replay.
+    def __init__(self, model_class, values):
+        self.model_class = model_class
+        self.values = values
+
+
+# Append only journal of the commands the engine accepted, in the order it committed them. Every record is
+# "<length, sequence, crc32>" followed by the pickled command. Records go through a buffered file and are
+# fsynced in batches: after fsync_batch_size records, or fsync_delay seconds after the first unsynced one.
+class CommandJournal:
+    HEADER = struct.Struct("<IQI")
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self, path, fsync_batch_size=64, fsync_delay=0.005):
+        self.path = path
+        self.fsync_batch_size = fsync_batch_size
+        self.fsync_delay = fsync_delay
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.unsynced = 0
+        self.synced_sequence = 0
+        self.running = True
+
+        self.sequence = CommandJournal.recover(path)
+        self.synced_sequence = self.sequence
+        self.file = open(path, "ab", CommandJournal.BUFFER_SIZE)
+
+        self.thread = threading.Thread(target=self.run, name="command_journal")
+        self.thread.daemon = True
+        self.thread.start()
+
+    @staticmethod
+    def encode_arg(arg):
+        if hasattr(arg, "__table__"):
+            return ModelValue(arg.__class__, ChangeSet.get_values(arg))
+        return arg
+
+    @staticmethod
+    def decode_arg(arg):
+        if isinstance(arg, ModelValue):
+            return ChangeSet.build_item(arg.model_class, arg.values)
+        return arg
+
+    @staticmethod
+    def read_records(path):
+        # Yields (offset, sequence, func, args, kwargs) for every valid record and stops at the first torn or
+        # corrupt one.
+        if not os.path.exists(path):
+            return
+
+        with open(path, "rb") as journal_file:
+            offset = 0
+            while True:
+                header = journal_file.read(CommandJournal.HEADER.size)
+                if len(header) < CommandJournal.HEADER.size:
+                    return
+
+                (length, sequence, checksum) = CommandJournal.HEADER.unpack(header)
+                payload = journal_file.read(length)
+                if len(payload) < length or crc32(payload) & 0xffffffff != checksum:
+                    return
+
+                (func, args, kwargs) = pickle.loads(payload)
+                offset += CommandJournal.HEADER.size + length
+                yield (
+                    offset,
+                    sequence,
+                    func,
+                    tuple(CommandJournal.decode_arg(arg) for arg in args),
+                    dict((name, CommandJournal.decode_arg(kwargs[name])) for name in kwargs)
+                )
+
+    @staticmethod
+    def recover(path):
+        # Cuts a torn tail left by a crash and returns the last sequence number written.
+        end = 0
+        sequence = 0
+
+        for (offset, sequence, func, args, kwargs) in CommandJournal.read_records(path):
+            end = offset
+
+        if os.path.exists(path) and os.path.getsize(path) != end:
+            with open(path, "r+b") as journal_file:
+                journal_file.truncate(end)
+
+        return sequence
+
+    @staticmethod
+    def encode(func, args, kwargs=None):
+        # The command runs on the models it is given and changes them, it fills and closes an order in place. Its
+        # record is encoded before it runs, so replay gets the arguments the command was called with.
+        return pickle.dumps(
+            (
+                func,
+                tuple(CommandJournal.encode_arg(arg) for arg in args),
+                {} if kwargs is None else dict((name, CommandJournal.encode_arg(kwargs[name])) for name in kwargs)
+            ),
+            pickle.HIGHEST_PROTOCOL
+        )
+
+    def append(self, payload):
+        with self.lock:
+            if not self.running:
+                raise Exception("CommandJournalClosed")
+
+            self.sequence += 1
+            self.file.write(CommandJournal.HEADER.pack(len(payload), self.sequence, crc32(payload) & 0xffffffff))
+            self.file.write(payload)
+
+            self.unsynced += 1
+            if self.unsynced >= self.fsync_batch_size:
+                self.__sync()
+            elif self.unsynced == 1:
+                self.condition.notify()
+
+            return self.sequence
+
+    def __sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.synced_sequence = self.sequence
+        self.condition.notify_all()
+
+    def sync(self):
+        with self.lock:
+            if self.unsynced > 0:
+                self.__sync()
+
+    def wait_synced(self, sequence, timeout=None):
+        deadline = None if timeout is None else default_timer() + timeout
+
+        with self.lock:
+            while self.synced_sequence < sequence:
+                if deadline is None:
+                    self.condition.wait()
+                else:
+                    remaining = deadline - default_timer()
+                    if remaining <= 0:
+                        return False
+                    self.condition.wait(remaining)
+            return True
+
+    def run(self):
+        with self.lock:
+            while self.running:
+                if self.unsynced == 0:
+                    self.condition.wait()
+                    continue
+
+                self.condition.wait(self.fsync_delay)
+                if self.unsynced > 0:
+                    self.__sync()
+
+    def close(self):
+        with self.lock:
+            self.running = False
+            if self.unsynced > 0:
+                self.__sync()
+            self.condition.notify_all()
+
+        self.thread.join()
+        self.file.close()
@@ -0,0 +1,33 @@
+from trade_engine.command_journal.command_journal import CommandJournal
+import sys
+
+
+# Rebuilds the engine by running the journaled commands again, one at a time and in sequence order, so the
+# engine hands out the same ids and reaches the same state. Commands up to after_sequence are skipped, they
+# are already part of the state the engine was loaded from.
+def replay_journal(trade_engine, path, after_sequence=0):
+    last_sequence = after_sequence
+
+    for (offset, sequence, func, args, kwargs) in CommandJournal.read_records(path):
+        if sequence <= after_sequence:
+            continue
+
+        if sequence != last_sequence + 1:
+            raise Exception("JournalGap")
+
+        trade_engine.execute_func(None, func, *args, **kwargs)
+        last_sequence = sequence
+
+    return last_sequence
+
+
+if __name__ == "__main__":
+    # python -m trade_engine.command_journal.replay_journal <journal path> [after sequence]
+    from trade_engine.trade_engine import trade_engine
+
+    replayed_sequence = replay_journal(
+        trade_engine,
+        sys.argv[1],
+        int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    )
+    sys.stdout.write("Replayed up to sequence " + str(replayed_sequence) + "\n")
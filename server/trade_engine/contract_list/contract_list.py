@@ -1,14 +1,19 @@
-from transactional_data_structures.transactional import Transactional
+from transactional_data_structures.transactional import Transactional, transactional
+from transactional_data_structures.events import Events
 from transactional_data_structures.dictionary_array_version import DictionaryArrayVersion
 from transactional_data_structures.dictionary_auto_incrementer_version import DictionaryAutoIncrementerVersion
 from indices.open_contracts import OpenContracts
 from indices.contracts_modified import ContractsModified
 from models.models.contract import Contract
+from models.models.order import Order
 from models.models.user import User
 from models.models.contract_id import ContractId
 import random
 
+MAKE_CONTRACT = Events.get_event_id("make_contract")
 
+
+@transactional("contracts", "contracts_id", "open_contracts", "contracts_modified")
 class ContractList(Transactional):
     def __init__(self):
         pass
@@ -21,7 +26,8 @@ class ContractList(Transactional):
             Contract.id_comparer,
             "equity_id",
             model_name="contracts",
-            events=self.trade_engine.events
+            events=self.trade_engine.events,
+            key=Contract.id_key
         )
 
         self.contracts_id = DictionaryAutoIncrementerVersion(
@@ -42,8 +48,12 @@ class ContractList(Transactional):
     def get_contracts(self, contract):
         return self.contracts.get_list(contract)
 
+    def clone_init(self):
+        self.subscribe_to_events(self.trade_engine.events)
+
     def subscribe_to_events(self, events):
         events.subscribe("match_orders", self.match_orders)
+        events.subscribe("sweep_orders", self.sweep_orders)
         events.subscribe("insolvent_margin_call", self.insolvent_margin_call)
 
     def initialize(self):
@@ -52,8 +62,14 @@ class ContractList(Transactional):
     def get_next_id(self, contract):
         self.transactions_id.get_next_id(contract)
 
-    def match_orders(self, order, matched_order):
-        quantity = min(order.remaining_quantity(), matched_order.remaining_quantity())
+    def match_orders(self, order, matched_order, is_margin_call=False):
+        self.make_contracts(order, matched_order, min(Order.open_quantity(order), Order.open_quantity(matched_order)))
+
+    def sweep_orders(self, order, fills, is_margin_call=False):
+        for (matched_order, quantity) in fills:
+            self.make_contracts(order, matched_order, quantity)
+
+    def make_contracts(self, order, matched_order, quantity):
         price = matched_order.price
 
         new_order = order.clone()
@@ -65,8 +81,8 @@ class ContractList(Transactional):
         new_matched_order.quantity = quantity
         new_matched_order.price = price
 
-        self.trade_engine.trigger("make_contract", new_order, False)
-        self.trade_engine.trigger("make_contract", new_matched_order, True)
+        self.trade_engine.events.trigger_id(MAKE_CONTRACT, new_order, False)
+        self.trade_engine.events.trigger_id(MAKE_CONTRACT, new_matched_order, True)
 
     def insolvent_margin_call(self, equity, insolvent_contract, balance, user_balance_updates):
         contracts = self.get_contracts(equity)
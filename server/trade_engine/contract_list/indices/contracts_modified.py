@@ -1,8 +1,9 @@
-from transactional_data_structures.transactional import Transactional
+from transactional_data_structures.transactional import Transactional, transactional
 from transactional_data_structures.dictionary_array_version import DictionaryArrayVersion
 from models.models.contract import Contract
 
 
+@transactional("contracts")
 class ContractsModified(Transactional):
     def __init__(self):
         pass
@@ -15,5 +16,6 @@ class ContractsModified(Transactional):
             Contract.modified_id_comparer,
             "equity_id",
             model_name="contracts",
-            events=self.trade_engine.events
+            events=self.trade_engine.events,
+            key=Contract.modified_id_key
         )
@@ -1,8 +1,9 @@
-from transactional_data_structures.transactional import Transactional
+from transactional_data_structures.transactional import Transactional, transactional
 from transactional_data_structures.dictionary_array_version import DictionaryArrayVersion
 from models.models.contract import Contract
 
 
+@transactional("contracts")
 class OpenContracts(Transactional):
     def __init__(self):
         pass
@@ -16,5 +17,6 @@ class OpenContracts(Transactional):
             "equity_id",
             is_in_list=Contract.is_opened,
             model_name="contracts",
-            events=self.trade_engine.events
+            events=self.trade_engine.events,
+            key=Contract.id_key
         )
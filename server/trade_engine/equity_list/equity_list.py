@@ -1,10 +1,15 @@
-from transactional_data_structures.transactional import Transactional
+from transactional_data_structures.transactional import Transactional, transactional
 from transactional_data_structures.events import EventReturnType, Events
 from transactional_data_structures.dictionary_version import DictionaryVersion
 
 from transactional_data_structures.events import EventPriority
 
+EQUITIES_UPDATE_ITEM = Events.get_event_id("equities_update_item")
+SET_EQUITY_PRICE = Events.get_event_id("set_equity_price")
+CHECK_MARGINS = Events.get_event_id("check_margins")
 
+
+@transactional("equities")
 class EquityList(Transactional):
     def __init__(self):
         pass
@@ -18,18 +23,26 @@ class EquityList(Transactional):
     def get_equity(self, equity):
         return self.equities.get_item(equity)
 
+    def clone_init(self):
+        self.subscribe_to_events(self.trade_engine.events)
+
     def subscribe_to_events(self, events):
         events.subscribe("match_orders", self.set_equity_price, EventPriority.PRE_EVENT)
+        events.subscribe("sweep_orders", self.sweep_orders, EventPriority.PRE_EVENT)
+
+    def sweep_orders(self, order, fills, is_margin_call=False):
+        # The equity moves to the last traded price and margins are checked once for the whole sweep.
+        return self.set_equity_price(order, fills[-1][0], is_margin_call)
 
     def set_equity_price(self, order, matched_order, is_margin_call=False):
         old_equity = self.equities.get_item(order)
         new_equity = old_equity.clone()
 
         if new_equity.current_price != matched_order.current_price:
-            self.trade_engine.events.trigger("equities_update_item", new_equity, old_equity)
-            self.trade_engine.events.trigger("set_equity_price", new_equity, old_equity)
+            self.trade_engine.events.trigger_id(EQUITIES_UPDATE_ITEM, new_equity, old_equity)
+            self.trade_engine.events.trigger_id(SET_EQUITY_PRICE, new_equity, old_equity)
 
         if is_margin_call:
             return EventReturnType.STOP
 
-        return self.trade_engine.events.trigger("check_margins", new_equity, old_equity)
+        return self.trade_engine.events.trigger_id(CHECK_MARGINS, new_equity, old_equity)
@@ -0,0 +1,52 @@
+from operation_stats import OperationStats
+import threading
+
+
+# Counts how often execute_func has to roll an operation back because it found locks it did not hold. Every
+# call is recorded once when it finishes, so the lock is taken once per call and not once per attempt.
+class ExecutionMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations = {}
+        self.prefixes = {}
+
+    @staticmethod
+    def get_key_prefix(key):
+        # Lock keys are either (kind, id) tuples or strings such as "e12" and "uu7", whose prefix is the
+        # letters before the id.
+        if isinstance(key, tuple):
+            return str(key[0])
+
+        key = str(key)
+        index = 0
+        while index < len(key) and not key[index].isdigit():
+            index += 1
+        return key[:index]
+
+    def record(self, operation, attempts, lock_growths, aborted_time, conflict_keys):
+        conflict_prefixes = [ExecutionMetrics.get_key_prefix(key) for key in conflict_keys]
+
+        with self.lock:
+            operation_stats = self.operations.get(operation)
+            if operation_stats is None:
+                operation_stats = self.operations[operation] = OperationStats()
+            operation_stats.record(attempts, lock_growths, aborted_time, conflict_prefixes)
+
+            for prefix in conflict_prefixes:
+                self.prefixes[prefix] = self.prefixes.get(prefix, 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.operations = {}
+            self.prefixes = {}
+
+    def snapshot(self):
+        with self.lock:
+            operations = {}
+            for operation in self.operations:
+                operations[operation] = self.operations[operation].snapshot()
+
+            return {
+                "operations": operations,
+                "conflicts": dict(self.prefixes)
+            }
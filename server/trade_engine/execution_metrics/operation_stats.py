@@ -0,0 +1,56 @@
+class OperationStats:
+    SAMPLE_SIZE = 2048
+
+    def __init__(self):
+        self.calls = 0
+        self.rollbacks = 0
+        self.aborted_time = 0.0
+        self.attempts = {}
+        self.lock_growth = {}
+        self.conflicts = {}
+        self.aborted_samples = []
+        self.sample_index = 0
+
+    @staticmethod
+    def add_to_histogram(histogram, value):
+        histogram[value] = histogram.get(value, 0) + 1
+
+    def record(self, attempts, lock_growths, aborted_time, conflict_prefixes):
+        self.calls += 1
+        self.rollbacks += attempts - 1
+        OperationStats.add_to_histogram(self.attempts, attempts)
+
+        for lock_growth in lock_growths:
+            OperationStats.add_to_histogram(self.lock_growth, lock_growth)
+
+        for prefix in conflict_prefixes:
+            OperationStats.add_to_histogram(self.conflicts, prefix)
+
+        if attempts > 1:
+            self.aborted_time += aborted_time
+
+            # Keep the latest SAMPLE_SIZE aborted times for the percentiles.
+            if len(self.aborted_samples) < OperationStats.SAMPLE_SIZE:
+                self.aborted_samples.append(aborted_time)
+            else:
+                self.aborted_samples[self.sample_index] = aborted_time
+                self.sample_index = (self.sample_index + 1) % OperationStats.SAMPLE_SIZE
+
+    @staticmethod
+    def percentile(samples, fraction):
+        if len(samples) == 0:
+            return 0.0
+        return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+    def snapshot(self):
+        samples = sorted(self.aborted_samples)
+        return {
+            "calls": self.calls,
+            "rollbacks": self.rollbacks,
+            "attempts": dict(self.attempts),
+            "lock_growth": dict(self.lock_growth),
+            "conflicts": dict(self.conflicts),
+            "aborted_time": self.aborted_time,
+            "aborted_p50": OperationStats.percentile(samples, 0.5),
+            "aborted_p99": OperationStats.percentile(samples, 0.99)
+        }
@@ -0,0 +1,58 @@
+from change_set import ChangeSet
+import pickle
+import struct
+import os
+
+
+# Local write ahead log of committed change sets. A batch is appended with a single write and fsync, after which
+# its transactions are acknowledged. Once the batch reached the database the journal is no longer needed and is
+# truncated whenever nothing is left waiting for the database.
+class ChangeJournal:
+    HEADER = struct.Struct("<I")
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "ab")
+
+    def append(self, change_sets):
+        data = []
+        for change_set in change_sets:
+            record = pickle.dumps(change_set.changes, pickle.HIGHEST_PROTOCOL)
+            data.append(ChangeJournal.HEADER.pack(len(record)))
+            data.append(record)
+
+        self.file.write(b"".join(data))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def truncate(self):
+        self.file.truncate(0)
+        self.file.seek(0)
+        os.fsync(self.file.fileno())
+
+    def read(self):
+        # Yields the changes of every complete record. A record cut short by a crash was never acknowledged and
+        # is ignored.
+        with open(self.path, "rb") as journal_file:
+            while True:
+                header = journal_file.read(ChangeJournal.HEADER.size)
+                if len(header) < ChangeJournal.HEADER.size:
+                    return
+
+                (length,) = ChangeJournal.HEADER.unpack(header)
+                record = journal_file.read(length)
+                if len(record) < length:
+                    return
+
+                yield pickle.loads(record)
+
+    def replay(self, db):
+        journal_changes = []
+        for changes in self.read():
+            journal_changes.extend(changes)
+        ChangeSet.apply_changes(journal_changes, db)
+        db.session.commit()
+        self.truncate()
+
+    def close(self):
+        self.file.close()
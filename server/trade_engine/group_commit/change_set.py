@@ -0,0 +1,97 @@
+from collections import OrderedDict
+
+
+# Stands in for db while an engine transaction commits. The versioned structures call db.session.add and
+# db.session.delete as usual, the change set records a copy of every row instead of touching the database, so
+# the rows can be written later by the group committer while the engine keeps changing the live objects.
+class ChangeSet:
+    ADD = 0
+    DELETE = 1
+    # Most primary keys sent in one IN list.
+    QUERY_SIZE = 500
+
+    def __init__(self):
+        self.session = self
+        self.changes = []
+
+    @staticmethod
+    def get_values(item):
+        values = {}
+        for column in item.__table__.columns:
+            values[column.name] = getattr(item, column.name)
+        return values
+
+    def add(self, item):
+        self.changes.append((ChangeSet.ADD, item.__class__, ChangeSet.get_values(item)))
+
+    def delete(self, item):
+        self.changes.append((ChangeSet.DELETE, item.__class__, ChangeSet.get_values(item)))
+
+    def is_empty(self):
+        return len(self.changes) == 0
+
+    @staticmethod
+    def build_item(model_class, values):
+        item = model_class.__mapper__.class_manager.new_instance()
+        for name in values:
+            setattr(item, name, values[name])
+        return item
+
+    @staticmethod
+    def get_key(model_class, values):
+        return tuple(values[column.name] for column in model_class.__mapper__.primary_key)
+
+    @staticmethod
+    def apply_changes(changes, db):
+        # Only the last change of a row is written. The keys of a model's rows are looked up with one query per
+        # QUERY_SIZE rows to split them into inserts and updates, which are then written with one bulk statement
+        # each. Rows that already reached the database become updates, so replaying changes is harmless.
+        rows = OrderedDict()
+        for (change_type, model_class, values) in changes:
+            if model_class not in rows:
+                rows[model_class] = OrderedDict()
+            model_rows = rows[model_class]
+            key = ChangeSet.get_key(model_class, values)
+            model_rows.pop(key, None)
+            model_rows[key] = (change_type, values)
+
+        for model_class in rows:
+            model_rows = rows[model_class]
+            primary_key = model_class.__mapper__.primary_key
+            keys = list(model_rows.keys())
+            existing_keys = set()
+
+            for i in range(0, len(keys), ChangeSet.QUERY_SIZE):
+                query = db.session.query(*primary_key).filter(
+                    ChangeSet.get_key_filter(db, primary_key, keys[i:i + ChangeSet.QUERY_SIZE])
+                )
+                existing_keys.update(tuple(row) for row in query)
+
+            inserts = []
+            updates = []
+            deletes = []
+
+            for key in keys:
+                (change_type, values) = model_rows[key]
+                if change_type == ChangeSet.DELETE:
+                    if key in existing_keys:
+                        deletes.append(key)
+                elif key in existing_keys:
+                    updates.append(values)
+                else:
+                    inserts.append(values)
+
+            if len(inserts) > 0:
+                db.session.bulk_insert_mappings(model_class, inserts)
+            if len(updates) > 0:
+                db.session.bulk_update_mappings(model_class, updates)
+            for i in range(0, len(deletes), ChangeSet.QUERY_SIZE):
+                db.session.query(model_class).filter(
+                    ChangeSet.get_key_filter(db, primary_key, deletes[i:i + ChangeSet.QUERY_SIZE])
+                ).delete(synchronize_session=False)
+
+    @staticmethod
+    def get_key_filter(db, primary_key, keys):
+        if len(primary_key) == 1:
+            return primary_key[0].in_([key[0] for key in keys])
+        return db.tuple_(*primary_key).in_(keys)
@@ -0,0 +1,138 @@
+from trade_engine.sequencer.command_future import CommandFuture
+from change_set import ChangeSet
+from timeit import default_timer
+import threading
+import os
+
+
+# Collects the change sets of committed engine transactions and writes them to the database in batches, one
+# database transaction per batch. A batch is cut at max_batch_size change sets or max_delay seconds after its
+# first one arrived. With a journal the transactions of a batch are acknowledged as soon as the batch is
+# fsynced to it, otherwise once the database transaction commits. A batch that can not be made durable stops the
+# process, as its transactions are already committed in memory. A database failure with a journal is retried by
+# replaying the journal on every following batch until it succeeds.
+class GroupCommitter:
+    def __init__(self, db, journal=None, max_batch_size=256, max_delay=0.002):
+        self.db = db
+        self.journal = journal
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.pending = []
+        self.condition = threading.Condition()
+        self.running = True
+        self.batch_count = 0
+        self.change_set_count = 0
+        self.error = None
+
+        self.thread = threading.Thread(target=self.run, name="group_committer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, change_set):
+        # Called while the transaction still holds its locks, so change sets reach the journal and the database
+        # in the order the engine committed them.
+        future = CommandFuture()
+
+        if change_set.is_empty():
+            future.set_result(None)
+            return future
+
+        with self.condition:
+            if not self.running:
+                raise Exception("GroupCommitterStopped")
+            self.pending.append((change_set, future))
+            if len(self.pending) == 1 or len(self.pending) >= self.max_batch_size:
+                self.condition.notify()
+
+        return future
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+        self.thread.join()
+
+    def __take_batch(self):
+        with self.condition:
+            while len(self.pending) == 0 and self.running:
+                self.condition.wait()
+
+            deadline = default_timer() + self.max_delay
+            while len(self.pending) < self.max_batch_size and self.running:
+                remaining = deadline - default_timer()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            batch = self.pending[:self.max_batch_size]
+            del self.pending[:self.max_batch_size]
+            return batch, len(self.pending) == 0
+
+    def run(self):
+        while True:
+            (batch, is_drained) = self.__take_batch()
+
+            if len(batch) == 0:
+                return
+
+            self.flush(batch, is_drained)
+
+    def flush(self, batch, is_drained):
+        futures = [future for (change_set, future) in batch]
+
+        if self.journal is None:
+            if not self.write(batch):
+                # The transactions are already committed in memory, so the engine can not go on without them.
+                self.fail_stop()
+
+            for future in futures:
+                future.set_result(None)
+            return
+
+        try:
+            self.journal.append([change_set for (change_set, future) in batch])
+        except Exception:
+            self.fail_stop()
+
+        for future in futures:
+            future.set_result(None)
+
+        if self.error is not None:
+            # An earlier batch did not reach the database. The journal holds it and everything after it in order,
+            # so replaying the journal writes this batch too and lets the journal be truncated again.
+            self.replay()
+        elif not self.write(batch):
+            self.replay()
+        elif is_drained:
+            self.journal.truncate()
+
+    def write(self, batch):
+        try:
+            changes = []
+            for (change_set, future) in batch:
+                changes.extend(change_set.changes)
+            ChangeSet.apply_changes(changes, self.db)
+            self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            self.error = e
+            return False
+
+        self.batch_count += 1
+        self.change_set_count += len(batch)
+        return True
+
+    def replay(self):
+        try:
+            self.journal.replay(self.db)
+        except Exception as e:
+            self.db.session.rollback()
+            self.error = e
+            return
+
+        self.error = None
+
+    def fail_stop(self):
+        # exit() would only end this thread and leave the callers waiting, the whole process is stopped instead.
+        os._exit(-1)
@@ -1,9 +1,14 @@
-from transactional_data_structures.transactional import Transactional
-from transactional_data_structures.dictionary_array_version import DictionaryArrayVersion
+from transactional_data_structures.transactional import Transactional, transactional
+from transactional_data_structures.dictionary_price_level_version import DictionaryPriceLevelVersion
 from models.models.order import Order
 from transactional_data_structures.events import EventReturnType, Events
+from operator import neg
 
+SWEEP_ORDERS = Events.get_event_id("sweep_orders")
+EXECUTE_TRIGGER_ORDERS = Events.get_event_id("execute_trigger_orders")
 
+
+@transactional("orders")
 class LimitOrders(Transactional):
     def __init__(self):
         pass
@@ -13,35 +18,89 @@ class LimitOrders(Transactional):
         self.trade_engine = order_book.trade_engine
         self.is_long = is_long
 
-        comparer = Order.price_comparer_dec if is_long else Order.price_comparer
         is_in_item = Order.is_opened_long_limit if is_long else Order.is_opened_short_limit
 
-        self.orders = DictionaryArrayVersion(
+        # Orders grouped by price, best level first and oldest first within a level. It is the only index of the
+        # side, the price time order of the orders is read through the levels.
+        self.orders = DictionaryPriceLevelVersion(
+            {},
             {},
-            comparer,
             "equity_id",
-            is_in_item=is_in_item,
+            "price",
+            Order.open_quantity,
+            Order.id_comparer,
+            Order.id_key,
+            level_key=neg if is_long else None,
+            is_in_list=is_in_item,
             model_name="orders",
             events=self.trade_engine.events
         )
         self.subscribe_events(self.trade_engine.events)
 
+    def clone_init(self):
+        self.subscribe_events(self.trade_engine.events)
+
     def subscribe_events(self, events):
         events.subscribe("execute_order", self.execute_order)
 
+    def get_top(self, equity, count):
+        return self.orders.get_top(equity, count)
+
+    def get_best_price(self, equity):
+        level = self.orders.get_best(equity)
+        return None if level is None else level.price
+
+    def get_level(self, equity, price):
+        level = self.orders.get_level(equity, price)
+        return (0, 0) if level is None else (level.quantity, level.count)
+
+    def get_depth(self, equity, count=None):
+        return self.orders.get_depth(equity, count)
+
+    def iter_orders_to_price(self, equity, price=None):
+        # Orders priced at price or better, best price first. Without a price the whole side is walked.
+        return self.orders.iter_items(equity, price)
+
+    def get_orders_to_price(self, equity, price):
+        return list(self.iter_orders_to_price(equity, price))
+
+    def get_fills(self, order, count=None):
+        # (resting order, quantity) pairs the order would take, best level first and oldest first within a level.
+        fills = []
+        remaining = Order.open_quantity(order)
+
+        if remaining <= 0:
+            return fills
+
+        for level in self.orders.iter_levels(order):
+            if not order.intersects(level.get_first()):
+                break
+
+            for matched_order in level:
+                quantity = min(remaining, Order.open_quantity(matched_order))
+                fills.append((matched_order, quantity))
+                remaining -= quantity
+
+                if remaining == 0 or len(fills) == count:
+                    return fills
+
+        return fills
+
     def execute_order(self, order, is_margin_call=False):
-        if not order.is_limit_or_market() or self.orders.get_count(order) == 0:
+        if not order.is_limit_or_market():
             return EventReturnType.CONTINUE
 
-        matched_order = self.orders.get_index(order, 0)
-
-        if order.intersects(matched_order):
-            # Should not continue on margined orderbook and margin calls
-            if Events.executed(self.trade_engine.events.trigger("match_orders", order, matched_order, is_margin_call)):
-                if order.remaining_quantity() == 0:
-                    self.trade_engine.events.trigger("execute_trigger_orders")
-                    return EventReturnType.STOP
-                else:
-                    return EventReturnType.RESTART if not is_margin_call else EventReturnType.STOP
-        else:
+        # Every crossing order is matched by one sweep_orders event instead of restarting execute_order per fill.
+        # Margin calls still take a single fill at a time.
+        fills = self.get_fills(order, 1 if is_margin_call else None)
+
+        if len(fills) == 0:
             return EventReturnType.CONTINUE
+
+        self.trade_engine.events.trigger_id(SWEEP_ORDERS, order, fills, is_margin_call)
+
+        if Order.open_quantity(order) == 0:
+            self.trade_engine.events.trigger_id(EXECUTE_TRIGGER_ORDERS)
+            return EventReturnType.STOP
+
+        return EventReturnType.STOP if is_margin_call else EventReturnType.CONTINUE
@@ -0,0 +1,58 @@
+from models.models.order import Order
+
+
+# The trailing stops of one equity and side sharing a trailing_stop_percent. Orders placed at different times have
+# seen different prices, so the bucket keeps a stack of (start order id, mark) pairs, each mark shared by the orders
+# from its start up to the next one's. Buy stops follow the lowest price since they were placed and sell stops the
+# highest, so older marks are always further from the price: a move the stops follow only merges the newest marks
+# and a move against them triggers the oldest ones.
+class TrailingBucket:
+    def __init__(self, is_long, percent, marks=None):
+        self.is_long = is_long
+        self.percent = percent
+        self.marks = [] if marks is None else marks
+
+    def clone(self):
+        return TrailingBucket(self.is_long, self.percent, list(self.marks))
+
+    def get_stop(self, mark):
+        return Order.get_trailing_stop(self.is_long, self.percent, mark)
+
+    def is_passed(self, mark, price):
+        return mark > price if self.is_long else mark < price
+
+    def is_triggered(self, mark, price):
+        stop = self.get_stop(mark)
+        return price >= stop if self.is_long else price <= stop
+
+    def add_order(self, order_id, price):
+        if len(self.marks) == 0 or self.marks[-1][1] != price:
+            self.marks.append((order_id, price))
+
+    def should_move(self, price):
+        return len(self.marks) > 0 and self.is_passed(self.marks[-1][1], price)
+
+    def move(self, price):
+        start = None
+        while len(self.marks) > 0 and self.is_passed(self.marks[-1][1], price):
+            start = self.marks.pop()[0]
+
+        if start is not None and (len(self.marks) == 0 or self.marks[-1][1] != price):
+            self.marks.append((start, price))
+
+    def get_mark_index(self, order_id):
+        # The mark the order trails, the last one started at or before it, -1 for none.
+        index = -1
+        while index + 1 < len(self.marks) and self.marks[index + 1][0] <= order_id:
+            index += 1
+        return index
+
+    def get_triggered_count(self, price):
+        count = 0
+        while count < len(self.marks) and self.is_triggered(self.marks[count][1], price):
+            count += 1
+        return count
+
+    def get_end_key(self, count):
+        # The bucket key following the orders of the first count marks.
+        return self.percent, self.marks[count][0] if count < len(self.marks) else float("inf")
@@ -0,0 +1,100 @@
+from transactional_data_structures.transactional import Transactional
+from trade_engine.order_book.indices.trailing_bucket import TrailingBucket
+
+
+# equity_id -> trailing_stop_percent -> TrailingBucket. A bucket written in a transaction is copied once into the
+# overlay, so a price move costs one copy per bucket whose marks change and nothing per order.
+class TrailingBuckets(Transactional):
+    def __init__(self, dic, is_long):
+        self.dic = dic
+        self.is_long = is_long
+
+        # equity_id -> {percent -> bucket written in this transaction}
+        self.touched = {}
+
+    def get_buckets(self, equity_id):
+        buckets = self.dic.get(equity_id)
+        touched = self.touched.get(equity_id)
+
+        if touched is None:
+            return {} if buckets is None else buckets
+
+        result = {} if buckets is None else dict(buckets)
+        result.update(touched)
+        return result
+
+    def get_bucket(self, equity_id, percent):
+        return self.get_buckets(equity_id).get(percent)
+
+    def get_touched_bucket(self, equity_id, percent):
+        self.mark_dirty()
+
+        touched = self.touched.get(equity_id)
+        if touched is None:
+            touched = self.touched[equity_id] = {}
+
+        bucket = touched.get(percent)
+
+        if bucket is None:
+            buckets = self.dic.get(equity_id)
+            committed_bucket = None if buckets is None else buckets.get(percent)
+            bucket = TrailingBucket(self.is_long, percent) if committed_bucket is None else committed_bucket.clone()
+            touched[percent] = bucket
+
+        return bucket
+
+    def add_order(self, order, price):
+        bucket = self.get_bucket(order.equity_id, order.trailing_stop_percent)
+        if bucket is None or len(bucket.marks) == 0 or bucket.marks[-1][1] != price:
+            self.get_touched_bucket(order.equity_id, order.trailing_stop_percent).add_order(order.order_id, price)
+
+    def move(self, equity_id, price):
+        for (percent, bucket) in list(self.get_buckets(equity_id).items()):
+            if bucket.should_move(price):
+                self.get_touched_bucket(equity_id, percent).move(price)
+
+    def remove_marks(self, equity_id, percent, count):
+        del self.get_touched_bucket(equity_id, percent).marks[:count]
+
+    def remove_mark(self, equity_id, percent, index):
+        del self.get_touched_bucket(equity_id, percent).marks[index]
+
+    def snapshot(self, writer):
+        return [
+            (equity_id, [(percent, list(bucket.marks)) for (percent, bucket) in list(buckets.items())])
+            for (equity_id, buckets) in list(self.dic.items())
+        ]
+
+    def load_snapshot(self, state, reader):
+        self.dic.clear()
+        self.touched = {}
+
+        for (equity_id, buckets) in state:
+            self.dic[equity_id] = dict(
+                (percent, TrailingBucket(self.is_long, percent, list(marks))) for (percent, marks) in buckets
+            )
+
+    def clone(self, root_name="root", root=None):
+        result = TrailingBuckets(self.dic, self.is_long)
+        result.tracker = None if root is None else root.tracker
+        return result
+
+    def commit(self, db):
+        for (equity_id, touched) in self.touched.items():
+            buckets = self.dic.get(equity_id)
+            if buckets is None:
+                buckets = self.dic[equity_id] = {}
+
+            for (percent, bucket) in touched.items():
+                if len(bucket.marks) > 0:
+                    buckets[percent] = bucket
+                elif percent in buckets:
+                    del buckets[percent]
+
+            if len(buckets) == 0:
+                del self.dic[equity_id]
+
+        self.touched = {}
+
+    def roll_back(self):
+        self.touched = {}
@@ -1,9 +1,12 @@
-from transactional_data_structures.transactional import Transactional
+from transactional_data_structures.transactional import Transactional, transactional
 from transactional_data_structures.dictionary_array_version import DictionaryArrayVersion
+from transactional_data_structures.b_tree_array import BTreeArray
 from models.models.order import Order
-from transactional_data_structures.events import EventReturnType
+from transactional_data_structures.events import EventReturnType, EventPriority
+from trade_engine.order_book.indices.trailing_buckets import TrailingBuckets
 
 
+@transactional("orders", "buckets")
 class TrailingOrders(Transactional):
     def __init__(self):
         self.orders_to_trigger = None
@@ -13,80 +16,116 @@ class TrailingOrders(Transactional):
         self.trade_engine = order_book.trade_engine
         self.is_long = is_long
 
-        comparer = Order.trailing_price_comparer_dec if is_long else Order.trailing_price_comparer
-        comparer_max = Order.trailing_price_max_comparer if is_long else Order.effective_price_max_comparer_dec
-
         is_in_item = Order.is_opened_long_trailing if is_long else Order.is_opened_short_trailing
 
         self.orders_to_trigger = None
 
+        # Orders by trailing_stop_percent and then by age, so the orders sharing a mark are a range of their bucket.
+        # Their stop prices are derived from the bucket marks and are not kept on the orders.
         self.orders = DictionaryArrayVersion(
             {},
-            comparer,
+            Order.trailing_bucket_comparer,
             "equity_id",
-            is_in_item=is_in_item,
+            is_in_list=is_in_item,
             model_name="orders",
-            events=self.trade_engine.events
+            events=self.trade_engine.events,
+            array_class=BTreeArray,
+            key=Order.trailing_bucket_key
         )
 
-        self.orders_max = DictionaryArrayVersion(
-            {},
-            comparer_max,
-            "equity_id",
-            is_in_item=is_in_item,
-            model_name="orders",
-            events=self.trade_engine.events
-        )
+        self.buckets = TrailingBuckets({}, is_long)
+
+        self.subscribe_events(self.trade_engine.events)
 
-        self.subscribe_to_events(self.trade_engine.events)
+    def clone_init(self):
+        self.subscribe_events(self.trade_engine.events)
 
     def subscribe_events(self, events):
         events.subscribe("execute_order", self.execute_order)
         events.subscribe("set_equities_price", self.set_equities_price)
+        # After the orders index has dropped the order.
+        events.subscribe("orders_update_item", self.orders_update_item, EventPriority.POST_EVENT)
+        events.subscribe("orders_delete_item", self.orders_delete_item, EventPriority.POST_EVENT)
 
     def execute_order(self, order):
-        if not order.is_only_trailing():
+        if not order.is_only_trailing() or order.is_long != self.is_long:
             return EventReturnType.CONTINUE
 
         equity = self.trade_engine.equity_list.get_equity(order.equity_id)
 
         order.set_trailing_price(equity)
+        self.buckets.add_order(order, equity.current_price)
 
         return EventReturnType.CONTINUE
 
+    def get_top(self, equity, count):
+        return self.orders.get_top(equity, count)
+
+    def get_trailing_mark(self, order):
+        bucket = self.buckets.get_bucket(order.equity_id, order.trailing_stop_percent)
+
+        if bucket is None:
+            return None
+
+        index = bucket.get_mark_index(order.order_id)
+        return None if index < 0 else bucket.marks[index][1]
+
+    def get_trailing_price(self, order):
+        mark = self.get_trailing_mark(order)
+        return None if mark is None else Order.get_trailing_stop(order.is_long, order.trailing_stop_percent, mark)
+
+    def orders_update_item(self, new_order, old_order):
+        if self.orders.is_in_list(old_order) and not self.orders.is_in_list(new_order):
+            self.remove_unused_mark(old_order)
+
+    def orders_delete_item(self, order):
+        if self.orders.is_in_list(order):
+            self.remove_unused_mark(order)
+
+    def remove_unused_mark(self, order):
+        # A mark stays on its bucket's stack until it triggers. Once every order trailing it has been cancelled it
+        # would never trigger, so it is dropped with the last of them. Triggered orders already lost their mark.
+        bucket = self.buckets.get_bucket(order.equity_id, order.trailing_stop_percent)
+
+        if bucket is None:
+            return
+
+        index = bucket.get_mark_index(order.order_id)
+
+        if index < 0:
+            return
+
+        start_key = (bucket.percent, bucket.marks[index][0])
+        if len(self.orders.get_range(order, start_key, bucket.get_end_key(index + 1), count=1)) == 0:
+            self.buckets.remove_mark(order.equity_id, bucket.percent, index)
+
+    def trigger_bucket(self, equity, bucket, price):
+        count = bucket.get_triggered_count(price)
+
+        if count == 0:
+            return
+
+        marks = bucket.marks[:count]
+        orders = self.orders.remove_range(equity, (bucket.percent, float("-inf")), bucket.get_end_key(count))
+        self.buckets.remove_marks(equity.equity_id, bucket.percent, count)
+
+        # Each order is triggered at the stop of the mark it trails, oldest marks, the first ones passed, first.
+        trailing_marks = []
+        index = 0
+        for order in orders:
+            while index + 1 < len(marks) and marks[index + 1][0] <= order.order_id:
+                index += 1
+            trailing_marks.append(marks[index][1])
+
+        self.trade_engine.order_book.trigger_orders(orders, price, trailing_marks)
+
     def set_equities_price(self, new_equity, old_equity):
-        order_book = self.trade_engine.order_book
-
-        is_increasing = new_equity.current_price > old_equity.current_price
-
-        if is_increasing == self.is_long:
-            # Check Trailing
-            orders_max = self.orders_max.get_list(new_equity)
-
-            while orders_max.get_length() > 0:
-                order = orders_max.get_index(0)
-                if (self.is_long and new_equity.current_price >= order.trailing_price_max) or \
-                   (not self.is_long and new_equity.current_price <= order.trailing_price_max):
-                    new_order = order.clone()
-                    new_order.set_trailing_price(new_equity)
-                    self.trade_engine.events.trigger("orders_update_item", new_order, order)
-                else:
-                    break
+        price = new_equity.current_price
+        is_increasing = price > old_equity.current_price
+
+        # Buy stops sit above the price and follow it down, sell stops sit below it and follow it up.
+        if is_increasing != self.is_long:
+            self.buckets.move(new_equity.equity_id, price)
         else:
-            # Check Trigger
-            orders = self.orders.get_list(new_equity)
-
-            while orders.get_length() > 0:
-                order = orders.get_index(0)
-                if (not self.is_long and new_equity.current_price >= order.trailing_price) or \
-                   (self.is_long and new_equity.current_price <= order.trailing_price):
-                    new_order = order.clone()
-                    order_book.add_triggered_order(
-                        new_order.close_and_create_triggered_order(
-                            order_book.get_next_id(new_order),
-                            new_equity.current_price
-                        )
-                    )
-                    self.trade_engine.events.trigger("orders_update_item", new_order, order)
-                else:
-                    break
+            for bucket in list(self.buckets.get_buckets(new_equity.equity_id).values()):
+                self.trigger_bucket(new_equity, bucket, price)
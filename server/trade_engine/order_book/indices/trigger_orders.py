@@ -1,8 +1,11 @@
-from transactional_data_structures.transactional import Transactional
+from transactional_data_structures.transactional import Transactional, transactional
 from transactional_data_structures.dictionary_array_version import DictionaryArrayVersion
+from transactional_data_structures.b_tree_array import BTreeArray
 from models.models.order import Order
 from transactional_data_structures.events import EventReturnType
 
+
+@transactional("orders")
 class TriggerOrders(Transactional):
     def __init__(self):
         self.orders_to_trigger = None
@@ -15,15 +18,18 @@ class TriggerOrders(Transactional):
         self.orders_to_trigger = None
 
         comparer = Order.trigger_price_comparer_dec if is_long else Order.trigger_price_comparer
+        key = Order.trigger_price_key_dec if is_long else Order.trigger_price_key
         is_in_item = Order.is_opened_long_trigger if is_long else Order.is_opened_short_trigger
 
         self.orders = DictionaryArrayVersion(
             {},
             comparer,
             "equity_id",
-            is_in_item=is_in_item,
+            is_in_list=is_in_item,
             model_name="orders",
-            events=self.trade_engine.events
+            events=self.trade_engine.events,
+            array_class=BTreeArray,
+            key=key
         )
 
         self.subscribe_events(self.trade_engine.events)
@@ -34,6 +40,9 @@ class TriggerOrders(Transactional):
 
         self.orders_to_trigger.append(trigger_order)
 
+    def clone_init(self):
+        self.subscribe_events(self.trade_engine.events)
+
     def subscribe_events(self, events):
         events.subscribe("execute_order", self.execute_order)
         events.subscribe("set_equities_price", self.set_equities_price)
@@ -50,25 +59,26 @@ class TriggerOrders(Transactional):
 
         return EventReturnType.CONTINUE
 
+    def get_top(self, equity, count):
+        return self.orders.get_top(equity, count)
+
+    def get_triggered_orders(self, equity, price):
+        # Long orders trigger at or above their trigger price and short orders at or below it. Both are
+        # the tail of their index.
+        bound = -price if self.is_long else price
+        return self.orders.get_range(equity, start_key=(bound, float("-inf")))
+
+    def detach_triggered_orders(self, equity, price):
+        bound = -price if self.is_long else price
+        return self.orders.remove_range(equity, start_key=(bound, float("-inf")))
+
     def set_equities_price(self, new_equity, old_equity):
         order_book = self.trade_engine.order_book
 
         is_increasing = new_equity.current_price > old_equity.current_price
 
-        orders = self.orders.get_list(new_equity)
-
         if is_increasing == self.is_long:
-            while orders.get_length() > 0:
-                order = orders.get_index(0)
-                if (self.is_long and new_equity.current_price >= order.trigger_price) or \
-                   (not self.is_long and new_equity.current_price <= order.trigger_price):
-                        new_order = order.clone()
-                        order_book.add_triggered_order(
-                            new_order.close_and_create_triggered_order(
-                                order_book.get_next_id(new_order),
-                                new_equity.current_price
-                            )
-                        )
-                        self.trade_engine.events.trigger("orders_update_item", new_order, order)
-                else:
-                    break
+            # The tail runs away from the new price, reversed it is in the order the price passed the orders.
+            orders = self.detach_triggered_orders(new_equity, new_equity.current_price)
+            orders.reverse()
+            order_book.trigger_orders(orders, new_equity.current_price)
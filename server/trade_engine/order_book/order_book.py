@@ -1,6 +1,7 @@
-from transactional_data_structures.transactional import Transactional
+from transactional_data_structures.transactional import Transactional, transactional
 from transactional_data_structures.dictionary_array_version import DictionaryArrayVersion
 from transactional_data_structures.dictionary_auto_incrementer_version import DictionaryAutoIncrementerVersion
+from transactional_data_structures.dictionary_dictionary_version import DictionaryDictionaryVersion
 
 from models.models.order import OrderType, OrderStatus, Order
 from models.models.order_id import OrderId
@@ -8,10 +9,28 @@ from transactional_data_structures.events import Events, EventPriority
 from indices.limit_orders import LimitOrders
 from indices.trigger_orders import  TriggerOrders
 from indices.trailing_orders import TrailingOrders
-from helpers.helper import quick_sort
 
 import datetime
-
+import heapq
+
+ORDERS_INSERT_ITEM = Events.get_event_id("orders_insert_item")
+EXECUTE_ORDER = Events.get_event_id("execute_order")
+PLACE_ORDER = Events.get_event_id("place_order")
+CANCEL_ORDER = Events.get_event_id("cancel_order")
+ORDERS_UPDATE_ITEM = Events.get_event_id("orders_update_item")
+
+
+@transactional(
+    "orders",
+    "orders_id",
+    "open_orders",
+    "limit_order_longs",
+    "limit_order_shorts",
+    "trigger_order_longs",
+    "trigger_order_shorts",
+    "trailing_order_longs",
+    "trailing_order_shorts"
+)
 class OrderBook(Transactional):
     def __init__(self):
         pass
@@ -24,7 +43,8 @@ class OrderBook(Transactional):
             Order.id_comparer,
             "equity_id",
             model_name="orders",
-            events=self.trade_engine.events
+            events=self.trade_engine.events,
+            key=Order.id_key
         )
 
         self.orders_id = DictionaryAutoIncrementerVersion(
@@ -34,44 +54,88 @@ class OrderBook(Transactional):
             OrderId
         )
 
-        self.limit_order_longs = LimitOrders(self.trade_engine, True)
-        self.limit_order_shorts = LimitOrders(self.trade_engine, False)
+        # (equity_id, order_id) -> live order, so an order is found from its ids without a comparer search.
+        self.open_orders = DictionaryDictionaryVersion(
+            {},
+            "equity_id",
+            "order_id",
+            model_name="orders",
+            events=self.trade_engine.events,
+            is_in_list=Order.is_opened
+        )
+
+        self.limit_order_longs = LimitOrders(self, True)
+        self.limit_order_shorts = LimitOrders(self, False)
 
-        self.trigger_order_longs = TriggerOrders(self.trade_engine, True)
-        self.trigger_order_shorts = TriggerOrders(self.trade_engine, False)
+        self.trigger_order_longs = TriggerOrders(self, True)
+        self.trigger_order_shorts = TriggerOrders(self, False)
 
-        self.trailing_order_longs = TrailingOrders(self.trade_engine, True)
-        self.trailing_order_shorts = TrailingOrders(self.trade_engine, False)
+        self.trailing_order_longs = TrailingOrders(self, True)
+        self.trailing_order_shorts = TrailingOrders(self, False)
 
         self.subscribe_to_events(trade_engine.events)
 
         self.triggered_orders = None
         self.temp_triggered_orders = None
 
-        self.executing_user = None
+        self.executing_user_id = None
 
     def add_triggered_order(self, order):
+        self.add_triggered_run([order])
+
+    def add_triggered_run(self, orders):
         if self.temp_triggered_orders is None:
             self.temp_triggered_orders = []
 
-        self.temp_triggered_orders.append(order)
+        if len(orders) > 0:
+            self.temp_triggered_orders.append(orders)
+
+    def trigger_orders(self, orders, current_price, trailing_marks=None):
+        # Closes the detached stop orders and queues the orders they create as one run, keeping their order.
+        # Trailing stops pass the mark each order trails, their stop price is derived from it here.
+        run = []
+
+        for (index, order) in enumerate(orders):
+            new_order = order.clone()
+            if trailing_marks is not None:
+                new_order.set_trailing_mark(trailing_marks[index])
+            run.append(new_order.close_and_create_triggered_order(self.get_next_id(new_order), current_price))
+            self.trade_engine.events.trigger_id(ORDERS_UPDATE_ITEM, new_order, order)
+
+        self.add_triggered_run(run)
+
+    def clone_init(self):
+        self.triggered_orders = None
+        self.temp_triggered_orders = None
+        self.subscribe_to_events(self.trade_engine.events)
 
     def subscribe_to_events(self, events):
         events.subscribe("place_order", self.place_order_simple)
         events.subscribe("cancel_order", self.cancel_order_simple)
         events.subscribe("match_orders", self.match_orders)
+        events.subscribe("sweep_orders", self.sweep_orders)
         events.subscribe("set_equities_price", self.merge_triggered_orders, EventPriority.POST_EVENT)
         events.subscribe("execute_trigger_orders", self.execute_trigger_orders)
 
     def merge_triggered_orders(self, new_equity, old_equity):
-        if len(self.temp_triggered_orders) == 0:
+        if not self.temp_triggered_orders:
             return
-        if new_equity.current_price > old_equity.current_price:
-            quick_sort(self.temp_triggered_orders, Order.trailing_price_comparer())
-        else:
-            quick_sort(self.temp_triggered_orders, Order.trailing_price_comparer_dec)
 
-        self.triggered_orders.extend(self.temp_triggered_orders)
+        runs = self.temp_triggered_orders
+        self.temp_triggered_orders = None
+
+        if self.triggered_orders is None:
+            self.triggered_orders = []
+
+        # Every run is already in the order the price passed its activation prices, so the runs are merged
+        # rather than sorted.
+        sign = 1 if new_equity.current_price > old_equity.current_price else -1
+        decorated_runs = [
+            [(sign * order.trailing_price, run_index, index, order) for (index, order) in enumerate(run)]
+            for (run_index, run) in enumerate(runs)
+        ]
+
+        self.triggered_orders.extend(order for (price, run_index, index, order) in heapq.merge(*decorated_runs))
 
     def get_limit_orders_long(self, order):
         return self.limit_order_longs.orders.get_list(order)
@@ -101,12 +165,55 @@ class OrderBook(Transactional):
             self.get_trailing_orders_short(order)
         ]
 
+    def get_depth(self, equity, count=None):
+        return {
+            "bids": self.limit_order_longs.get_depth(equity, count),
+            "asks": self.limit_order_shorts.get_depth(equity, count)
+        }
+
     def initialize(self):
         return
 
     def get_next_id(self, order):
         return self.orders_id.get_next_id(order)
 
+    def get_matching_user_ids(self, order):
+        # The order's user and the owners of the resting orders it would cross, best price first.
+        user_ids = [order.user_id]
+
+        equity = self.trade_engine.equity_list.get_equity(order)
+        resting_orders = self.limit_order_shorts if order.is_long else self.limit_order_longs
+        price = None if order.order_type == OrderType.MARKET else order.price
+        quantity = order.get_quantity(equity)
+
+        for resting_order in resting_orders.iter_orders_to_price(order, price):
+            if quantity <= 0:
+                break
+            user_ids.append(resting_order.user_id)
+            quantity -= resting_order.remaining_quantity(equity)
+
+        if len(user_ids) == 1:
+            return user_ids
+
+        # A fill moves the equity's price. That can trigger the stop orders of this equity and margin call the
+        # holders of its contracts, and it changes the margin of every user with orders on it, so all of them
+        # are reserved before anything is mutated.
+        for index in (
+            self.limit_order_longs,
+            self.limit_order_shorts,
+            self.trigger_order_longs,
+            self.trigger_order_shorts,
+            self.trailing_order_longs,
+            self.trailing_order_shorts
+        ):
+            for equity_order in index.orders.get_list(order):
+                user_ids.append(equity_order.user_id)
+
+        for contract in self.trade_engine.contract_list.get_contracts(order):
+            user_ids.append(contract.user_id)
+
+        return user_ids
+
     def place_order(self, order, is_margin_call=False):
         if self.executing_user_id is None:
             self.executing_user_id = order.user_id
@@ -115,21 +222,51 @@ class OrderBook(Transactional):
         order.modification_id = order.order_id
 
         if self.orders.get_item(order) is None:
-            self.trade_engine.events.trigger("orders_insert_item", order)
+            self.trade_engine.events.trigger_id(ORDERS_INSERT_ITEM, order)
 
-        if not Events.executed(self.trade_engine.events.trigger("execute_order", order, is_margin_call)):
-            self.trade_engine.events.trigger("place_order", order)
+        if not Events.executed(self.trade_engine.events.trigger_id(EXECUTE_ORDER, order, is_margin_call)):
+            self.trade_engine.events.trigger_id(PLACE_ORDER, order)
             return False
         return True
 
+    def get_order(self, equity_id, order_id):
+        return self.open_orders.get_item_from_keys(equity_id, order_id)
+
+    def get_open_orders(self, equity_id):
+        return self.open_orders.get_items(equity_id)
+
+    def get_order_indices(self, order):
+        # The side specific indices the order is kept in.
+        return [
+            index for index in (
+                self.limit_order_longs,
+                self.limit_order_shorts,
+                self.trigger_order_longs,
+                self.trigger_order_shorts,
+                self.trailing_order_longs,
+                self.trailing_order_shorts
+            ) if index.orders.is_in_list(order)
+        ]
+
+    def cancel_orders(self, orders):
+        for order in orders:
+            self.cancel_order(order)
+
     def cancel_order(self, order):
+        # Only the ids of the order are needed, the live order is looked up.
+        live_order = self.get_order(order.equity_id, order.order_id)
+
+        if live_order is None or (order.user_id is not None and order.user_id != live_order.user_id):
+            raise Exception("OrderNotFound")
+
+        order = live_order
         new_order = order.clone()
 
         new_order.modification_id = self.get_next_id(order)
         new_order.closed_date = datetime.datetime.utcnow()
         new_order.status = OrderStatus.CLOSED
 
-        self.trade_engine.events.trigger("cancel_order", new_order, order)
+        self.trade_engine.events.trigger_id(CANCEL_ORDER, new_order, order)
 
     def place_order_simple(self, order):
         if order.order_type == OrderType.MARKET:
@@ -137,17 +274,22 @@ class OrderBook(Transactional):
             new_order.order_type = OrderType.LIMIT
             new_order.price = self.trade_engine.equity_list.get_equity(order.equity_id).current_price
 
-            self.trade_engine.events.trigger("orders_update_item", new_order, order)
+            self.trade_engine.events.trigger_id(ORDERS_UPDATE_ITEM, new_order, order)
 
     def cancel_order_simple(self, order):
         if order.order_status == OrderStatus.OPENED:
             new_order = order.clone()
             new_order.close()
-            self.trade_engine.events.trigger("orders_update_item", new_order, order)
+            self.trade_engine.events.trigger_id(ORDERS_UPDATE_ITEM, new_order, order)
 
-    def match_orders(self, order, matched_order):
-        quantity = min(order.remaining_quantity(), matched_order.remaining_quantity())
+    def match_orders(self, order, matched_order, is_margin_call=False):
+        self.fill_orders(order, matched_order, min(Order.open_quantity(order), Order.open_quantity(matched_order)))
 
+    def sweep_orders(self, order, fills, is_margin_call=False):
+        for (matched_order, quantity) in fills:
+            self.fill_orders(order, matched_order, quantity)
+
+    def fill_orders(self, order, matched_order, quantity):
         order.filled_quantity += quantity
         if order.is_filled():
             order.close()
@@ -160,11 +302,14 @@ class OrderBook(Transactional):
         if matched_order.is_filled():
             matched_order.close()
 
-        self.trade_engine.events.trigger("orders_update_item", matched_order, old_matched_order)
+        self.trade_engine.events.trigger_id(ORDERS_UPDATE_ITEM, matched_order, old_matched_order)
 
     def execute_trigger_orders(self):
-        temp_trigger_orders = self.trigger_orders
-        self.trigger_orders = None
+        temp_trigger_orders = self.triggered_orders
+        self.triggered_orders = None
+
+        if temp_trigger_orders is None:
+            return
 
         for trigger_order in temp_trigger_orders:
             self.place_order(trigger_order)
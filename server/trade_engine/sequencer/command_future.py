@@ -0,0 +1,25 @@
+import threading
+
+
+class CommandFuture:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def set_result(self, value):
+        self.value = value
+        self.done.set()
+
+    def set_exception(self, error):
+        self.error = error
+        self.done.set()
+
+    def result(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise Exception("CommandTimeout")
+
+        if self.error is not None:
+            raise self.error
+
+        return self.value
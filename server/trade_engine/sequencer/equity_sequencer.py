@@ -0,0 +1,52 @@
+from command_future import CommandFuture
+from collections import deque
+import threading
+
+
+# Single writer for one equity. Commands are run one at a time, in arrival order, by a dedicated thread so the
+# equity's book never needs the optimistic lock loop.
+class EquitySequencer:
+    def __init__(self, trade_engine, equity_id):
+        self.trade_engine = trade_engine
+        self.equity_id = equity_id
+        self.commands = deque()
+        self.condition = threading.Condition()
+        self.running = True
+
+        self.thread = threading.Thread(target=self.run, name="equity_sequencer_" + str(equity_id))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, func, *args):
+        future = CommandFuture()
+
+        with self.condition:
+            if not self.running:
+                raise Exception("SequencerStopped")
+            self.commands.append((func, args, future))
+            self.condition.notify()
+
+        return future
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+        self.thread.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while len(self.commands) == 0 and self.running:
+                    self.condition.wait()
+
+                if len(self.commands) == 0:
+                    return
+
+                (func, args, future) = self.commands.popleft()
+
+            try:
+                future.set_result(self.trade_engine.execute_sequenced(self.equity_id, func, *args))
+            except Exception as e:
+                future.set_exception(e)
@@ -0,0 +1,32 @@
+from equity_sequencer import EquitySequencer
+import threading
+
+
+class Sequencer:
+    def __init__(self, trade_engine):
+        self.trade_engine = trade_engine
+        self.equity_sequencers = {}
+        self.lock = threading.Lock()
+
+    def get_equity_sequencer(self, equity_id):
+        equity_sequencer = self.equity_sequencers.get(equity_id)
+
+        if equity_sequencer is None:
+            with self.lock:
+                equity_sequencer = self.equity_sequencers.get(equity_id)
+                if equity_sequencer is None:
+                    equity_sequencer = EquitySequencer(self.trade_engine, equity_id)
+                    self.equity_sequencers[equity_id] = equity_sequencer
+
+        return equity_sequencer
+
+    def submit(self, equity_id, func, *args):
+        return self.get_equity_sequencer(equity_id).submit(func, *args)
+
+    def stop(self):
+        with self.lock:
+            equity_sequencers = list(self.equity_sequencers.values())
+            self.equity_sequencers = {}
+
+        for equity_sequencer in equity_sequencers:
+            equity_sequencer.stop()
@@ -0,0 +1,188 @@
+from trade_engine.sequencer.command_future import CommandFuture
+from shard_message import ShardMessage
+from shard_worker import run_shard
+import multiprocessing
+import threading
+
+
+class Shard:
+    def __init__(self, shard_index, connection, process):
+        self.shard_index = shard_index
+        self.connection = connection
+        self.process = process
+        self.send_lock = threading.Lock()
+        self.futures = {}
+        # The error of a broadcast the shard could not apply, the shard has stopped.
+        self.error = None
+        # sequence -> user deltas reserved for a command the shard has not answered yet
+        self.reserved = {}
+        self.reader = None
+
+
+# Runs in the main process. Equities are partitioned over shard processes by equity_id, each shard owns the
+# books and contracts of its equities. The coordinator's engine stays the owner of user balances and margins:
+# a shard's user deltas are reserved on it before the shard commits, which checks the executing user's funds
+# against the only balances every shard sees, and are then forwarded to the other shards.
+class ShardCoordinator:
+    def __init__(self, trade_engine, shard_count, data, snapshot_path=None, journal_path=None):
+        self.trade_engine = trade_engine
+        self.shard_count = shard_count
+        self.sequence = 0
+        self.sequence_lock = threading.Lock()
+        self.shards = []
+
+        for shard_index in range(shard_count):
+            (connection, child_connection) = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=run_shard,
+                args=(
+                    child_connection,
+                    shard_index,
+                    shard_count,
+                    trade_engine.__class__,
+                    data,
+                    ShardCoordinator.get_shard_path(snapshot_path, shard_index),
+                    ShardCoordinator.get_shard_path(journal_path, shard_index)
+                ),
+                name="shard_" + str(shard_index)
+            )
+            process.daemon = True
+            process.start()
+            child_connection.close()
+
+            shard = Shard(shard_index, connection, process)
+            shard.reader = threading.Thread(target=self.read_replies, args=(shard,))
+            shard.reader.daemon = True
+            shard.reader.start()
+            self.shards.append(shard)
+
+    @staticmethod
+    def get_shard_path(path, shard_index):
+        return None if path is None else path + ".shard" + str(shard_index)
+
+    def get_shard(self, equity_id):
+        return self.shards[equity_id % self.shard_count]
+
+    def submit(self, equity_id, func, *args):
+        return self.submit_to_shard(self.get_shard(equity_id), func, args)
+
+    def submit_all(self, func, *args):
+        # One command per shard, each shard runs it over its own equities.
+        return [self.submit_to_shard(shard, func, args) for shard in self.shards]
+
+    def submit_to_shard(self, shard, func, args):
+        future = CommandFuture()
+
+        with self.sequence_lock:
+            self.sequence += 1
+            sequence = self.sequence
+
+        with shard.send_lock:
+            if shard.error is not None:
+                future.set_exception(Exception("ShardFailed"))
+                return future
+            shard.futures[sequence] = future
+            shard.connection.send((ShardMessage.COMMAND, sequence, func, args))
+
+        return future
+
+    def execute_user_command(self, func, *args):
+        # Commands that only change balances, like deposits, run on the coordinator and their deltas are
+        # forwarded to every shard.
+        user_deltas = self.trade_engine.execute_sequenced(None, "_execute_for_user_deltas", func, *args)
+        if len(user_deltas) > 0:
+            self.broadcast("_apply_user_deltas", (user_deltas,))
+
+    def send(self, shard, message):
+        with shard.send_lock:
+            if shard.error is None:
+                shard.connection.send(message)
+
+    def broadcast(self, func, args, skip_shard=None):
+        for shard in self.shards:
+            if shard is not skip_shard:
+                self.send(shard, (ShardMessage.COMMAND, None, func, args))
+
+    def reserve(self, shard, sequence, user_deltas, user_id):
+        error = None
+
+        try:
+            self.trade_engine.execute_sequenced(None, "_reserve_user_deltas", user_deltas, user_id)
+            shard.reserved[sequence] = user_deltas
+        except Exception as e:
+            error = str(e)
+
+        self.send(shard, (ShardMessage.RESERVED, sequence, error))
+
+    def cancel_user_orders(self, user_ids):
+        # Margin call cancels reported by a shard. The user's orders can rest on any shard, so every shard
+        # cancels its own. Nothing waits for them, the reply reader has to keep reading.
+        for user_id in user_ids:
+            self.submit_all("_cancel_user_orders", user_id)
+
+    def fail_shard(self, shard, error):
+        with shard.send_lock:
+            shard.error = error
+            futures = list(shard.futures.values())
+            shard.futures = {}
+
+        for future in futures:
+            future.set_exception(Exception("ShardFailed"))
+
+    def read_replies(self, shard):
+        while True:
+            try:
+                message = shard.connection.recv()
+            except EOFError:
+                break
+
+            if message[0] == ShardMessage.RESERVE:
+                (kind, sequence, user_deltas, user_id) = message
+                self.reserve(shard, sequence, user_deltas, user_id)
+                continue
+
+            if message[0] == ShardMessage.CANCEL:
+                self.cancel_user_orders(message[1])
+                continue
+
+            (kind, sequence, result, error) = message
+
+            if sequence is None:
+                # The shard could not apply forwarded user deltas and stopped.
+                self.fail_shard(shard, error)
+                continue
+
+            with shard.send_lock:
+                future = shard.futures.pop(sequence, None)
+            user_deltas = shard.reserved.pop(sequence, None)
+
+            if user_deltas is not None:
+                if error is None:
+                    self.broadcast("_apply_user_deltas", (user_deltas,), skip_shard=shard)
+                else:
+                    # The shard rolled the command back after the reservation, so it is given back.
+                    self.trade_engine.execute_sequenced(None, "_release_user_deltas", user_deltas)
+
+            if future is None:
+                continue
+
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(Exception(error))
+
+        with shard.send_lock:
+            futures = list(shard.futures.values())
+            shard.futures = {}
+
+        for future in futures:
+            future.set_exception(Exception("ShardStopped"))
+
+    def stop(self):
+        for shard in self.shards:
+            self.send(shard, (ShardMessage.STOP,))
+
+        for shard in self.shards:
+            shard.process.join()
+            shard.reader.join()
+            shard.connection.close()
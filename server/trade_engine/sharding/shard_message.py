@@ -0,0 +1,14 @@
+from enum import Enum
+
+
+# Kinds of the messages exchanged between the coordinator and a shard. The kind is the first item of every message:
+#   coordinator to shard: (COMMAND, sequence, func, args), (RESERVED, sequence, error) and (STOP,)
+#   shard to coordinator: (RESERVE, sequence, user_deltas, user_id), (RESULT, sequence, result, error) and
+#   (CANCEL, user_ids). A RESULT without a sequence reports a broadcast the shard failed to apply.
+class ShardMessage(Enum):
+    COMMAND = 0
+    RESERVE = 1
+    RESERVED = 2
+    RESULT = 3
+    STOP = 4
+    CANCEL = 5
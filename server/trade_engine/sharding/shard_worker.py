@@ -0,0 +1,83 @@
+from shard_message import ShardMessage
+from functools import partial
+from collections import deque
+import os
+
+
+# Entry point of a shard process. The shard loads its slice of the engine, then runs the commands the coordinator
+# routes to it and answers them with a RESULT message. Commands sent without a sequence are only applied.
+def run_shard(connection, shard_index, shard_count, trade_engine_class, data, snapshot_path, journal_path):
+    trade_engine = trade_engine_class()
+    trade_engine.init_shard(shard_index, shard_count, data, snapshot_path, journal_path)
+    ShardWorker(connection, shard_index, shard_count, trade_engine).run()
+
+
+class ShardWorker:
+    def __init__(self, connection, shard_index, shard_count, trade_engine):
+        self.connection = connection
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.trade_engine = trade_engine
+        # Messages that arrived while a command waited for its reservation.
+        self.pending = deque()
+
+    def receive(self):
+        if len(self.pending) > 0:
+            return self.pending.popleft()
+        return self.connection.recv()
+
+    def run(self):
+        while True:
+            try:
+                message = self.receive()
+            except EOFError:
+                return
+
+            if message[0] == ShardMessage.STOP:
+                return
+
+            (kind, sequence, func, args) = message
+
+            if sequence is None:
+                # User deltas of other shards, the coordinator has already reserved them. A shard that can not
+                # apply them no longer has the coordinator's balances, so it reports the error and stops.
+                try:
+                    self.trade_engine.execute_shard(None, self.cancel_user_orders, func, *args)
+                except Exception as e:
+                    self.connection.send((ShardMessage.RESULT, None, None, str(e)))
+                    self.fail_stop()
+                continue
+
+            try:
+                result = self.trade_engine.execute_shard(
+                    partial(self.reserve, sequence),
+                    self.cancel_user_orders,
+                    func,
+                    *args
+                )
+                reply = (ShardMessage.RESULT, sequence, result, None)
+            except Exception as e:
+                reply = (ShardMessage.RESULT, sequence, None, str(e))
+
+            self.connection.send(reply)
+
+    def reserve(self, sequence, user_deltas, user_id):
+        # Called with the command's changes still uncommitted. The coordinator owns the balances, the command is
+        # only committed once it has reserved the deltas there.
+        self.connection.send((ShardMessage.RESERVE, sequence, user_deltas, user_id))
+
+        while True:
+            message = self.connection.recv()
+            if message[0] == ShardMessage.RESERVED and message[1] == sequence:
+                break
+            self.pending.append(message)
+
+        if message[2] is not None:
+            raise Exception(message[2])
+
+    def cancel_user_orders(self, user_ids):
+        # Margin called users can have orders on every shard, the coordinator has each shard cancel its own.
+        self.connection.send((ShardMessage.CANCEL, user_ids))
+
+    def fail_stop(self):
+        os._exit(-1)
@@ -0,0 +1,51 @@
+from zlib import crc32
+import pickle
+import struct
+import mmap
+import os
+
+
+# "<magic, journal sequence, length, crc32>" followed by the pickled snapshot. The file is written next to its
+# final path and renamed over it, so a crash while writing leaves the previous snapshot in place.
+class SnapshotFile:
+    MAGIC = b"LFESNAP1"
+    HEADER = struct.Struct("<8sQQI")
+
+    @staticmethod
+    def write(path, sequence, data):
+        payload = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        temp_path = path + ".tmp"
+
+        with open(temp_path, "wb") as snapshot_file:
+            snapshot_file.write(SnapshotFile.HEADER.pack(
+                SnapshotFile.MAGIC,
+                sequence,
+                len(payload),
+                crc32(payload) & 0xffffffff
+            ))
+            snapshot_file.write(payload)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+
+        os.rename(temp_path, path)
+
+    @staticmethod
+    def read(path):
+        # Maps the file instead of reading it through a buffered file object. Slicing the map copies the
+        # payload out as a str, which is what pickle.loads takes on Python 2.
+        with open(path, "rb") as snapshot_file:
+            mapped = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            if len(mapped) < SnapshotFile.HEADER.size:
+                raise Exception("CorruptSnapshot")
+
+            (magic, sequence, length, checksum) = SnapshotFile.HEADER.unpack(mapped[:SnapshotFile.HEADER.size])
+            payload = mapped[SnapshotFile.HEADER.size:SnapshotFile.HEADER.size + length]
+        finally:
+            mapped.close()
+
+        if magic != SnapshotFile.MAGIC or len(payload) != length or crc32(payload) & 0xffffffff != checksum:
+            raise Exception("CorruptSnapshot")
+
+        return sequence, pickle.loads(payload)
@@ -0,0 +1,29 @@
+from trade_engine.group_commit.change_set import ChangeSet
+
+
+# Rebuilds the rows of a snapshot. With is_in_slice only the rows it accepts are loaded, a shard loads the rows of
+# its own equities this way.
+class SnapshotReader:
+    def __init__(self, data, is_in_slice=None):
+        self.is_in_slice = is_in_slice
+        self.classes = data["classes"]
+        self.columns = data["columns"]
+        self.rows = data["rows"]
+        self.state = data["state"]
+        self.items = [None] * len(self.rows)
+
+    def get_row(self, row_number):
+        item = self.items[row_number]
+
+        if item is None:
+            (class_number, values) = self.rows[row_number]
+            item = ChangeSet.build_item(self.classes[class_number], dict(zip(self.columns[class_number], values)))
+            self.items[row_number] = item
+
+        return item
+
+    def get_rows(self, row_numbers):
+        items = [self.get_row(row_number) for row_number in row_numbers]
+        if self.is_in_slice is None:
+            return items
+        return [item for item in items if self.is_in_slice(item)]
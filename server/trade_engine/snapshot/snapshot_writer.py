@@ -0,0 +1,35 @@
+# Collects the rows referenced by the engine's structures while a snapshot is captured. Every model object is
+# stored once, as a tuple of its column values, and the structures refer to it by its row number, so an order
+# shared by the order book and the user indices is written and loaded once.
+class SnapshotWriter:
+    def __init__(self):
+        self.row_numbers = {}
+        self.class_numbers = {}
+        self.classes = []
+        self.columns = []
+        self.rows = []
+
+    def add_row(self, item):
+        row_number = self.row_numbers.get(id(item))
+        if row_number is not None:
+            return row_number
+
+        model_class = item.__class__
+        class_number = self.class_numbers.get(model_class)
+        if class_number is None:
+            class_number = self.class_numbers[model_class] = len(self.classes)
+            self.classes.append(model_class)
+            self.columns.append(tuple(column.name for column in model_class.__table__.columns))
+
+        row_number = len(self.rows)
+        self.rows.append((class_number, tuple(getattr(item, column) for column in self.columns[class_number])))
+        self.row_numbers[id(item)] = row_number
+        return row_number
+
+    def get_data(self, state):
+        return {
+            "classes": self.classes,
+            "columns": self.columns,
+            "rows": self.rows,
+            "state": state
+        }
@@ -0,0 +1,25 @@
+import threading
+
+
+# Writes a snapshot of the engine every interval seconds. Capturing pauses commits while the rows are copied,
+# pickling and writing the file happen afterwards on this thread.
+class Snapshotter:
+    def __init__(self, trade_engine, path, interval):
+        self.trade_engine = trade_engine
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.snapshot_count = 0
+
+        self.thread = threading.Thread(target=self.run, name="snapshotter")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.trade_engine.take_snapshot(self.path)
+            self.snapshot_count += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
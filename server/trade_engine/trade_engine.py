@@ -1,18 +1,38 @@
-from transactional_data_structures.transactional import Transactional
+from transactional_data_structures.transactional import Transactional, transactional
 
 from transactional_data_structures.events import Events
+from transactional_data_structures.dirty_tracker import DirtyTracker
 from contract_list.contract_list import ContractList
 from equity_list.equity_list import EquityList
 from order_book.order_book import OrderBook
 from trading_fees.trading_fees import TradingFees
 from transaction_list.transaction_list import TransactionList
 from user_list.user_list import UserList
+from sequencer.sequencer import Sequencer
+from sharding.shard_coordinator import ShardCoordinator
+from execution_metrics.execution_metrics import ExecutionMetrics
+from group_commit.change_set import ChangeSet
+from group_commit.change_journal import ChangeJournal
+from group_commit.group_committer import GroupCommitter
+from command_journal.command_journal import CommandJournal
+from command_journal.replay_journal import replay_journal
+from snapshot.snapshot_writer import SnapshotWriter
+from snapshot.snapshot_reader import SnapshotReader
+from snapshot.snapshot_file import SnapshotFile
+from snapshot.snapshotter import Snapshotter
 from locks.reader_writer.reader_writer_lock_dic import ReaderWriterLockDic
 from locks.lock.lock_dic import LockDic
+from locks.lock_set import LockSet
+from locks.wait_for_graph import WaitForGraph
+from locks.deadlock_error import DeadlockError
+from locks.reader_writer.policy_reader_writer_lock import PolicyReaderWriterLock
 from app import db
-from helpers.helper import quick_sort, comparer, comparer_dec
+from timeit import default_timer
+import threading
+import os
 
 
+@transactional("contract_list", "equity_list", "order_book", "trading_fees", "transaction_list", "user_list")
 class TradeEngine(Transactional):
     def __init__(self):
         self.events = Events()
@@ -23,211 +43,625 @@ class TradeEngine(Transactional):
         self.trading_fees = TradingFees(self)
         self.transaction_list = TransactionList(self)
         self.user_list = UserList(self)
-        self.reader_writer_lock_dic = ReaderWriterLockDic()
-        self.lock_dic = LockDic()
+        self.wait_for_graph = WaitForGraph()
+        self.reader_writer_lock_dic = ReaderWriterLockDic(wait_for_graph=self.wait_for_graph)
+        self.lock_dic = LockDic(wait_for_graph=self.wait_for_graph)
+        self.lock_timeout = None
 
         self.new_locks = None
         self.new_reader_locks = None
         self.new_writer_locks = None
 
+        # Set while a sequencer, a shard or the shard coordinator runs a command. owned_equity_id is the one
+        # equity whose book the thread owns, None for none. Margin call cancels of orders on the other equities
+        # are collected in deferred_cancels instead of touching their books.
+        self.owned_equity_id = None
+        self.deferred_cancels = None
+
+        self.contexts = threading.local()
+        self.sequencer = None
+        self.shard_coordinator = None
+        self.metrics = ExecutionMetrics()
+        self.group_committer = None
+        self.command_journal = None
+        self.snapshotter = None
+        # Commits hold it for reading, capturing a snapshot for writing, so a snapshot never sees half a commit.
+        self.snapshot_lock = PolicyReaderWriterLock()
+        # Commits and journal appends happen under it as one step, so the journal has the commit order.
+        self.commit_lock = threading.Lock()
+
+    def clone_init(self):
+        self.events = Events()
+        self.tracker = DirtyTracker()
+
+    def get_context(self):
+        # Every thread keeps one context with its own events bus and overlays. Commit and roll back empty the
+        # overlays so the context is reused by the next call instead of cloning the engine again.
+        context = getattr(self.contexts, "context", None)
+        if context is None:
+            context = self.clone(root_name="trade_engine")
+            self.contexts.context = context
+
+        context.new_locks = None
+        context.new_reader_locks = None
+        context.new_writer_locks = None
+        context.owned_equity_id = None
+        context.deferred_cancels = None
+        # A fresh clone started without an executing user, the reused context must too.
+        context.order_book.executing_user_id = None
+        return context
+
+    def init(self, snapshot_path=None, journal_path=None, snapshot_interval=None):
+        # Loads the latest snapshot and runs only the journal commands that came after it. Without a snapshot the
+        # lists are initialized and the whole journal is replayed.
+        sequence = 0
+
+        if snapshot_path is not None and os.path.exists(snapshot_path):
+            sequence = self.restore_snapshot(snapshot_path)
+        else:
+            self.contract_list.initialize()
+            self.order_book.initialize()
+            self.transaction_list.initialize()
+
+        if journal_path is not None:
+            self.start_command_journal(journal_path, after_sequence=sequence)
+
+        if snapshot_path is not None and snapshot_interval is not None:
+            self.start_snapshots(snapshot_path, snapshot_interval)
+
+    def capture_snapshot(self):
+        writer = SnapshotWriter()
+
+        self.snapshot_lock.acquire_write()
+        try:
+            state = self.snapshot(writer)
+            sequence = 0 if self.command_journal is None else self.command_journal.sequence
+        finally:
+            self.snapshot_lock.release_write()
+
+        return sequence, writer.get_data(state)
+
+    def take_snapshot(self, path):
+        (sequence, data) = self.capture_snapshot()
+        SnapshotFile.write(path, sequence, data)
+        return sequence
+
+    def restore_snapshot(self, path):
+        # Has to run before the first operation, the per thread contexts are cloned from the restored state.
+        (sequence, data) = SnapshotFile.read(path)
+        reader = SnapshotReader(data)
+        self.load_snapshot(reader.state, reader)
+        return sequence
+
+    def start_snapshots(self, path, interval):
+        if self.snapshotter is None:
+            self.snapshotter = Snapshotter(self, path, interval)
+
+    def stop_snapshots(self):
+        if self.snapshotter is not None:
+            self.snapshotter.stop()
+            self.snapshotter = None
+
     def get_bitcoin_price(self):
         pass
 
+    def get_order_book_depth(self, equity, count=None):
+        return self.order_book.get_depth(equity, count)
+
+    def get_metrics(self):
+        return self.metrics.snapshot()
+
+    def reset_metrics(self):
+        self.metrics.reset()
+
+    def get_lock_stats(self):
+        return self.wait_for_graph.get_stats()
+
+    def reset_lock_stats(self):
+        self.wait_for_graph.reset_stats()
+
+    def get_conflict_keys(self, locks, reader_locks, writer_locks):
+        conflict_keys = []
+
+        for (held_locks, new_locks) in ((locks, self.new_locks), (reader_locks, self.new_reader_locks),
+                                        (writer_locks, self.new_writer_locks)):
+            if new_locks is not None:
+                for key in new_locks:
+                    if key not in held_locks:
+                        conflict_keys.append(key)
+
+        return conflict_keys
+
     def execute_func(self, quick_lock_func, func, *args, **kwargs):
-        context = self.clone(root_name="trade_engine")
+        context = self.get_context()
 
-        locks = {}
-        reader_locks = {}
-        writer_locks = {}
+        locks = LockSet()
+        reader_locks = LockSet()
+        writer_locks = LockSet()
+
+        durable = None
+        record = self.encode_command(func, args, kwargs)
+        attempts = 0
+        lock_growths = []
+        aborted_time = 0.0
+        conflict_keys = []
+
+        # The transaction keeps its age when a deadlock aborts it, so it wins the next cycle it is part of.
+        self.wait_for_graph.begin_transaction()
 
         try:
             if quick_lock_func is not None:
-                getattr(context, quick_lock_func)()
+                getattr(context, quick_lock_func)(*args, **kwargs)
 
-            (locks, reader_locks, writer_locks) = context.acquire_locks(locks, reader_locks, writer_locks)
             while True:
+                lock_count = len(locks) + len(reader_locks) + len(writer_locks)
+                try:
+                    (locks, reader_locks, writer_locks) = context.acquire_locks(locks, reader_locks, writer_locks)
+                except Exception as e:
+                    # acquire_locks let go of every lock before raising.
+                    locks = LockSet()
+                    reader_locks = LockSet()
+                    writer_locks = LockSet()
+                    if isinstance(e, DeadlockError):
+                        continue
+                    raise
+
+                if attempts > 0:
+                    lock_growths.append(len(locks) + len(reader_locks) + len(writer_locks) - lock_count)
+
+                attempts += 1
+                start = default_timer()
                 getattr(context, func)(*args, **kwargs)
                 if context.check_locks(locks, reader_locks, writer_locks):
                     try:
-                        context.commit(db)
+                        durable = self.commit_context(context, record)
                     except Exception:
                         # TODO: Send email to admin letting him know of critical failure.
                         exit(-1)
-
+                    break
                 else:
-                    context.roll_back()
-                    (locks, reader_locks, writer_locks) = context.acquire_locks(locks, reader_locks, writer_locks)
+                    context.tracker.roll_back()
+                    aborted_time += default_timer() - start
+                    conflict_keys.extend(context.get_conflict_keys(locks, reader_locks, writer_locks))
         except Exception as e:
+            context.tracker.roll_back()
             context.release_locks(locks, reader_locks, writer_locks)
             raise e
+        finally:
+            self.metrics.record(func, attempts, lock_growths, aborted_time, conflict_keys)
+            self.wait_for_graph.end_transaction()
 
         context.release_locks(locks, reader_locks, writer_locks)
 
+        if durable is not None:
+            self.wait_durable(durable)
+
+    def start_group_commit(self, journal_path=None, max_batch_size=256, max_delay=0.002):
+        if self.group_committer is None:
+            journal = None
+            if journal_path is not None:
+                journal = ChangeJournal(journal_path)
+                journal.replay(db)
+            self.group_committer = GroupCommitter(db, journal, max_batch_size, max_delay)
+
+    def stop_group_commit(self):
+        if self.group_committer is not None:
+            self.group_committer.stop()
+            if self.group_committer.journal is not None:
+                self.group_committer.journal.close()
+            self.group_committer = None
+
+    def start_command_journal(self, path, fsync_batch_size=64, fsync_delay=0.005, after_sequence=0):
+        # Commands already in the journal are run again first, so the engine picks up where it stopped.
+        if self.command_journal is None:
+            replay_journal(self, path, after_sequence)
+            self.command_journal = CommandJournal(path, fsync_batch_size, fsync_delay)
+
+    def stop_command_journal(self):
+        if self.command_journal is not None:
+            self.command_journal.close()
+            self.command_journal = None
+
+    def encode_command(self, func, args, kwargs=None):
+        if self.command_journal is None:
+            return None
+        return CommandJournal.encode(func, args, kwargs)
+
+    def commit_context(self, context, record):
+        # Commits the context's changes to the engine and journals the command's record from encode_command. Without group commit the rows are
+        # written to the database right away, otherwise they are queued. Returns what wait_durable waits on, the
+        # caller does so after letting go of its locks.
+        #
+        # The journal sequence is taken in the same critical section as the commit. Replay runs the commands in
+        # sequence order, so it has to be the order the commits, and the ids drawn under their locks, happened in.
+        future = None
+        sequence = None
+
+        self.snapshot_lock.acquire_read()
+        try:
+            with self.commit_lock:
+                if self.group_committer is None:
+                    context.tracker.commit(db)
+                else:
+                    change_set = ChangeSet()
+                    context.tracker.commit(change_set)
+                    future = self.group_committer.submit(change_set)
+
+                if self.command_journal is not None and record is not None:
+                    sequence = self.command_journal.append(record)
+        finally:
+            self.snapshot_lock.release_read()
+
+        if future is None and sequence is None:
+            return None
+
+        return future, sequence
+
+    def wait_durable(self, durable):
+        (future, sequence) = durable
+
+        if sequence is not None:
+            command_journal = self.command_journal
+            if command_journal is not None:
+                command_journal.wait_synced(sequence)
+
+        if future is not None:
+            future.result()
+
+    def start_sequencer(self):
+        if self.sequencer is None:
+            self.sequencer = Sequencer(self)
+
+    def stop_sequencer(self):
+        if self.sequencer is not None:
+            self.sequencer.stop()
+            self.sequencer = None
+
+    def execute_sequenced(self, equity_id, func, *args):
+        # Runs on the equity's sequencer thread, which owns that equity's book, or on a shard coordinator thread
+        # with equity_id None. Users are shared between equities, so the lock of every user the command can touch
+        # is reserved first, in sorted order so that two sequencers never wait on each other.
+        context = self.get_context()
+        record = self.encode_command(func, args)
+        context.owned_equity_id = equity_id
+        context.deferred_cancels = []
+
+        lock_keys = LockSet()
+        for user_id in getattr(context, "get" + func + "_user_ids")(*args):
+            lock_keys.add(self.lock_dic.get_lock_key(("user", user_id)))
+
+        for lock_key in lock_keys:
+            self.lock_dic.acquire(lock_key)
+
+        try:
+            try:
+                result = getattr(context, func)(*args)
+                durable = self.commit_context(context, record)
+            except Exception:
+                context.tracker.roll_back()
+                raise
+        finally:
+            for lock_key in reversed(lock_keys):
+                self.lock_dic.release(lock_key)
+
+        if context.deferred_cancels:
+            self.submit_deferred_cancels(context.deferred_cancels)
+
+        if durable is not None:
+            self.wait_durable(durable)
+
+        return result
+
+    def submit_deferred_cancels(self, deferred_cancels):
+        # Every (user_id, equity_id) cancel runs as a command of the equity's own sequencer or shard. It is not
+        # waited on, that sequencer may itself be waiting for the user locks this one just held.
+        for (user_id, equity_id) in sorted(set(deferred_cancels)):
+            if self.shard_coordinator is not None:
+                self.shard_coordinator.submit(equity_id, "_cancel_user_orders", user_id, equity_id)
+            else:
+                self.sequencer.submit(equity_id, "_cancel_user_orders", user_id, equity_id)
+
+    def start_shards(self, shard_count, snapshot_path=None, journal_path=None):
+        # Every shard starts from a snapshot of this engine, keeping its own slice of it. Shard snapshots and
+        # journals are kept next to snapshot_path and journal_path.
+        if self.shard_coordinator is None:
+            (sequence, data) = self.capture_snapshot()
+            self.shard_coordinator = ShardCoordinator(self, shard_count, data, snapshot_path, journal_path)
+
+    def stop_shards(self):
+        if self.shard_coordinator is not None:
+            self.shard_coordinator.stop()
+            self.shard_coordinator = None
+
+    def init_shard(self, shard_index, shard_count, data, snapshot_path=None, journal_path=None):
+        # A shard restarts from its own snapshot and journal. On its first start it loads its slice of the
+        # coordinator's snapshot, the rows of the equities with equity_id % shard_count == shard_index and
+        # every row without an equity, like the users, and saves that as its own first snapshot.
+        if snapshot_path is not None and os.path.exists(snapshot_path):
+            self.init(snapshot_path, journal_path)
+            return
+
+        reader = SnapshotReader(
+            data,
+            lambda item: getattr(item, "equity_id", None) is None or item.equity_id % shard_count == shard_index
+        )
+        self.load_snapshot(reader.state, reader)
+
+        if snapshot_path is not None:
+            self.take_snapshot(snapshot_path)
+
+        if journal_path is not None:
+            self.start_command_journal(journal_path)
+
+    def execute_shard(self, reserve, cancel, func, *args):
+        # Runs inside a shard process, which is the only writer of its equities. Before the command commits, its
+        # user changes are handed to reserve as deltas, together with the executing user. reserve raises when
+        # the coordinator, which owns the balances, turns them down. The ids of the users whose orders a margin
+        # call cancels are handed to cancel after the commit, their orders on the other shards are not loaded
+        # here, so the coordinator has every shard cancel its own.
+        context = self.get_context()
+        record = self.encode_command(func, args)
+        context.deferred_cancels = []
+
+        try:
+            result = getattr(context, func)(*args)
+            user_deltas = context.user_list.get_user_deltas()
+            if reserve is not None and len(user_deltas) > 0:
+                reserve(user_deltas, context.order_book.executing_user_id)
+            durable = self.commit_context(context, record)
+        except Exception:
+            context.tracker.roll_back()
+            raise
+
+        if context.deferred_cancels:
+            cancel(sorted(set(user_id for (user_id, equity_id) in context.deferred_cancels)))
+
+        if durable is not None:
+            self.wait_durable(durable)
+
+        return result
+
     def place_order(self, order):
+        if self.shard_coordinator is not None:
+            return self.shard_coordinator.submit(order.equity_id, "_place_order", order).result()
+        if self.sequencer is not None:
+            return self.sequencer.submit(order.equity_id, "_place_order", order).result()
         self.execute_func(None, "_place_order", order)
 
     def cancel_order(self, order):
+        if self.shard_coordinator is not None:
+            return self.shard_coordinator.submit(order.equity_id, "_cancel_order", order).result()
+        if self.sequencer is not None:
+            return self.sequencer.submit(order.equity_id, "_cancel_order", order).result()
         self.execute_func(None, "_cancel_order", order)
 
+    def cancel_user_orders(self, user_id, equity_id=None):
+        # One transaction and one lock acquisition for all the orders. A sequencer or the shards own the books
+        # per equity, so there the cancel runs once per equity or per shard.
+        if self.shard_coordinator is not None:
+            if equity_id is not None:
+                return self.shard_coordinator.submit(equity_id, "_cancel_user_orders", user_id, equity_id).result()
+            for future in self.shard_coordinator.submit_all("_cancel_user_orders", user_id):
+                future.result()
+            return
+        if self.sequencer is not None:
+            equity_ids = [equity_id] if equity_id is not None else self.user_list.get_open_equity_ids(user_id)
+            futures = [
+                self.sequencer.submit(order_equity_id, "_cancel_user_orders", user_id, order_equity_id)
+                for order_equity_id in equity_ids
+            ]
+            for future in futures:
+                future.result()
+            return
+        self.execute_func("lock_cancel_user_orders", "_cancel_user_orders", user_id, equity_id)
+
+    def cancel_equity_orders(self, equity_id):
+        if self.shard_coordinator is not None:
+            return self.shard_coordinator.submit(equity_id, "_cancel_equity_orders", equity_id).result()
+        if self.sequencer is not None:
+            return self.sequencer.submit(equity_id, "_cancel_equity_orders", equity_id).result()
+        self.execute_func("lock_cancel_equity_orders", "_cancel_equity_orders", equity_id)
+
     def deposit(self, user_id, amount):
+        if self.shard_coordinator is not None:
+            return self.shard_coordinator.execute_user_command("_deposit", user_id, amount)
         self.execute_func(None, "_deposit", user_id, amount)
 
     def withdrawal(self, user_id, amount):
+        if self.shard_coordinator is not None:
+            return self.shard_coordinator.execute_user_command("_withdrawal", user_id, amount)
         self.execute_func(None, "_withdrawal", user_id, amount)
 
     def update_bitcoin_price(self, new_bitcoin_price):
+        # The coordinator keeps the price for its funds checks, the shards update the margins of their equities.
+        if self.shard_coordinator is not None:
+            self.shard_coordinator.execute_user_command("_update_bitcoin_price", new_bitcoin_price)
+            for future in self.shard_coordinator.submit_all("_update_bitcoin_price", new_bitcoin_price):
+                future.result()
+            return
         self.execute_func(None, "_update_bitcoin_price", new_bitcoin_price)
 
     def pay_interest(self):
+        if self.shard_coordinator is not None:
+            for future in self.shard_coordinator.submit_all("_pay_interest"):
+                future.result()
+            return
         self.execute_func(None, "_pay_interest")
 
     def _place_order(self, order):
         self.order_book.place_order(order)
 
+    def get_place_order_user_ids(self, order):
+        return self.order_book.get_matching_user_ids(order)
+
     def _cancel_order(self, order):
         self.order_book.cancel_order(order)
 
-    def _deposit(self, user_id, amount):
-        pass
+    def get_cancel_order_user_ids(self, order):
+        live_order = self.order_book.get_order(order.equity_id, order.order_id)
+        return [order.user_id if live_order is None else live_order.user_id]
 
-    def _withdrawal(self, user_id, amount):
-        pass
+    def _cancel_user_orders(self, user_id, equity_id=None):
+        self.add_lock("user", user_id)
+        self.order_book.cancel_orders(self.user_list.get_open_orders(user_id, equity_id))
 
-    def _update_bitcoin_price(self, new_bitcoin_price):
-        pass
+    def get_cancel_user_orders_user_ids(self, user_id, equity_id=None):
+        return [user_id]
 
-    def acquire_locks(self, locks, reader_locks, writer_locks):
-        last_lock_type = ""
-        last_key = ""
+    def lock_cancel_user_orders(self, user_id, equity_id=None):
+        self.add_lock("user", user_id)
 
-        if self.new_locks is None:
-            self.new_locks = {}
+    def _cancel_equity_orders(self, equity_id):
+        # The locks taken up front cover these users unless an order of a new user arrived in between, then
+        # check_locks sends the transaction round again with the larger set.
+        orders = self.order_book.get_open_orders(equity_id)
+        for order in orders:
+            self.add_lock("user", order.user_id)
+        self.order_book.cancel_orders(orders)
 
-        if self.new_writer_locks is None:
-            self.new_writer_locks = {}
+    def get_cancel_equity_orders_user_ids(self, equity_id):
+        return sorted(set(order.user_id for order in self.order_book.get_open_orders(equity_id)))
 
-        if self.new_reader_locks is None:
-            self.new_reader_locks = {}
+    def lock_cancel_equity_orders(self, equity_id):
+        for user_id in self.get_cancel_equity_orders_user_ids(equity_id):
+            self.add_lock("user", user_id)
 
-        # Find common lock point between new locks and old locks
-        for key in quick_sort(self.new_writer_locks.keys(), comparer):
-            if key not in writer_locks:
-                last_lock_type = "writer_lock"
-                last_key = key
-                break
+    def _apply_user_deltas(self, user_deltas):
+        self.user_list.apply_user_deltas(user_deltas)
 
-        for key in quick_sort(self.new_reader_locks.keys(), comparer):
-            if key not in reader_locks:
-                last_lock_type = "reader_lock"
-                last_key = key
-                break
+    def _reserve_user_deltas(self, user_deltas, user_id=None):
+        self.user_list.reserve_user_deltas(user_deltas, user_id)
 
-        for key in quick_sort(self.new_locks.keys(), comparer):
-            if key not in locks:
-                last_lock_type = "lock"
-                last_key = key
-                break
+    def get_reserve_user_deltas_user_ids(self, user_deltas, user_id=None):
+        return [delta_user_id for (delta_user_id, balance, margin, margin_orders) in user_deltas]
 
-        if last_lock_type == "":
-            return
+    def _release_user_deltas(self, user_deltas):
+        self.user_list.apply_user_deltas([
+            (user_id, -balance, -margin, -margin_orders) for (user_id, balance, margin, margin_orders) in user_deltas
+        ])
 
-        # Release Locks
-        if last_lock_type == "lock" or last_lock_type == "reader_lock" or last_lock_type == "writer_lock":
-            for key in quick_sort(locks.keys(), comparer_dec):
-                if last_lock_type == "lock" and last_key > key:
-                    break
-                self.lock_dic.release(key)
+    def get_release_user_deltas_user_ids(self, user_deltas):
+        return [user_id for (user_id, balance, margin, margin_orders) in user_deltas]
 
-        if last_lock_type == "reader_lock" or last_lock_type == "writer_lock":
-            for key in quick_sort(locks.keys(), comparer_dec):
-                if last_lock_type == "reader_lock" and last_key > key:
-                    break
-                self.reader_writer_lock_dic.release_read(key)
-
-        if last_lock_type == "writer_lock":
-            for key in quick_sort(locks.keys(), comparer_dec):
-                if last_lock_type == "writer_lock" and last_key > key:
-                    break
-                self.reader_writer_lock_dic.release_write(key)
+    def _execute_for_user_deltas(self, func, *args):
+        getattr(self, func)(*args)
+        return self.user_list.get_user_deltas()
 
-        # Combine both locks
-        new_locks = {}
-        new_reader_locks = {}
-        new_writer_locks = {}
+    def get_execute_for_user_deltas_user_ids(self, func, *args):
+        return getattr(self, "get" + func + "_user_ids")(*args)
 
-        for key in self.new_locks:
-            new_locks[key] = True
+    def get_deposit_user_ids(self, user_id, amount):
+        return [user_id]
 
-        for key in self.new_reader_locks:
-            new_reader_locks[key] = True
+    def get_withdrawal_user_ids(self, user_id, amount):
+        return [user_id]
 
-        for key in self.new_writer_locks:
-            new_writer_locks[key] = True
+    def get_update_bitcoin_price_user_ids(self, new_bitcoin_price):
+        return []
 
-        for key in locks:
-            if key not in new_locks:
-                new_locks[key] = True
-
-        for key in reader_locks:
-            if key not in new_reader_locks:
-                new_reader_locks[key] = True
+    def _deposit(self, user_id, amount):
+        pass
 
-        for key in writer_locks:
-            if key not in new_writer_locks:
-                new_writer_locks[key] = True
+    def _withdrawal(self, user_id, amount):
+        pass
 
-        # Acquire new locks
-        if last_lock_type == "writer_lock":
-            for key in quick_sort(new_writer_locks.keys(), comparer):
-                if key >= last_key:
-                    self.reader_writer_lock_dic.acquire_write(key)
+    def _update_bitcoin_price(self, new_bitcoin_price):
+        pass
 
-        if last_lock_type == "writer_lock" or last_lock_type == "reader_lock":
-            for key in quick_sort(new_reader_locks.keys(), comparer):
-                if key >= last_key or last_lock_type == "writer_lock":
-                    self.reader_writer_lock_dic.acquire_read(key)
+    def add_lock(self, kind, key_id):
+        if self.new_locks is None:
+            self.new_locks = LockSet()
+        self.new_locks.add(self.lock_dic.get_lock_key((kind, key_id)))
 
-        if last_lock_type == "writer_lock" or last_lock_type == "reader_lock" or last_lock_type == "lock":
-            for key in quick_sort(new_reader_locks.keys(), comparer):
-                if key >= last_key or last_lock_type == "writer_lock" or last_lock_type == "reader_lock":
-                    self.locks.acquire(key)
+    def add_reader_lock(self, kind, key_id):
+        if self.new_reader_locks is None:
+            self.new_reader_locks = LockSet()
+        self.new_reader_locks.add(self.reader_writer_lock_dic.get_lock_key((kind, key_id)))
 
-        # Return Locks
-        return new_locks, new_reader_locks, new_writer_locks
+    def add_writer_lock(self, kind, key_id):
+        if self.new_writer_locks is None:
+            self.new_writer_locks = LockSet()
+        self.new_writer_locks.add(self.reader_writer_lock_dic.get_lock_key((kind, key_id)))
 
-    def check_locks(self, locks, reader_locks, writer_locks):
-        if len(writer_locks) != len(self.new_writer_locks):
-            return False
+    def __get_lock_funcs(self):
+        # Writer locks are taken before reader locks and reader locks before plain locks, each in key order.
+        return (
+            (self.reader_writer_lock_dic.acquire_write, self.reader_writer_lock_dic.release_write),
+            (self.reader_writer_lock_dic.acquire_read, self.reader_writer_lock_dic.release_read),
+            (self.lock_dic.acquire, self.lock_dic.release)
+        )
 
-        if len(reader_locks) != len(self.new_reader_locks):
-            return False
+    def acquire_locks(self, locks, reader_locks, writer_locks):
+        held = (writer_locks, reader_locks, locks)
+        wanted = (
+            writer_locks.union(self.new_writer_locks),
+            reader_locks.union(self.new_reader_locks),
+            locks.union(self.new_locks)
+        )
+
+        # Find common lock point between new locks and old locks. The wanted sets contain the held ones, so
+        # everything held past that point has to be released and taken again in order.
+        lock_type = 0
+        prefix_length = 0
+        while lock_type < len(held):
+            prefix_length = held[lock_type].common_prefix_length(wanted[lock_type])
+            if prefix_length < len(wanted[lock_type]):
+                break
+            lock_type += 1
 
-        if len(locks) != len(self.new_locks):
-            return False
+        if lock_type == len(held):
+            return locks, reader_locks, writer_locks
 
-        for key in self.new_locks.keys():
-            if key not in locks[key]:
-                return False
+        lock_funcs = self.__get_lock_funcs()
 
-        for key in self.new_writer_locks.keys():
-            if key not in writer_locks[key]:
-                return False
+        # Release Locks
+        for release_type in range(len(held) - 1, lock_type - 1, -1):
+            keys = held[release_type].keys
+            release = lock_funcs[release_type][1]
+            stop = prefix_length if release_type == lock_type else 0
+            for index in range(len(keys) - 1, stop - 1, -1):
+                release(keys[index])
+
+        # Acquire new locks. On a timeout or a deadlock every lock is let go before raising, so the caller
+        # starts again from empty lock sets.
+        acquired = []
+        try:
+            for acquire_type in range(lock_type, len(held)):
+                keys = wanted[acquire_type].keys
+                acquire = lock_funcs[acquire_type][0]
+                start = prefix_length if acquire_type == lock_type else 0
+                for index in range(start, len(keys)):
+                    if not acquire(keys[index], self.lock_timeout):
+                        raise Exception("LockTimeout")
+                    acquired.append((acquire_type, keys[index]))
+        except Exception:
+            for (acquire_type, key) in reversed(acquired):
+                lock_funcs[acquire_type][1](key)
+            for release_type in range(lock_type, -1, -1):
+                keys = held[release_type].keys
+                stop = prefix_length if release_type == lock_type else len(keys)
+                for index in range(stop - 1, -1, -1):
+                    lock_funcs[release_type][1](keys[index])
+            raise
 
-        for key in self.new_reader_locks.keys():
-            if key not in reader_locks[key]:
-                return False
+        # Return Locks
+        return wanted[2], wanted[1], wanted[0]
 
-        return True
+    def check_locks(self, locks, reader_locks, writer_locks):
+        return writer_locks.contains_all(self.new_writer_locks) and \
+            reader_locks.contains_all(self.new_reader_locks) and \
+            locks.contains_all(self.new_locks)
 
     def release_locks(self, locks, reader_locks, writer_locks):
-        for key in quick_sort(locks.keys(), comparer_dec):
-            self.lock_dic.release(key)
+        lock_funcs = self.__get_lock_funcs()
 
-        for key in quick_sort(reader_locks.keys(), comparer_dec):
-            self.reader_writer_lock_dic.release_read(key)
+        for key in reversed(locks):
+            lock_funcs[2][1](key)
 
-        for key in quick_sort(writer_locks.keys(), comparer_dec):
-            self.reader_writer_lock_dic.release_write(key)
+        for key in reversed(reader_locks):
+            lock_funcs[1][1](key)
 
+        for key in reversed(writer_locks):
+            lock_funcs[0][1](key)
 
 trade_engine = TradeEngine()
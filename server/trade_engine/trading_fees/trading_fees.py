@@ -1,8 +1,9 @@
-from transactional_data_structures.transactional import Transactional
+from transactional_data_structures.transactional import Transactional, transactional
 from models.models.user import User
 import math
 
 
+@transactional()
 class TradingFees(Transactional):
     MAKER_FEE = 0.0005
     TAKER_FEE = 0.001
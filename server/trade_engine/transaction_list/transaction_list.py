@@ -1,4 +1,5 @@
-from transactional_data_structures.transactional import Transactional
+from transactional_data_structures.transactional import Transactional, transactional
+from transactional_data_structures.events import Events
 from transactional_data_structures.dictionary_array_version import DictionaryArrayVersion
 from transactional_data_structures.dictionary_auto_incrementer_version import DictionaryAutoIncrementerVersion
 from models.models.transaction import Transaction
@@ -6,7 +7,10 @@ from models.models.transaction_id import TransactionId
 import datetime
 import math
 
+TRANSACTIONS_INSERT_ITEM = Events.get_event_id("transactions_insert_item")
 
+
+@transactional("transactions", "transactions_id")
 class TransactionList(Transactional):
     def __init__(self):
         pass
@@ -20,7 +24,8 @@ class TransactionList(Transactional):
             "equity_id",
             model_name="transactions",
             events=self.trade_engine.events,
-            update_db=True
+            update_db=True,
+            key=Transaction.id_key
         )
 
         self.transactions_id = DictionaryAutoIncrementerVersion(
@@ -33,6 +38,7 @@ class TransactionList(Transactional):
     def subscribe_to_events(self, events):
         events.subscribe("match_orders", self.match_orders)
         events.subscribe("transfer_funds", self.match_orders)
+        events.subscribe("sweep_orders", self.sweep_orders)
 
     def initialize(self):
         return
@@ -40,15 +46,22 @@ class TransactionList(Transactional):
     def get_next_id(self, transaction):
         self.transactions_id.get_next_id(transaction)
 
-    def match_orders(self, order, matched_order):
-        self.trade_engine.trigger(
-            "transactions_insert_item",
+    def match_orders(self, order, matched_order, is_margin_call=False):
+        self.insert_transaction(order, matched_order, min(order.quantity, matched_order.quantity))
+
+    def sweep_orders(self, order, fills, is_margin_call=False):
+        for (matched_order, quantity) in fills:
+            self.insert_transaction(order, matched_order, quantity)
+
+    def insert_transaction(self, order, matched_order, quantity):
+        self.trade_engine.events.trigger_id(
+            TRANSACTIONS_INSERT_ITEM,
             Transaction(
                 equity_id=order.equity_id,
                 transaction_id=self.get_next_id(order),
                 user_id_long=order.user_id if order.is_long else matched_order.user_id,
                 user_id_short=matched_order.user_id if order.is_long else order.user_id,
-                quantity=min(order.quantity, matched_order.quantity),
+                quantity=quantity,
                 price=matched_order.price,
                 is_buy=order.is_long,
                 created_date=datetime.datetime.utcnow()
@@ -56,8 +69,8 @@ class TransactionList(Transactional):
         )
 
     def transfer_funds(self, user_long, user_short, amount):
-        self.trade_engine.trigger(
-            "transactions_insert_item",
+        self.trade_engine.events.trigger_id(
+            TRANSACTIONS_INSERT_ITEM,
             Transaction(
                 equity_id=0,
                 transaction_id=self.get_next_id(Transaction(entity_id=0)),
@@ -1,4 +1,5 @@
-from transactional_data_structures.transactional import Transactional
+from transactional_data_structures.transactional import Transactional, transactional
+from transactional_data_structures.events import Events
 from transactional_data_structures.dictionary_dictionary_version import DictionaryDictionaryVersion
 
 from models.models.contract import Contract, ContractStatus
@@ -6,7 +7,14 @@ from models.models.order import Order, OrderType, OrderStatus
 import datetime
 import math
 
+CONTRACTS_UPDATE_ITEM = Events.get_event_id("contracts_update_item")
+CONTRACTS_INSERT_ITEM = Events.get_event_id("contracts_insert_item")
+USERS_UPDATE_ITEM = Events.get_event_id("users_update_item")
+CANCEL_ORDER = Events.get_event_id("cancel_order")
+INSOLVENT_MARGIN_CALL = Events.get_event_id("insolvent_margin_call")
 
+
+@transactional("contracts")
 class UserContracts(Transactional):
     def __init__(self):
         pass
@@ -61,7 +69,7 @@ class UserContracts(Transactional):
                 new_contract.status = ContractStatus.CLOSED
                 new_contract.closed_date = datetime.datetime.utcnow()
 
-            self.trade_engine.events.trigger("contracts_update_item", new_contract, old_contract, is_maker)
+            self.trade_engine.events.trigger_id(CONTRACTS_UPDATE_ITEM, new_contract, old_contract, is_maker)
 
         if new_contract_quantity != 0:
             contract_id = self.get_next_id(order)
@@ -79,7 +87,7 @@ class UserContracts(Transactional):
                 closed_date=None
             )
 
-            self.trade_engine.events.trigger("contracts_insert_item", new_contract, is_maker)
+            self.trade_engine.events.trigger_id(CONTRACTS_INSERT_ITEM, new_contract, is_maker)
 
     def user_has_contracts(self, user):
         user_contracts = self.contract.dic[user.user_id]
@@ -132,10 +140,10 @@ class UserContracts(Transactional):
             if not user.is_margin_called:
                 new_user = user.clone()
                 new_user.is_margin_called = True
-                self.trade_engine.events.trigger("users_update_item", new_user, user)
+                self.trade_engine.events.trigger_id(USERS_UPDATE_ITEM, new_user, user)
 
             if self.trade_engine.order_book.place_order(market_order, is_margin_call=True):
-                self.trade_engine.events.trigger("cancel_order", market_order)
+                self.trade_engine.events.trigger_id(CANCEL_ORDER, market_order)
 
                 user = self.trade_engine.user_list.get_user(user)
 
@@ -165,14 +173,14 @@ class UserContracts(Transactional):
                     user_balance_updates = []
                     for insolvent_contract in insolvent_contracts:
                         balance = math.ceil((insolvent_contract.price / total_price) * user.balance)
-                        self.trade_engine.events.trigger("insolvent_margin_call", equity, insolvent_contract, balance, user_balance_updates)
+                        self.trade_engine.events.trigger_id(INSOLVENT_MARGIN_CALL, equity, insolvent_contract, balance, user_balance_updates)
 
                     for user_balance_update in user_balance_updates:
                         user = self.trade_engine.user_list.get_user(user_balance_update)
 
                         new_user = user.clone()
                         new_user.add_to_balance_and_margin(-user_balance_update.balance, 0, 0, price_btc)
-                        self.trade_engine.events.trigger("users_update_item", new_user, user)
+                        self.trade_engine.events.trigger_id(USERS_UPDATE_ITEM, new_user, user)
 
                 if user.is_margin_called and not self.user_has_contracts(user):
                     if new_user is None:
@@ -182,6 +190,6 @@ class UserContracts(Transactional):
                     new_user.is_margin_called = False
 
                 if new_user is not None:
-                    self.trade_engine.events.trigger("users_update_item", new_user, user)
+                    self.trade_engine.events.trigger_id(USERS_UPDATE_ITEM, new_user, user)
 
             return
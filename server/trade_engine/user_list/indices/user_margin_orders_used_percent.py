@@ -1,9 +1,12 @@
-from transactional_data_structures.transactional import Transactional
-from transactional_data_structures.events import EventReturnType
+from transactional_data_structures.transactional import Transactional, transactional
+from transactional_data_structures.events import EventReturnType, Events
 from transactional_data_structures.versioned_ordered_array import VersionedOrderedArray
 from models.models.user import User
 
+USER_ORDER_MARGIN_CALL = Events.get_event_id("user_order_margin_call")
 
+
+@transactional("users")
 class UserMarginOrdersUsedPercent(Transactional):
     def __int__(self):
         pass
@@ -15,6 +18,7 @@ class UserMarginOrdersUsedPercent(Transactional):
             [],
             None,
             User.margin_used_orders_percent_comparer_dec,
+            key=User.margin_used_orders_percent_key_dec
         )
 
     def subscribe_to_events(self, events):
@@ -28,7 +32,7 @@ class UserMarginOrdersUsedPercent(Transactional):
         for user in self.users:
             if user.margin_used_orders_percent / bitcoin_price >= 1.0:
                 executed_margin_call = True
-                self.trade_engine.events.trigger("user_order_margin_call", user)
+                self.trade_engine.events.trigger_id(USER_ORDER_MARGIN_CALL, user)
             else:
                 break
 
@@ -1,9 +1,13 @@
-from transactional_data_structures.transactional import Transactional
-from transactional_data_structures.events import EventReturnType
+from transactional_data_structures.transactional import Transactional, transactional
+from transactional_data_structures.events import EventReturnType, Events
 from transactional_data_structures.versioned_ordered_array import VersionedOrderedArray
 from models.models.user import User
 
+CHECK_MARGIN_ORDERS = Events.get_event_id("check_margin_orders")
+USER_MARGIN_CALL = Events.get_event_id("user_margin_call")
 
+
+@transactional("users")
 class UserMarginUsedPercent(Transactional):
     def __int__(self):
         pass
@@ -15,6 +19,7 @@ class UserMarginUsedPercent(Transactional):
             [],
             None,
             User.margin_used_percent_comparer_dec,
+            key=User.margin_used_percent_key_dec
         )
 
     def subscribe_to_events(self, events):
@@ -29,7 +34,7 @@ class UserMarginUsedPercent(Transactional):
 
         while True:
             if did_margin_call:
-                self.trade_engine.events.trigger("check_margin_orders")
+                self.trade_engine.events.trigger_id(CHECK_MARGIN_ORDERS)
 
             for user in self.users:
                 if user.margin_used_percent / bitcoin_price >= 1.0:
@@ -40,7 +45,7 @@ class UserMarginUsedPercent(Transactional):
                     break
 
             if margin_user is not None:
-                self.trade_engine.events.trigger("user_margin_call", margin_user)
+                self.trade_engine.events.trigger_id(USER_MARGIN_CALL, margin_user)
             else:
                 break
 
@@ -1,10 +1,15 @@
-from transactional_data_structures.transactional import Transactional
+from transactional_data_structures.transactional import Transactional, transactional
+from transactional_data_structures.events import Events
 from transactional_data_structures.dictionary_dictionary_array_version import DictionaryDictionaryArrayVersion
 from models.models.order import Order
 from models.models.contract import Contract
 from helpers.helper import insert_sorted, quick_sort
 import math
 
+CANCEL_ORDER = Events.get_event_id("cancel_order")
+
+
+@transactional("orders")
 class UserOrders(Transactional):
     def __init__(self):
         pass
@@ -19,7 +24,8 @@ class UserOrders(Transactional):
             "equity_id",
             is_in_list=Order.is_opened,
             model_name="orders",
-            events=self.trade_engine.events
+            events=self.trade_engine.events,
+            key=Order.effective_price_key_dec
         )
 
     def subscribe_to_events(self, events):
@@ -160,11 +166,9 @@ class UserOrders(Transactional):
         amount["margin_orders"] += amount_with_new_equity - amount_with_old_equity
 
     def user_order_margin_call(self, user):
-        user_orders = self.orders.dic[user.user_id]
-
         orders_to_cancel = []
 
-        for key in user_orders.keys():
+        for key in self.orders.get_keys(user.user_id):
             order = Order()
             order.equity_id = key
             order.user_id = user.user_id
@@ -180,5 +184,13 @@ class UserOrders(Transactional):
             if user.user_id == self.trade_engine.order_book.executing_user_id:
                 raise Exception("InsufficientFunds")
 
+        deferred_cancels = self.trade_engine.deferred_cancels
+
         for order_to_cancel in orders_to_cancel:
-            self.trade_engine.events.trigger("cancel_order", order_to_cancel, True)
+            if deferred_cancels is not None and order_to_cancel.equity_id != self.trade_engine.owned_equity_id:
+                # This thread does not own that book, its sequencer or shard cancels the orders once this command
+                # has committed.
+                deferred_cancels.append((user.user_id, order_to_cancel.equity_id))
+                continue
+
+            self.trade_engine.events.trigger_id(CANCEL_ORDER, order_to_cancel, True)
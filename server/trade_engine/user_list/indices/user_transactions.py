@@ -1,8 +1,9 @@
-from transactional_data_structures.transactional import Transactional
+from transactional_data_structures.transactional import Transactional, transactional
 from transactional_data_structures.dictionary_dictionary_array_version import DictionaryDictionaryArrayVersion
 from models.models.transaction import Transaction
 
 
+@transactional("transactions")
 class UserTransactions(Transactional):
     def __init__(self):
         pass
@@ -17,6 +18,7 @@ class UserTransactions(Transactional):
             "equity_id",
             key_1_resolver=Transaction.get_user_ids,
             model_name="transactions",
-            events=self.trade_engine.events
+            events=self.trade_engine.events,
+            key=Transaction.id_key
         )
 
@@ -1,4 +1,4 @@
-from transactional_data_structures.transactional import Transactional
+from transactional_data_structures.transactional import Transactional, transactional
 from transactional_data_structures.dictionary_version import DictionaryVersion
 from transactional_data_structures.events import EventPriority, Events, EventReturnType
 
@@ -6,8 +6,17 @@ from indices.user_orders import UserOrders
 from indices.user_contracts import UserContracts
 from indices.user_transactions import UserTransactions
 from models.models.equity import Equity
+from models.models.order import Order
 
+USERS_UPDATE_ITEM = Events.get_event_id("users_update_item")
+GET_PLACE_ORDER_AMOUNT = Events.get_event_id("get_place_order_amount")
+GET_EXECUTE_ORDER_AMOUNT = Events.get_event_id("get_execute_order_amount")
+USER_UPDATE_EQUITY_PRICE = Events.get_event_id("user_update_equity_price")
+CHECK_MARGIN_ORDERS = Events.get_event_id("check_margin_orders")
+CHECK_MARGIN = Events.get_event_id("check_margin")
 
+
+@transactional("users", "user_orders", "user_contracts", "user_transactions")
 class UserList(Transactional):
     def __init__(self):
         pass
@@ -22,9 +31,13 @@ class UserList(Transactional):
 
         self.subscribe_to_events(trade_engine.events)
 
+    def clone_init(self):
+        self.subscribe_to_events(self.trade_engine.events)
+
     def subscribe_to_events(self, events):
         events.subscribe("place_order", self.user_can_place_order, EventPriority.VALIDATION)
         events.subscribe("match_orders", self.check_user_can_execute_order, EventPriority.VALIDATION)
+        events.subscribe("sweep_orders", self.check_user_can_execute_sweep, EventPriority.VALIDATION)
 
         events.subscribe("place_order", self.place_order)
         events.subscribe("make_contract", self.make_contract, EventPriority.PRE_EVENT)
@@ -40,9 +53,78 @@ class UserList(Transactional):
     def get_user(self, user):
         return self.users.get_item(user)
 
+    def get_user_deltas(self):
+        # Balance and margin changes of this transaction as (user_id, balance, margin, margin_orders) deltas.
+        user_deltas = []
+
+        for user_id in self.users.update_items.keys():
+            old_user = self.users.dic.get(user_id)
+            if old_user is None:
+                continue
+
+            new_user = self.users.update_items[user_id]
+            user_deltas.append((
+                user_id,
+                new_user.balance - old_user.balance,
+                new_user.margin_used - old_user.margin_used,
+                new_user.margin_used_orders - old_user.margin_used_orders
+            ))
+
+        return user_deltas
+
+    def apply_user_deltas(self, user_deltas):
+        btc_price = self.trade_engine.get_bitcoin_price()
+
+        for (user_id, balance, margin, margin_orders) in user_deltas:
+            old_user = self.users.get_item_from_key(user_id)
+            if old_user is None:
+                continue
+
+            new_user = old_user.clone()
+            new_user.add_to_balance_and_margin(balance, margin, margin_orders, btc_price)
+            self.trade_engine.events.trigger_id(USERS_UPDATE_ITEM, new_user, old_user)
+
+    def reserve_user_deltas(self, user_deltas, user_id=None):
+        # A shard checks funds against its own copy of the users, which can be behind the other shards. The
+        # executing user's deltas are checked again here, against the balances every shard reports to, before
+        # they are applied, so two shards can not both spend the same balance.
+        btc_price = self.trade_engine.get_bitcoin_price()
+
+        for (delta_user_id, balance, margin, margin_orders) in user_deltas:
+            if delta_user_id != user_id or (balance >= 0 and margin <= 0 and margin_orders <= 0):
+                continue
+
+            user = self.users.get_item_from_key(delta_user_id)
+            if user is None:
+                continue
+
+            balance_btc = user.balance + balance
+
+            if (user.margin_used + margin) / btc_price >= balance_btc or \
+                    (user.margin_used_orders + margin_orders) / btc_price >= balance_btc:
+                raise Exception("InsufficientFunds")
+
+        self.apply_user_deltas(user_deltas)
+
     def get_user_orders(self, order):
         return self.user_orders.orders.get_list(order)
 
+    def get_open_equity_ids(self, user_id):
+        return self.user_orders.orders.get_keys(user_id)
+
+    def get_open_orders(self, user_id, equity_id=None):
+        # Every open order of the user, or of the user on one equity.
+        equity_ids = self.get_open_equity_ids(user_id) if equity_id is None else [equity_id]
+        orders = []
+
+        for order_equity_id in equity_ids:
+            index_object = Order()
+            index_object.user_id = user_id
+            index_object.equity_id = order_equity_id
+            orders.extend(self.user_orders.orders.get_list(index_object))
+
+        return orders
+
     def check_has_sufficient_funds(self, user, amount):
         btc_price = self.trade_engine.get_bitcoin_price()
 
@@ -67,12 +149,12 @@ class UserList(Transactional):
             btc_price
         )
 
-        self.trade_engine.events.trigger("users_update_item", new_user, old_user)
+        self.trade_engine.events.trigger_id(USERS_UPDATE_ITEM, new_user, old_user)
 
     def check_user_can_place_order(self, order):
         user = self.users.get_item(order)
         amount = {"margin": user.margin_used, "margin_orders": 0.0, "delta_balance": 0.0}
-        self.trade_engine.events.trigger("get_place_order_amount", order, amount)
+        self.trade_engine.events.trigger_id(GET_PLACE_ORDER_AMOUNT, order, amount)
         self.check_has_sufficient_funds(user, amount)
 
     def check_user_can_execute_order(self, order, matched_order, is_margin_call):
@@ -90,19 +172,43 @@ class UserList(Transactional):
         new_order.quantity = min(order.quantity, matched_order.quantity)
         new_order.price = matched_order.price
 
-        self.trade_engine.events.trigger("get_execute_order_amount", new_order, amount)
+        self.trade_engine.events.trigger_id(GET_EXECUTE_ORDER_AMOUNT, new_order, amount)
+        self.check_has_sufficient_funds(user, amount)
+
+    def check_user_can_execute_sweep(self, order, fills, is_margin_call):
+        if is_margin_call:
+            return
+
+        user = self.users.get_item(order)
+        if user.is_margin_called:
+            raise Exception("UserIsExecutingMarginCall")
+
+        # One check against the whole sweep, priced at the average fill price so the notional matches the fills.
+        quantity = 0
+        total = 0
+        for (matched_order, fill_quantity) in fills:
+            quantity += fill_quantity
+            total += fill_quantity * matched_order.price
+
+        amount = {"margin": 0, "margin_orders": 0, "delta_balance": 0.0}
+
+        new_order = order.clone()
+        new_order.quantity = quantity
+        new_order.price = float(total) / quantity
+
+        self.trade_engine.events.trigger_id(GET_EXECUTE_ORDER_AMOUNT, new_order, amount)
         self.check_has_sufficient_funds(user, amount)
 
     def place_order(self, order):
         user = self.users.get_item(order)
         amount = {"margin": user.margin_used, "margin_orders": 0.0, "delta_balance": 0.0}
-        self.trade_engine.events.trigger("get_place_order_amount", order, amount)
+        self.trade_engine.events.trigger_id(GET_PLACE_ORDER_AMOUNT, order, amount)
         self.update_user_margin(user, amount)
 
     def make_contract(self, order, is_maker):
         user = self.users.get_item(order)
         amount = {"margin": 0, "margin_orders": 0, "delta_balance": 0.0}
-        self.trade_engine.events.trigger("get_execute_order_amount", order, amount, is_maker)
+        self.trade_engine.events.trigger_id(GET_EXECUTE_ORDER_AMOUNT, order, amount, is_maker)
         self.update_user_balance_and_margin(user, amount)
 
     def set_equities_price(self, new_equity, old_equity):
@@ -119,12 +225,12 @@ class UserList(Transactional):
         for unique_user in unique_users:
             user = self.users.get_item(unique_user)
             amount = {"margin": 0, "margin_orders": 0, "delta_balance": 0.0}
-            self.trade_engine.events.trigger("user_update_equity_price", user, new_equity, old_equity, amount)
+            self.trade_engine.events.trigger_id(USER_UPDATE_EQUITY_PRICE, user, new_equity, old_equity, amount)
             self.update_user_balance_and_margin(user, amount)
 
     def check_margins(self):
-        if not Events.executed(self.trade_engine.events.trigger("check_margin_orders")):
-            if not Events.executed(self.trade_engine.events.trigger("check_margin")):
+        if not Events.executed(self.trade_engine.events.trigger_id(CHECK_MARGIN_ORDERS)):
+            if not Events.executed(self.trade_engine.events.trigger_id(CHECK_MARGIN)):
                 return EventReturnType.CONTINUE
         return EventReturnType.STOP
 
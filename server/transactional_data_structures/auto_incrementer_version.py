@@ -13,15 +13,24 @@ class AutoIncrementerVersion(Transactional):
         return getattr(self.obj, self.id_column_name)
 
     def get_next_id(self):
+        self.mark_dirty()
+
         if self.new_value is None:
             self.new_value = getattr(self.obj, self.id_column_name)
         result = self.new_value
         self.new_value += 1
         return result
 
-    def clone(self):
+    def snapshot(self, writer):
+        return getattr(self.obj, self.id_column_name)
+
+    def load_snapshot(self, state, reader):
+        setattr(self.obj, self.id_column_name, state)
+
+    def clone(self, root_name="root", root=None):
         result = AutoIncrementerVersion(self.obj, self.id_column_name)
         result.new_value = self.new_value
+        result.tracker = None if root is None else root.tracker
         return result
 
     def commit(self, db):
@@ -0,0 +1,299 @@
+from helpers.helper import binary_search_key, comparer_key
+from sorted_array import merge_sorted
+from bisect import bisect_left, bisect_right
+
+
+def split_leaf(items, load):
+    # Chunks of load items, a short tail joins the chunk before it so no leaf drops below load // 2.
+    result = [items[i:i + load] for i in range(0, len(items), load)]
+    if len(result) > 1 and len(result[-1]) < load // 2:
+        result[-2].extend(result.pop())
+    return result
+
+
+# Two level B+-tree: sorted leaves of at most 2 * load items, the last key of every leaf kept in
+# maxes for searching and a Fenwick tree over the leaf lengths for index lookups and ranks.
+class BTreeArray:
+    LOAD = 256
+
+    def __init__(self, comparer, items=None, key=None, load=LOAD):
+        self.comparer = comparer
+        self.key = comparer_key(comparer) if key is None else key
+        self.load = load
+        self.leaves = []
+        self.leaf_keys = []
+        self.maxes = []
+        self.index_tree = []
+        self.length = 0
+
+        if items is not None:
+            for leaf in split_leaf(items, load):
+                self.leaves.append(leaf)
+                self.leaf_keys.append([self.key(item) for item in leaf])
+            self.length = len(items)
+            self.__rebuild()
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for leaf in self.leaves:
+            for item in leaf:
+                yield item
+
+    def __reversed__(self):
+        for leaf in reversed(self.leaves):
+            for item in reversed(leaf):
+                yield item
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.length
+
+        if index < 0 or index >= self.length:
+            raise IndexError("BTreeArray index out of range")
+
+        (leaf_index, offset) = self.__locate_index(index)
+        return self.leaves[leaf_index][offset]
+
+    def __rebuild(self):
+        self.maxes = [keys[-1] for keys in self.leaf_keys]
+        self.index_tree = [len(leaf) for leaf in self.leaves]
+
+        size = len(self.index_tree)
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                self.index_tree[parent - 1] += self.index_tree[i - 1]
+
+    def __update_index(self, leaf_index, delta):
+        i = leaf_index + 1
+        size = len(self.index_tree)
+        while i <= size:
+            self.index_tree[i - 1] += delta
+            i += i & -i
+
+    def __leaf_offset(self, leaf_index):
+        total = 0
+        i = leaf_index
+        while i > 0:
+            total += self.index_tree[i - 1]
+            i -= i & -i
+        return total
+
+    def __locate_index(self, index):
+        size = len(self.index_tree)
+        position = 0
+        step = 1
+        while step * 2 <= size:
+            step *= 2
+
+        while step > 0:
+            if position + step <= size and self.index_tree[position + step - 1] <= index:
+                position += step
+                index -= self.index_tree[position - 1]
+            step //= 2
+
+        return position, index
+
+    def __locate_leaf(self, key):
+        return min(bisect_left(self.maxes, key), len(self.leaves) - 1)
+
+    def index_of(self, item):
+        return self.index_of_key(self.key(item))
+
+    def index_of_key(self, key):
+        if self.length == 0:
+            return -1
+
+        leaf_index = self.__locate_leaf(key)
+        offset = binary_search_key(self.leaf_keys[leaf_index], key)
+        leaf_offset = self.__leaf_offset(leaf_index)
+
+        if offset >= 0:
+            return leaf_offset + offset
+        return offset - leaf_offset
+
+    def lower_bound(self, key):
+        if self.length == 0:
+            return 0
+
+        leaf_index = self.__locate_leaf(key)
+        return self.__leaf_offset(leaf_index) + bisect_left(self.leaf_keys[leaf_index], key)
+
+    def upper_bound(self, key):
+        if self.length == 0:
+            return 0
+
+        leaf_index = min(bisect_right(self.maxes, key), len(self.leaves) - 1)
+        return self.__leaf_offset(leaf_index) + bisect_right(self.leaf_keys[leaf_index], key)
+
+    def iterate(self, index=None, reverse=False):
+        if index is None:
+            index = self.length - 1 if reverse else 0
+
+        if index < 0 or index >= self.length:
+            return
+
+        (leaf_index, offset) = self.__locate_index(index)
+
+        if reverse:
+            while leaf_index >= 0:
+                keys = self.leaf_keys[leaf_index]
+                leaf = self.leaves[leaf_index]
+                for i in range(offset, -1, -1):
+                    yield keys[i], leaf[i]
+                leaf_index -= 1
+                if leaf_index >= 0:
+                    offset = len(self.leaves[leaf_index]) - 1
+        else:
+            while leaf_index < len(self.leaves):
+                keys = self.leaf_keys[leaf_index]
+                leaf = self.leaves[leaf_index]
+                for i in range(offset, len(leaf)):
+                    yield keys[i], leaf[i]
+                leaf_index += 1
+                offset = 0
+
+    def insert(self, item):
+        key = self.key(item)
+
+        if self.length == 0:
+            self.leaves = [[item]]
+            self.leaf_keys = [[key]]
+            self.length = 1
+            self.__rebuild()
+            return 0
+
+        leaf_index = self.__locate_leaf(key)
+        leaf = self.leaves[leaf_index]
+        keys = self.leaf_keys[leaf_index]
+
+        offset = bisect_left(keys, key)
+        result = self.__leaf_offset(leaf_index) + offset
+
+        leaf.insert(offset, item)
+        keys.insert(offset, key)
+        self.length += 1
+
+        if len(leaf) > 2 * self.load:
+            self.leaves.insert(leaf_index + 1, leaf[self.load:])
+            self.leaf_keys.insert(leaf_index + 1, keys[self.load:])
+            del leaf[self.load:]
+            del keys[self.load:]
+            self.__rebuild()
+        else:
+            self.maxes[leaf_index] = keys[-1]
+            self.__update_index(leaf_index, 1)
+
+        return result
+
+    def merge(self, new_items, new_item_keys, tombstone_keys):
+        if len(new_items) == 0 and len(tombstone_keys) == 0:
+            return 0
+
+        if self.length == 0:
+            items = list(new_items)
+            keys = list(new_item_keys)
+            self.leaves = split_leaf(items, self.load)
+            self.leaf_keys = split_leaf(keys, self.load)
+            self.length = len(items)
+            self.__rebuild()
+            return 0
+
+        # Group the sorted change set by leaf, then merge every touched leaf once.
+        changes = {}
+        for i in range(len(new_items)):
+            leaf_index = self.__locate_leaf(new_item_keys[i])
+            if leaf_index not in changes:
+                changes[leaf_index] = ([], [], [])
+            changes[leaf_index][0].append(new_items[i])
+            changes[leaf_index][1].append(new_item_keys[i])
+
+        for key in tombstone_keys:
+            leaf_index = self.__locate_leaf(key)
+            if leaf_index not in changes:
+                changes[leaf_index] = ([], [], [])
+            changes[leaf_index][2].append(key)
+
+        moved = 0
+        for leaf_index in changes:
+            (leaf_new_items, leaf_new_item_keys, leaf_tombstone_keys) = changes[leaf_index]
+            leaf = self.leaves[leaf_index]
+            length = len(leaf)
+            moved += merge_sorted(leaf, self.leaf_keys[leaf_index], leaf_new_items, leaf_new_item_keys,
+                                  leaf_tombstone_keys)
+            self.length += len(leaf) - length
+
+        # Split oversized leaves and merge the ones shrunk below load // 2 by tombstones with their neighbour,
+        # the same bounds remove keeps.
+        leaves = []
+        leaf_keys = []
+        for i in range(len(self.leaves)):
+            leaf = self.leaves[i]
+            keys = self.leaf_keys[i]
+            if len(leaf) == 0:
+                continue
+
+            if len(leaves) > 0 and (len(leaf) < self.load // 2 or len(leaves[-1]) < self.load // 2):
+                leaf = leaves.pop() + leaf
+                keys = leaf_keys.pop() + keys
+
+            if len(leaf) > 2 * self.load:
+                leaves.extend(split_leaf(leaf, self.load))
+                leaf_keys.extend(split_leaf(keys, self.load))
+            else:
+                leaves.append(leaf)
+                leaf_keys.append(keys)
+
+        self.leaves = leaves
+        self.leaf_keys = leaf_keys
+        self.__rebuild()
+
+        return moved
+
+    def remove(self, item):
+        if self.length == 0:
+            return -1
+
+        key = self.key(item)
+        leaf_index = self.__locate_leaf(key)
+        leaf = self.leaves[leaf_index]
+        keys = self.leaf_keys[leaf_index]
+
+        offset = binary_search_key(keys, key)
+        if offset < 0:
+            return offset - self.__leaf_offset(leaf_index)
+
+        result = self.__leaf_offset(leaf_index) + offset
+
+        del leaf[offset]
+        del keys[offset]
+        self.length -= 1
+
+        if len(leaf) == 0:
+            del self.leaves[leaf_index]
+            del self.leaf_keys[leaf_index]
+            self.__rebuild()
+        elif len(leaf) < self.load // 2 and len(self.leaves) > 1:
+            # Merge small leaves with their neighbour to keep the tree shallow
+            if leaf_index == len(self.leaves) - 1:
+                leaf_index -= 1
+            self.leaves[leaf_index].extend(self.leaves[leaf_index + 1])
+            self.leaf_keys[leaf_index].extend(self.leaf_keys[leaf_index + 1])
+            del self.leaves[leaf_index + 1]
+            del self.leaf_keys[leaf_index + 1]
+
+            merged = self.leaves[leaf_index]
+            merged_keys = self.leaf_keys[leaf_index]
+            if len(merged) > 2 * self.load:
+                self.leaves.insert(leaf_index + 1, merged[self.load:])
+                self.leaf_keys.insert(leaf_index + 1, merged_keys[self.load:])
+                del merged[self.load:]
+                del merged_keys[self.load:]
+            self.__rebuild()
+        else:
+            self.maxes[leaf_index] = keys[-1]
+            self.__update_index(leaf_index, -1)
+
+        return result
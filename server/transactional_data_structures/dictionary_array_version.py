@@ -4,7 +4,7 @@ from versioned_ordered_array import VersionedOrderedArray
 
 class DictionaryArrayVersion(Transactional):
     def __init__(self, dic, comparer, key_name, is_in_list=None, model_name=None, events=None,
-                 update_db=False):
+                 update_db=False, array_class=None, key=None):
         self.dic = dic
         self.comparer = comparer
         self.key_name = key_name
@@ -12,6 +12,8 @@ class DictionaryArrayVersion(Transactional):
         self.events = events
         self.is_in_list = is_in_list
         self.update_db = update_db
+        self.array_class = array_class
+        self.key = key
 
         self.new_items = {}
         self.update_items = {}
@@ -21,61 +23,81 @@ class DictionaryArrayVersion(Transactional):
             if events is not None:
                 events.subscribe(model_name + '_insert_item', self.insert_item)
                 events.subscribe(model_name + '_update_item', self.update_item)
-                events.subscribe(model_name + '_delete_item', self.delete_item)
+                events.subscribe(model_name + '_delete_item', self.remove_item)
 
     def insert_item(self, item):
+        self.mark_dirty()
+
+        if self.is_in_list is not None and not self.is_in_list(item):
+            return
+
         key = getattr(item, self.key_name)
 
         if key in self.dic:
             if not (key in self.new_items):
+                # A list emptied in this transaction keeps its overlay and its tombstones.
                 if key in self.tomb_stone_items:
                     del self.tomb_stone_items[key]
+                    self.update_items[key] = True
 
                 if key not in self.update_items:
                     self.update_items[key] = True
-                    self.dic[key] = VersionedOrderedArray(self.dic[key].array, self.is_in_list, self.comparer, update_db=self.update_db)
+                    self.dic[key] = VersionedOrderedArray(self.dic[key].array, self.is_in_list, self.comparer, update_db=self.update_db, array_class=self.array_class, key=self.key)
 
         else:
             if key not in self.new_items:
                 self.new_items[key] = True
 
         if key not in self.dic:
-            self.dic[key] = VersionedOrderedArray([], self.is_in_list, self.comparer, update_db=self.update_db)
+            self.dic[key] = VersionedOrderedArray([], self.is_in_list, self.comparer, update_db=self.update_db, array_class=self.array_class, key=self.key)
         self.dic[key].insert_item(item)
 
     def remove_item(self, item):
+        self.mark_dirty()
+
         key = getattr(item, self.key_name)
 
-        if key not in self.dic:
+        if key not in self.dic or self.dic[key].get_length() == 0:
             return
 
-        if self.dic[key].get_length() == 0:
-            return
-
-        if self.dic[key].get_length() == 1:
-            if key in self.new_items:
-                del self.new_items[key]
-                del self.dic[key]
-            else:
-                if key not in self.tomb_stone_items:
-                    self.tomb_stone_items[key] = True
-                    if key not in self.update_items:
-                        self.dic[key] = VersionedOrderedArray(self.dic[key].array, self.is_in_list, self.comparer, update_db=self.update_db)
-
-                if key in self.update_items:
-                    del self.update_items[key]
-        else:
-            if not (key in self.new_items):
-                if key not in self.update_items:
-                    self.update_items[key] = True
-                    self.dic[key] = VersionedOrderedArray(self.dic[key].array, self.is_in_list, self.comparer, update_db=self.update_db)
-
-        self.dic[key].remove_item(item)
+        self.__get_overlay(key).remove_item(item)
+        self.__drop_if_empty(key)
 
     def update_item(self, new_item, old_item):
         self.remove_item(old_item)
         self.insert_item(new_item)
 
+    def remove_range(self, item, start_key=None, end_key=None):
+        self.mark_dirty()
+
+        key = getattr(item, self.key_name)
+
+        if key not in self.dic or self.dic[key].get_length() == 0:
+            return []
+
+        items = self.__get_overlay(key).remove_range(start_key, end_key)
+        self.__drop_if_empty(key)
+
+        return items
+
+    def __get_overlay(self, key):
+        if key not in self.new_items and key not in self.update_items and key not in self.tomb_stone_items:
+            self.update_items[key] = True
+            self.dic[key] = VersionedOrderedArray(self.dic[key].array, self.is_in_list, self.comparer, update_db=self.update_db, array_class=self.array_class, key=self.key)
+
+        return self.dic[key]
+
+    def __drop_if_empty(self, key):
+        if self.dic[key].get_length() > 0:
+            return
+
+        if key in self.new_items:
+            del self.new_items[key]
+            del self.dic[key]
+        elif key in self.update_items:
+            del self.update_items[key]
+            self.tomb_stone_items[key] = True
+
     def get_list(self, item):
         key = getattr(item, self.key_name)
 
@@ -92,6 +114,70 @@ class DictionaryArrayVersion(Transactional):
         else:
             return None
 
+    def get_count(self, item):
+        key = getattr(item, self.key_name)
+
+        if key in self.dic:
+            return self.dic[key].get_length()
+        else:
+            return 0
+
+    def get_index(self, item, index):
+        key = getattr(item, self.key_name)
+
+        if key in self.dic:
+            return self.dic[key].get_index(index)
+        else:
+            return None
+
+    def get_top(self, item, count, reverse=False):
+        key = getattr(item, self.key_name)
+
+        if key in self.dic:
+            return self.dic[key].get_top(count, reverse=reverse)
+        else:
+            return []
+
+    def iter_range(self, item, start_key=None, end_key=None, reverse=False):
+        key = getattr(item, self.key_name)
+
+        if key in self.dic:
+            return self.dic[key].iter_range(start_key, end_key, reverse=reverse)
+        else:
+            return iter(())
+
+    def get_range(self, item, start_key=None, end_key=None, reverse=False, count=None):
+        key = getattr(item, self.key_name)
+
+        if key in self.dic:
+            return self.dic[key].get_range(start_key, end_key, reverse=reverse, count=count)
+        else:
+            return []
+
+    def snapshot(self, writer):
+        # Only the committed arrays, a transaction in flight may have put an overlay in the dictionary.
+        result = []
+        for (key, array) in list(self.dic.items()):
+            rows = array.snapshot(writer)
+            if len(rows) > 0:
+                result.append((key, rows))
+        return result
+
+    def load_snapshot(self, state, reader):
+        self.dic.clear()
+        for (key, rows) in state:
+            items = reader.get_rows(rows)
+            if len(items) == 0:
+                continue
+            self.dic[key] = VersionedOrderedArray(
+                items,
+                self.is_in_list,
+                self.comparer,
+                update_db=self.update_db,
+                array_class=self.array_class,
+                key=self.key
+            )
+
     def clone(self, root_name="root", root=None):
         result = DictionaryArrayVersion(
             self.dic,
@@ -100,16 +186,21 @@ class DictionaryArrayVersion(Transactional):
             is_in_list=self.is_in_list,
             model_name=self.model_name,
             events=None if root is None else root.events,
-            update_db=self.update_db
+            update_db=self.update_db,
+            array_class=self.array_class,
+            key=self.key
         )
+        result.tracker = None if root is None else root.tracker
         return result
 
     def commit(self, db):
+        moved = 0
+
         for key in self.new_items.keys():
-            self.dic[key].commit(db)
+            moved += self.dic[key].commit(db)
 
         for key in self.update_items.keys():
-            self.dic[key].commit(db)
+            moved += self.dic[key].commit(db)
 
         for key in self.tomb_stone_items.keys():
             if self.update_db:
@@ -120,6 +211,8 @@ class DictionaryArrayVersion(Transactional):
         self.tomb_stone_items = {}
         self.update_items = {}
 
+        return moved
+
     def roll_back(self):
         for key in self.new_items.keys():
             del self.dic[key]
@@ -21,6 +21,8 @@ class DictionaryAutoIncrementerVersion(Transactional):
         return 1
 
     def get_next_id(self, item):
+        self.mark_dirty()
+
         key = getattr(item, self.key_name)
 
         if key in self.new_dic:
@@ -36,13 +38,22 @@ class DictionaryAutoIncrementerVersion(Transactional):
         self.new_dic[key] = 2
         return 1
 
-    def clone(self):
+    def snapshot(self, writer):
+        return [writer.add_row(item) for item in list(self.dic.values())]
+
+    def load_snapshot(self, state, reader):
+        self.dic.clear()
+        for item in reader.get_rows(state):
+            self.dic[getattr(item, self.key_name)] = item
+
+    def clone(self, root_name="root", root=None):
         result = DictionaryAutoIncrementerVersion(
             self.dic,
             self.key_name,
             self.id_column_name,
             self.a_i_class
         )
+        result.tracker = None if root is None else root.tracker
         return result
 
     def commit(self, db):
@@ -55,5 +66,7 @@ class DictionaryAutoIncrementerVersion(Transactional):
                 setattr(item, self.id_column_name, self.new_dic[key])
                 self.dic[key] = item
 
+        self.roll_back()
+
     def roll_back(self):
         self.new_dic = {}
@@ -3,7 +3,7 @@ from versioned_ordered_array import VersionedOrderedArray
 
 
 class DictionaryDictionaryArrayVersion(Transactional):
-    def __init__(self, dic, comparer, key_name_1, key_name_2, key_1_resolver=None, key_2_resolver=None, is_in_list=None, model_name=None, events=None, update_db=False):
+    def __init__(self, dic, comparer, key_name_1, key_name_2, key_1_resolver=None, key_2_resolver=None, is_in_list=None, model_name=None, events=None, update_db=False, array_class=None, key=None):
         self.dic = dic
         self.comparer = comparer
         self.key_name_1 = key_name_1
@@ -14,210 +14,197 @@ class DictionaryDictionaryArrayVersion(Transactional):
         self.events = events
         self.is_in_list = is_in_list
         self.update_db = update_db
+        self.array_class = array_class
+        self.key = key
 
-        self.new_items = {}
-        self.update_items = {}
-        self.tomb_stone_items = {}
+        # (key1, key2) -> the array written in this transaction. Each list gets one overlay per transaction,
+        # however many items or keys reach it, and the committed dictionary is only changed on commit.
+        self.touched = {}
 
         if self.model_name is not None:
             if events is not None:
                 events.subscribe(model_name + '_insert_item', self.insert_item)
                 events.subscribe(model_name + '_update_item', self.update_item)
-                events.subscribe(model_name + '_delete_item', self.delete_item)
+                events.subscribe(model_name + '_delete_item', self.remove_item)
 
-    def __key_array_helper(self, item, method, item_2=None):
+    def __get_keys(self, item):
         key1s = [getattr(item, self.key_name_1)] if self.key_1_resolver is None else self.key_1_resolver(item)
         key2s = [getattr(item, self.key_name_2)] if self.key_2_resolver is None else self.key_2_resolver(item)
 
-        for key1 in key1s:
-            for key2 in key2s:
-                if item_2 is None:
-                    method(key1, key2, item)
-                else:
-                    method(key1, key2, item, item_2)
+        if len(key1s) == 1 and len(key2s) == 1:
+            return [(key1s[0], key2s[0])]
+
+        return [(key1, key2) for key1 in key1s for key2 in key2s]
+
+    def __get_committed_array(self, key1, key2):
+        dic_key1 = self.dic.get(key1)
+        if dic_key1 is None:
+            return None
+        return dic_key1.get(key2)
+
+    def __get_array(self, key1, key2):
+        array = self.touched.get((key1, key2))
+        if array is not None:
+            return array
+        return self.__get_committed_array(key1, key2)
+
+    def __get_touched_array(self, key1, key2):
+        array = self.touched.get((key1, key2))
+
+        if array is None:
+            committed_array = self.__get_committed_array(key1, key2)
+            array = VersionedOrderedArray(
+                [] if committed_array is None else committed_array.array,
+                self.is_in_list,
+                self.comparer,
+                update_db=self.update_db,
+                array_class=self.array_class,
+                key=self.key
+            )
+            self.touched[(key1, key2)] = array
+
+        return array
 
     def insert_item(self, item):
-        self.__key_array_helper(item, self.insert_item_helper)
-
-    def insert_item_helper(self, key1, key2, item):
-        if key1 in self.dic and key2 in self.dic[key2]:
-            if not (key1 in self.new_items and key2 in self.new_items[key1]):
-                if key1 in self.tomb_stone_items and key2 in self.tomb_stone_items[key1]:
-                    del self.tomb_stone_items[key1][key2]
-                    if len(self.tomb_stone_items[key1]) == 0:
-                        del self.tomb_stone_items[key1]
-
-                if key1 not in self.update_items:
-                    self.update_items[key1] = {}
-
-                if key2 not in self.update_items[key1]:
-                    self.update_items[key1][key2] = True
-                    self.dic[key1][key2] = VersionedOrderedArray(self.dic[key1][key2].array, self.is_in_list, self.comparer, update_db=self.update_db)
-        else:
-            if key1 not in self.new_items:
-                self.new_items[key1] = {}
-            if key2 not in self.new_items[key1]:
-                self.new_items[key1][key2] = True
+        self.insert_items([item])
 
-        if key1 not in self.dic:
-            self.dic[key1] = {}
-        if key2 not in self.dic[key1]:
-            self.dic[key1][key2] = VersionedOrderedArray([], self.is_in_list, self.comparer, update_db=self.update_db)
-        self.dic[key1][key2].insert_item(item)
+    def insert_items(self, items):
+        self.mark_dirty()
 
-    def remove_item(self, item):
-        self.__key_array_helper(item, self.remove_item_helper)
-
-    def remove_item_helper(self, key1, key2, item):
-        if key1 not in self.dic:
-            return
-
-        if key2 not in self.dic[key1]:
-            return
-
-        if self.dic[key1][key2].get_length() == 0:
-            return
-
-        if self.dic[key1][key2].get_length() == 1:
-            if key1 in self.new_items and key2 in self.new_items[key1]:
-                del self.new_items[key1][key2]
-                if len(self.new_items[key1]) == 0:
-                    del self.new_items[key1]
-
-                del self.dic[key1][key2]
-                if len(self.dic[key1]) == 0:
-                    del self.dic[key1][key2]
-            else:
-                if key1 not in self.tomb_stone_items:
-                    self.tomb_stone_items[key1] = {}
-
-                if key2 not in self.tomb_stone_items[key1]:
-                    if not (key1 in self.update_items and key2 in self.update_items[key1]):
-                        self.dic[key1][key2] = VersionedOrderedArray(self.dic[key1][key2].array, self.is_in_list,
-                                                                     self.comparer, update_db=self.update_db)
-                    self.tomb_stone_items[key1][key2] = True
-
-                if key1 in self.update_items and key2 in self.update_items[key1]:
-                    del self.update_items[key1][key2]
-                    if len(self.update_items[key1]) == 0:
-                        del self.update_items[key1]
+        for item in items:
+            for (key1, key2) in self.__get_keys(item):
+                self.__get_touched_array(key1, key2).insert_item(item)
 
-        else:
-            if not (key1 in self.new_items and key2 in self.new_items[key1]):
-                if key1 not in self.update_items:
-                    self.update_items[key1] = {}
+    def remove_item(self, item):
+        self.remove_items([item])
 
-                if key2 not in self.update_items[key1]:
-                    self.update_items[key1][key2] = True
-                    self.dic[key1][key2] = VersionedOrderedArray(self.dic[key1][key2].array, self.is_in_list, self.comparer, update_db=self.update_db)
+    def remove_items(self, items):
+        self.mark_dirty()
 
-        self.dic[key1][key2].remove_item(item)
+        for item in items:
+            for (key1, key2) in self.__get_keys(item):
+                if self.__get_array(key1, key2) is not None:
+                    self.__get_touched_array(key1, key2).remove_item(item)
 
     def update_item(self, new_item, old_item):
-        self.__key_array_helper(new_item, self.update_item_helper, item_2=old_item)
+        self.update_items([new_item], [old_item])
+
+    def update_items(self, new_items, old_items):
+        self.remove_items(old_items)
+        self.insert_items(new_items)
+
+    def get_keys(self, key1):
+        result = []
 
-    def update_item_helper(self, key1, key2, new_item, old_item):
-        self.remove_item_helper(key1, key2, old_item)
-        self.insert_item_helper(key1, key2, new_item)
+        dic_key1 = self.dic.get(key1)
+        if dic_key1 is not None:
+            for key2 in dic_key1.keys():
+                if (key1, key2) not in self.touched:
+                    result.append(key2)
+
+        for (touched_key1, key2) in self.touched.keys():
+            if touched_key1 == key1 and self.touched[(touched_key1, key2)].get_length() > 0:
+                result.append(key2)
+
+        return result
 
     def get_item(self, item):
-        key1 = getattr(item, self.key_name_1)
-        key2 = getattr(item, self.key_name_2)
+        array = self.__get_array(getattr(item, self.key_name_1), getattr(item, self.key_name_2))
 
-        if key1 in self.dic and key2 in self.dic[key1]:
-            return self.dic[key1][key2].get_item(item)
+        if array is not None:
+            return array.get_item(item)
         else:
             return None
 
     def get_list(self, item):
-        key1 = getattr(item, self.key_name_1)
-        key2 = getattr(item, self.key_name_2)
+        array = self.__get_array(getattr(item, self.key_name_1), getattr(item, self.key_name_2))
 
-        if key1 in self.dic and key2 in self.dic[key1]:
-            return self.dic[key1][key2]
+        if array is not None:
+            return array
         else:
             return []
 
     def get_length(self, item):
-        key1 = getattr(item, self.key_name_1)
-        key2 = getattr(item, self.key_name_2)
+        array = self.__get_array(getattr(item, self.key_name_1), getattr(item, self.key_name_2))
 
-        if key1 in self.dic and key2 in self.dic[key1]:
-            return self.dic[key1][key2].get_length()
+        if array is not None:
+            return array.get_length()
         else:
             return 0
 
     def get_index(self, item, index):
-        key1 = getattr(item, self.key_name_1)
-        key2 = getattr(item, self.key_name_2)
+        array = self.__get_array(getattr(item, self.key_name_1), getattr(item, self.key_name_2))
 
-        if key1 in self.dic and key2 in self.dic[key1]:
-            return self.dic[key1][key2].get_index(index)
+        if array is not None:
+            return array.get_index(index)
         else:
             return -1
 
+    def snapshot(self, writer):
+        result = []
+        for (key1, dic_key1) in list(self.dic.items()):
+            for (key2, array) in list(dic_key1.items()):
+                result.append((key1, key2, array.snapshot(writer)))
+        return result
+
+    def load_snapshot(self, state, reader):
+        self.dic.clear()
+        self.touched = {}
+        for (key1, key2, rows) in state:
+            items = reader.get_rows(rows)
+            if len(items) == 0:
+                continue
+            if key1 not in self.dic:
+                self.dic[key1] = {}
+            self.dic[key1][key2] = VersionedOrderedArray(
+                items,
+                self.is_in_list,
+                self.comparer,
+                update_db=self.update_db,
+                array_class=self.array_class,
+                key=self.key
+            )
+
     def clone(self, root_name="root", root=None):
         result = DictionaryDictionaryArrayVersion(
             self.dic,
             self.comparer,
             self.key_name_1,
             self.key_name_2,
+            key_1_resolver=self.key_1_resolver,
+            key_2_resolver=self.key_2_resolver,
             is_in_list=self.is_in_list,
             model_name=self.model_name,
             events=None if root is None else root.events,
-            update_db=self.update_db
+            update_db=self.update_db,
+            array_class=self.array_class,
+            key=self.key
         )
+        result.tracker = None if root is None else root.tracker
         return result
 
     def commit(self, db):
-        for key1 in self.new_items.keys():
-            dickey1 = self.dic[key1]
-            newdickey1 = self.new_items[key1]
-            for key2 in newdickey1.keys():
-                dickey1[key2].commit(db)
-
-        for key1 in self.update_items.keys():
-            dickey1 = self.dic[key1]
-            newdickey1 = self.updateitems[key1]
-            for key2 in newdickey1.keys():
-                dickey1[key2].commit(db)
-
-        for key1 in self.tomb_stone_items.keys():
-            dickey1 = self.dic[key1]
-            newdickey1 = self.tomb_stone_items[key1]
-            for key2 in newdickey1.keys():
-                if self.update_db:
-                    dickey1[key2].commit(db)
-                del dickey1[key2]
-            if len(dickey1) == 0:
-                del self.dic[key1]
-
-        self.new_items = {}
-        self.tomb_stone_items = {}
-        self.update_items = {}
+        moved = 0
 
-    def roll_back(self):
-        for key1 in self.new_items.keys():
-            dickey1 = self.dic[key1]
-            newdickey1 = self.new_items[key1]
-            for key2 in newdickey1.keys():
-                del dickey1[key2]
-            if len(dickey1) == 0:
-                del self.dic[key1]
-
-        for key1 in self.update_items.keys():
-            dickey1 = self.dic[key1]
-            newdickey1 = self.updateitems[key1]
-            for key2 in newdickey1.keys():
-                dickey1[key2].roll_back()
-
-        for key1 in self.tomb_stone_items.keys():
-            dickey1 = self.dic[key1]
-            newdickey1 = self.tomb_stone_items[key1]
-            for key2 in newdickey1.keys():
-                dickey1[key2].roll_back()
-
-        self.new_items = {}
-        self.tomb_stone_items = {}
-        self.update_items = {}
+        for (key1, key2) in self.touched.keys():
+            array = self.touched[(key1, key2)]
+            moved += array.commit(db)
 
+            dic_key1 = self.dic.get(key1)
+
+            if array.get_length() == 0:
+                if dic_key1 is not None and key2 in dic_key1:
+                    del dic_key1[key2]
+                    if len(dic_key1) == 0:
+                        del self.dic[key1]
+            elif dic_key1 is None:
+                self.dic[key1] = {key2: array}
+            elif key2 not in dic_key1:
+                dic_key1[key2] = array
+
+        self.touched = {}
+
+        return moved
+
+    def roll_back(self):
+        self.touched = {}
@@ -2,10 +2,11 @@ from transactional import Transactional
 
 
 class DictionaryDictionaryVersion(Transactional):
-    def __init__(self, dic, key_name_1, key_name_2, model_name=None, events=None, update_db=False):
+    def __init__(self, dic, key_name_1, key_name_2, model_name=None, events=None, update_db=False, is_in_list=None):
         self.dic = dic
         self.key_name_1 = key_name_1
         self.key_name_2 = key_name_2
+        self.is_in_list = is_in_list
         self.new_items = {}
         self.tomb_stones = {}
         self.update_items = {}
@@ -18,9 +19,9 @@ class DictionaryDictionaryVersion(Transactional):
                 events.subscribe(model_name + '_delete_item', self.delete_item)
 
     def get_item(self, item):
-        key_1 = getattr(item, self.key_name_1)
-        key_2 = getattr(item, self.key_name_2)
+        return self.get_item_from_keys(getattr(item, self.key_name_1), getattr(item, self.key_name_2))
 
+    def get_item_from_keys(self, key_1, key_2):
         if key_1 in self.tomb_stones and key_2 in self.tomb_stones[key_1]:
             return None
 
@@ -35,7 +36,28 @@ class DictionaryDictionaryVersion(Transactional):
 
         return None
 
+    def get_items(self, key_1):
+        result = {}
+
+        if key_1 in self.dic:
+            result.update(self.dic[key_1])
+
+        for overlay in (self.new_items, self.update_items):
+            if key_1 in overlay:
+                result.update(overlay[key_1])
+
+        if key_1 in self.tomb_stones:
+            for key_2 in self.tomb_stones[key_1].keys():
+                result.pop(key_2, None)
+
+        return list(result.values())
+
     def insert_item(self, item):
+        self.mark_dirty()
+
+        if self.is_in_list is not None and not self.is_in_list(item):
+            return
+
         key_1 = getattr(item, self.key_name_1)
         key_2 = getattr(item, self.key_name_2)
 
@@ -62,6 +84,8 @@ class DictionaryDictionaryVersion(Transactional):
         self.insert_item(new_item)
 
     def delete_item(self, item):
+        self.mark_dirty()
+
         key_1 = getattr(item, self.key_name_1)
         key_2 = getattr(item, self.key_name_2)
 
@@ -81,14 +105,28 @@ class DictionaryDictionaryVersion(Transactional):
                 if len(self.new_items[key_1]) == 0:
                     del self.new_items[key_1]
 
+    def snapshot(self, writer):
+        return [writer.add_row(item) for dic_key_1 in list(self.dic.values()) for item in list(dic_key_1.values())]
+
+    def load_snapshot(self, state, reader):
+        self.dic.clear()
+        for item in reader.get_rows(state):
+            key_1 = getattr(item, self.key_name_1)
+            if key_1 not in self.dic:
+                self.dic[key_1] = {}
+            self.dic[key_1][getattr(item, self.key_name_2)] = item
+
     def clone(self, root_name="", root=None):
         result = DictionaryDictionaryVersion(
             self.dic,
             self.key_name_1,
             self.key_name_2,
             model_name=self.model_name,
-            events=None if root is None else root.events
+            events=None if root is None else root.events,
+            update_db=self.update_db,
+            is_in_list=self.is_in_list
         )
+        result.tracker = None if root is None else root.tracker
         return result
 
     def commit(self, db):
@@ -122,6 +160,8 @@ class DictionaryDictionaryVersion(Transactional):
 
             for key_2 in new_dic_key_1.keys():
                 dic_key_1[key_2].copy_values(new_dic_key_1[key_2])
+                if self.update_db:
+                    db.session.add(dic_key_1[key_2])
 
         self.roll_back()
 
@@ -0,0 +1,275 @@
+from transactional import Transactional
+from price_level import PriceLevel
+from b_tree_array import BTreeArray
+from bisect import insort
+from itertools import islice
+
+
+def identity(level_key):
+    return level_key
+
+
+# Items grouped by key_name and then by price into FIFO levels. Every key keeps its level keys sorted best first
+# in a BTreeArray, so the best level is its head and a depth query walks levels instead of items. level_key maps a
+# price to its sort key, the identity when lower prices come first. Writes go to per level overlays, the committed
+# levels and their order are only changed on commit.
+class DictionaryPriceLevelVersion(Transactional):
+    def __init__(self, dic, prices, key_name, price_name, quantity, comparer, key, level_key=None, is_in_list=None,
+                 model_name=None, events=None):
+        self.dic = dic
+        self.prices = prices
+        self.key_name = key_name
+        self.price_name = price_name
+        self.quantity = quantity
+        self.comparer = comparer
+        self.key = key
+        self.level_key = level_key
+        self.is_in_list = is_in_list
+        self.model_name = model_name
+        self.events = events
+
+        # key -> {level key -> level written in this transaction}
+        self.touched = {}
+        # key -> sorted keys of the touched levels that are not committed yet
+        self.new_level_keys = {}
+
+        if self.model_name is not None:
+            if events is not None:
+                events.subscribe(model_name + '_insert_item', self.insert_item)
+                events.subscribe(model_name + '_update_item', self.update_item)
+                events.subscribe(model_name + '_delete_item', self.remove_item)
+
+    def get_level_key(self, price):
+        return price if self.level_key is None else self.level_key(price)
+
+    def __get_level(self, key, level_key):
+        touched = self.touched.get(key)
+        if touched is not None and level_key in touched:
+            return touched[level_key]
+
+        levels = self.dic.get(key)
+        if levels is None:
+            return None
+        return levels.get(level_key)
+
+    def __get_touched_level(self, key, price):
+        level_key = self.get_level_key(price)
+        touched = self.touched.get(key)
+
+        if touched is None:
+            touched = self.touched[key] = {}
+
+        level = touched.get(level_key)
+
+        if level is None:
+            levels = self.dic.get(key)
+            committed_level = None if levels is None else levels.get(level_key)
+            if committed_level is None:
+                level = PriceLevel(price, [], self.comparer, self.key)
+                insort(self.new_level_keys.setdefault(key, []), level_key)
+            else:
+                level = committed_level.clone()
+            touched[level_key] = level
+
+        return level
+
+    def insert_item(self, item):
+        self.mark_dirty()
+
+        if self.is_in_list is not None and not self.is_in_list(item):
+            return
+
+        key = getattr(item, self.key_name)
+        price = getattr(item, self.price_name)
+        self.__get_touched_level(key, price).insert_item(item, self.quantity(item))
+
+    def remove_item(self, item):
+        self.mark_dirty()
+
+        key = getattr(item, self.key_name)
+        price = getattr(item, self.price_name)
+        level = self.__get_level(key, self.get_level_key(price))
+
+        if level is not None and level.get_item(item) is not None:
+            self.__get_touched_level(key, price).remove_item(item, self.quantity(item))
+
+    def update_item(self, new_item, old_item):
+        if old_item is None:
+            old_item = new_item
+
+        # Items are queued by their own key, so an item updated in place keeps its position in the level.
+        self.remove_item(old_item)
+        self.insert_item(new_item)
+
+    def iter_levels(self, item, reverse=False):
+        key = getattr(item, self.key_name)
+        levels = self.dic.get(key)
+        prices = self.prices.get(key, ())
+        touched = self.touched.get(key)
+        level_keys = reversed(prices) if reverse else prices
+
+        if not touched:
+            for level_key in level_keys:
+                yield levels[level_key]
+            return
+
+        new_level_keys = self.new_level_keys.get(key, [])
+        if reverse:
+            new_level_keys = new_level_keys[::-1]
+        new_index = 0
+
+        for level_key in level_keys:
+            while new_index < len(new_level_keys) and \
+                    (new_level_keys[new_index] > level_key if reverse else new_level_keys[new_index] < level_key):
+                level = touched[new_level_keys[new_index]]
+                if level.count > 0:
+                    yield level
+                new_index += 1
+
+            level = touched.get(level_key)
+            if level is None:
+                yield levels[level_key]
+            elif level.count > 0:
+                yield level
+
+        while new_index < len(new_level_keys):
+            level = touched[new_level_keys[new_index]]
+            if level.count > 0:
+                yield level
+            new_index += 1
+
+    def iter_items(self, item, end_price=None):
+        # Items best level first and oldest first within a level, stopping after the level at end_price.
+        end_level_key = None if end_price is None else self.get_level_key(end_price)
+
+        for level in self.iter_levels(item):
+            if end_level_key is not None and self.get_level_key(level.price) > end_level_key:
+                return
+            for level_item in level:
+                yield level_item
+
+    def get_list(self, item):
+        return list(self.iter_items(item))
+
+    def get_top(self, item, count):
+        return list(islice(self.iter_items(item), count))
+
+    def get_best(self, item):
+        for level in self.iter_levels(item):
+            return level
+        return None
+
+    def get_best_item(self, item):
+        level = self.get_best(item)
+        return None if level is None else level.get_first()
+
+    def get_level(self, item, price):
+        level = self.__get_level(getattr(item, self.key_name), self.get_level_key(price))
+        if level is None or level.count == 0:
+            return None
+        return level
+
+    def get_depth(self, item, count=None, reverse=False):
+        return [(level.price, level.quantity, level.count) for level in islice(self.iter_levels(item, reverse), count)]
+
+    def snapshot(self, writer):
+        result = []
+        for (key, prices) in list(self.prices.items()):
+            levels = self.dic[key]
+            result.append((key, [
+                (levels[level_key].price, [writer.add_row(item) for item in levels[level_key].queue.array])
+                for level_key in prices
+            ]))
+        return result
+
+    def load_snapshot(self, state, reader):
+        self.dic.clear()
+        self.prices.clear()
+        self.touched = {}
+        self.new_level_keys = {}
+
+        for (key, price_levels) in state:
+            levels = {}
+            prices = []
+            for (price, rows) in price_levels:
+                items = reader.get_rows(rows)
+                if len(items) == 0:
+                    continue
+                level_key = self.get_level_key(price)
+                levels[level_key] = PriceLevel(
+                    price,
+                    items,
+                    self.comparer,
+                    self.key,
+                    sum(self.quantity(item) for item in items),
+                    len(items)
+                )
+                prices.append(level_key)
+            if len(levels) > 0:
+                self.dic[key] = levels
+                self.prices[key] = BTreeArray(None, prices, key=identity)
+
+    def clone(self, root_name="root", root=None):
+        result = DictionaryPriceLevelVersion(
+            self.dic,
+            self.prices,
+            self.key_name,
+            self.price_name,
+            self.quantity,
+            self.comparer,
+            self.key,
+            level_key=self.level_key,
+            is_in_list=self.is_in_list,
+            model_name=self.model_name,
+            events=None if root is None else root.events
+        )
+        result.tracker = None if root is None else root.tracker
+        return result
+
+    def commit(self, db):
+        moved = 0
+
+        for (key, touched) in self.touched.items():
+            levels = self.dic.get(key)
+            if levels is None:
+                levels = self.dic[key] = {}
+                self.prices[key] = BTreeArray(None, key=identity)
+
+            new_level_keys = []
+            removed_level_keys = []
+
+            for (level_key, level) in touched.items():
+                moved += level.commit(db)
+                committed_level = levels.get(level_key)
+
+                if committed_level is None:
+                    if level.count > 0:
+                        levels[level_key] = level
+                elif level.count == 0:
+                    del levels[level_key]
+                    removed_level_keys.append(level_key)
+                else:
+                    committed_level.quantity = level.quantity
+                    committed_level.count = level.count
+
+            if len(levels) == 0:
+                del self.dic[key]
+                del self.prices[key]
+                continue
+
+            # The new level keys are already sorted, so the level order is changed by a single merge.
+            for level_key in self.new_level_keys.get(key, ()):
+                if level_key in levels:
+                    new_level_keys.append(level_key)
+
+            removed_level_keys.sort()
+            self.prices[key].merge(new_level_keys, new_level_keys, removed_level_keys)
+
+        self.touched = {}
+        self.new_level_keys = {}
+
+        return moved
+
+    def roll_back(self):
+        self.touched = {}
+        self.new_level_keys = {}
@@ -17,8 +17,9 @@ class DictionaryVersion(Transactional):
                 events.subscribe(model_name + '_delete_item', self.delete_item)
 
     def get_item(self, item):
-        key = getattr(item, self.key_name)
+        return self.get_item_from_key(getattr(item, self.key_name))
 
+    def get_item_from_key(self, key):
         if key in self.tomb_stones:
             return None
 
@@ -34,6 +35,8 @@ class DictionaryVersion(Transactional):
         return None
 
     def insert_item(self, item):
+        self.mark_dirty()
+
         key = getattr(item, self.key_name)
 
         if key in self.tomb_stones:
@@ -51,6 +54,8 @@ class DictionaryVersion(Transactional):
         self.insert_item(new_item)
 
     def delete_item(self, item):
+        self.mark_dirty()
+
         key = getattr(item, self.key_name)
 
         if key in self.dic:
@@ -63,31 +68,43 @@ class DictionaryVersion(Transactional):
             if key in self.new_items:
                 del self.new_items[key]
 
+    def snapshot(self, writer):
+        return [writer.add_row(item) for item in list(self.dic.values())]
+
+    def load_snapshot(self, state, reader):
+        self.dic.clear()
+        for item in reader.get_rows(state):
+            self.dic[getattr(item, self.key_name)] = item
+
     def clone(self, root_name="", root=None):
         result = DictionaryVersion(
             self.dic,
             self.key_name,
             model_name=self.model_name,
-            events=None if root is None else root.events
+            events=None if root is None else root.events,
+            update_db=self.update_db
         )
+        result.tracker = None if root is None else root.tracker
         return result
 
     def commit(self, db):
-        for new_item in self.new_items:
+        for new_item in self.new_items.values():
             key = getattr(new_item, self.key_name)
             if self.update_db:
                 db.session.add(new_item)
             self.dic[key] = new_item
 
-        for tomb_stone in self.tomb_stones:
+        for tomb_stone in self.tomb_stones.values():
             key = getattr(tomb_stone, self.key_name)
             if self.update_db:
                 db.session.delete(self.dic[key])
             del self.dic[key]
 
-        for update_item in self.update_items:
+        for update_item in self.update_items.values():
             key = getattr(update_item, self.key_name)
             self.dic[key].copy_values(update_item)
+            if self.update_db:
+                db.session.add(self.dic[key])
 
         self.roll_back()
 
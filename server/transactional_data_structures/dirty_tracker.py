@@ -0,0 +1,18 @@
+# Records the transactional structures written during a transaction so commit and roll_back only visit those.
+class DirtyTracker:
+    def __init__(self):
+        self.items = []
+
+    def commit(self, db):
+        items = self.items
+        self.items = []
+        for item in items:
+            item.dirty = False
+            item.commit(db)
+
+    def roll_back(self):
+        items = self.items
+        self.items = []
+        for item in items:
+            item.dirty = False
+            item.roll_back()
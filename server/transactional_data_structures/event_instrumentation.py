@@ -0,0 +1,167 @@
+from transactional_data_structures.events import EventReturnType
+from timeit import default_timer
+import threading
+
+
+class EventStats:
+    SAMPLE_SIZE = 2048
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.stops = 0
+        self.restarts = 0
+        self.samples = []
+        self.sample_index = 0
+
+    def record(self, elapsed, is_stop, is_restart):
+        self.count += 1
+        self.total_time += elapsed
+
+        if is_stop:
+            self.stops += 1
+        if is_restart:
+            self.restarts += 1
+
+        # Keep the latest SAMPLE_SIZE latencies for the percentiles.
+        if len(self.samples) < EventStats.SAMPLE_SIZE:
+            self.samples.append(elapsed)
+        else:
+            self.samples[self.sample_index] = elapsed
+            self.sample_index = (self.sample_index + 1) % EventStats.SAMPLE_SIZE
+
+    @staticmethod
+    def percentile(samples, fraction):
+        if len(samples) == 0:
+            return 0.0
+        return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+    def snapshot(self):
+        samples = sorted(self.samples)
+        return {
+            "count": self.count,
+            "total_time": self.total_time,
+            "p50": EventStats.percentile(samples, 0.5),
+            "p99": EventStats.percentile(samples, 0.99),
+            "stops": self.stops,
+            "restarts": self.restarts
+        }
+
+
+# Times every event and every subscriber it reaches. Enable it with Events.enable_instrumentation, the bus only
+# checks for it once per trigger while it is disabled.
+class EventInstrumentation:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.events = {}
+        self.subscribers = {}
+        self.folded = {}
+
+    @staticmethod
+    def get_subscriber_name(event_subscription):
+        func = event_subscription.func
+        name = getattr(func, "__qualname__", None)
+        if name is None:
+            name = getattr(func, "__name__", event_subscription.sub_name)
+            owner = getattr(func, "__self__", None)
+            if owner is not None:
+                name = owner.__class__.__name__ + "." + name
+        return name
+
+    def __get_stack(self):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    @staticmethod
+    def __record(stats, key, elapsed, is_stop, is_restart):
+        if key not in stats:
+            stats[key] = EventStats()
+        stats[key].record(elapsed, is_stop, is_restart)
+
+    def trigger(self, events, event_id, args):
+        event_name = events.event_names[event_id]
+        stack = self.__get_stack()
+        path = event_name if len(stack) == 0 else stack[-1][0] + ";" + event_name
+
+        result = False
+        restarted = False
+        start = default_timer()
+
+        while True:
+            restart = False
+            for event_subscription in tuple(events.subscriptions[event_id]):
+                event_return = self.__call(event_name, path, event_subscription, args, stack)
+                if event_return is EventReturnType.STOP:
+                    result = True
+                    break
+                elif event_return is EventReturnType.RESTART:
+                    restart = restarted = True
+                    break
+            if not restart:
+                break
+
+        elapsed = default_timer() - start
+
+        with self.lock:
+            EventInstrumentation.__record(self.events, event_name, elapsed, result, restarted)
+
+        return result
+
+    def __call(self, event_name, path, event_subscription, args, stack):
+        subscriber_name = EventInstrumentation.get_subscriber_name(event_subscription)
+        frame = [path + ";" + subscriber_name, 0.0]
+
+        stack.append(frame)
+        start = default_timer()
+        try:
+            event_return = event_subscription.func(*args)
+        finally:
+            elapsed = default_timer() - start
+            stack.pop()
+
+        if len(stack) > 0:
+            stack[-1][1] += elapsed
+
+        with self.lock:
+            EventInstrumentation.__record(
+                self.subscribers,
+                (event_name, subscriber_name),
+                elapsed,
+                event_return is EventReturnType.STOP,
+                event_return is EventReturnType.RESTART
+            )
+            self.folded[frame[0]] = self.folded.get(frame[0], 0.0) + elapsed - frame[1]
+
+        return event_return
+
+    def reset(self):
+        with self.lock:
+            self.events = {}
+            self.subscribers = {}
+            self.folded = {}
+
+    def snapshot(self):
+        with self.lock:
+            result = {}
+            for event_name in self.events:
+                result[event_name] = self.events[event_name].snapshot()
+                result[event_name]["subscribers"] = {}
+
+            for (event_name, subscriber_name) in self.subscribers:
+                if event_name not in result:
+                    result[event_name] = {"subscribers": {}}
+                result[event_name]["subscribers"][subscriber_name] = \
+                    self.subscribers[(event_name, subscriber_name)].snapshot()
+
+            return result
+
+    def folded_stacks(self):
+        # One "frame;frame;frame microseconds" line per stack, the input format of flamegraph.pl and speedscope.
+        with self.lock:
+            lines = []
+            for path in sorted(self.folded.keys()):
+                lines.append(path + " " + str(int(round(self.folded[path] * 1000000))))
+            return "\n".join(lines) + ("\n" if len(lines) > 0 else "")
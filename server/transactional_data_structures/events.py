@@ -23,66 +23,127 @@ class EventSubscription:
 
     @staticmethod
     def priority_comparer(item1, item2):
-        comp = 1 if item1.priority < item2.priority else -1 if item1.priority > item2.priority else 0
+        priority1 = item1.priority.value
+        priority2 = item2.priority.value
+        comp = 1 if priority1 < priority2 else -1 if priority1 > priority2 else 0
         if comp != 0:
             return comp
         return 1 if item1.sub_name < item2.sub_name else -1 if item1.sub_name > item2.sub_name else 0
 
 
 class Events:
+    # Event names are mapped to integer ids once and shared by every bus, so callers can resolve a name when
+    # their module loads and dispatch with trigger_id.
+    event_ids = {}
+    event_names = []
+    instrumentation = None
+
     def __init__(self):
         self.sub_counter = 0
-        self.events = {}
+        self.subscriptions = []
+        self.handlers = []
+
+    @staticmethod
+    def get_event_id(event_name):
+        event_id = Events.event_ids.get(event_name)
+        if event_id is None:
+            event_id = len(Events.event_names)
+            Events.event_ids[event_name] = event_id
+            Events.event_names.append(event_name)
+        return event_id
+
+    @staticmethod
+    def enable_instrumentation(instrumentation):
+        Events.instrumentation = instrumentation
+
+    @staticmethod
+    def disable_instrumentation():
+        Events.instrumentation = None
 
     @staticmethod
     def executed(trigger):
         return trigger
 
     def subscribe(self, event_name, func, priority=EventPriority.EVENT, sub_name=""):
-        if event_name not in self.events:
-            self.events[event_name] = []
+        event_id = Events.get_event_id(event_name)
+
+        while len(self.subscriptions) <= event_id:
+            self.subscriptions.append([])
+            self.handlers.append(())
 
         if sub_name == "":
             sub_name = "sub_name_" + str(self.sub_counter).zfill(5)
             self.sub_counter += 1
 
-        for event_subscription in self.events[event_name]:
+        subscriptions = self.subscriptions[event_id]
+
+        for event_subscription in subscriptions:
             if event_subscription.sub_name == sub_name:
                 raise Exception("sub_name " + sub_name + " already exists")
 
         new_event_subscription = EventSubscription(sub_name, priority, func)
 
-        event_subscription_index = binary_search(self.events[event_name], new_event_subscription)
+        event_subscription_index = binary_search(
+            subscriptions,
+            new_event_subscription,
+            EventSubscription.priority_comparer
+        )
 
-        self.events[event_name][-event_subscription_index - 1] = EventSubscription(sub_name, priority, func)
+        subscriptions.insert(-event_subscription_index - 1, new_event_subscription)
+        self.handlers[event_id] = tuple(event_subscription.func for event_subscription in subscriptions)
 
         return sub_name
 
-    def unsubsribe(self, event_name, sub_name):
-        if event_name not in self.events:
+    def unsubscribe(self, event_name, sub_name):
+        event_id = Events.event_ids.get(event_name)
+        if event_id is None or event_id >= len(self.subscriptions):
             return False
 
-        for index in range(len(self.events[event_name])):
-            if self.events[event_name][index].sub_name == sub_name:
-                del self.events[event_name][index]
+        subscriptions = self.subscriptions[event_id]
+
+        for index in range(len(subscriptions)):
+            if subscriptions[index].sub_name == sub_name:
+                del subscriptions[index]
+                self.handlers[event_id] = tuple(event_subscription.func for event_subscription in subscriptions)
                 return True
 
         return False
 
     def trigger(self, event_name, *args):
-        if event_name not in self.events:
+        event_id = Events.event_ids.get(event_name)
+        if event_id is None:
             return False
 
-        restart = False
-        while not restart:
-            for event_subscription in self.events[event_name]:
-                event_return = event_subscription.func(*args)
-                if event_return is None or event_return == EventReturnType.CONTINUE:
+        return self.trigger_id(event_id, *args)
+
+    def trigger_id(self, event_id, *args):
+        if event_id >= len(self.handlers):
+            return False
+
+        if self.instrumentation is not None:
+            return self.instrumentation.trigger(self, event_id, args)
+
+        handlers = self.handlers[event_id]
+
+        if len(handlers) == 0:
+            return False
+
+        if len(handlers) == 1:
+            event_return = handlers[0](*args)
+            if event_return is not EventReturnType.RESTART:
+                return event_return is EventReturnType.STOP
+            handlers = self.handlers[event_id]
+
+        while True:
+            for func in handlers:
+                event_return = func(*args)
+                if event_return is None or event_return is EventReturnType.CONTINUE:
                     continue
-                elif event_return == EventReturnType.STOP:
+                elif event_return is EventReturnType.STOP:
                     return True
-                elif event_return == EventReturnType.RESTART:
-                    restart = True
+                elif event_return is EventReturnType.RESTART:
                     break
+            else:
+                return False
 
-        return False
+            handlers = self.handlers[event_id]
@@ -0,0 +1,46 @@
+from transactional import Transactional
+from versioned_ordered_array import VersionedOrderedArray
+
+
+# The items resting at one price, oldest first, with their total quantity and count kept alongside so a level is
+# read without walking it. A clone overlays the committed queue and the totals are copied back on commit.
+class PriceLevel(Transactional):
+    def __init__(self, price, queue, comparer, key, quantity=0, count=0):
+        self.price = price
+        self.queue = VersionedOrderedArray(queue, None, comparer, key=key)
+        self.comparer = comparer
+        self.key = key
+        self.quantity = quantity
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.queue)
+
+    def get_first(self):
+        return self.queue.get_index(0)
+
+    def get_item(self, item):
+        return self.queue.get_item(item)
+
+    def insert_item(self, item, quantity):
+        self.queue.insert_item(item)
+        self.quantity += quantity
+        self.count += 1
+
+    def remove_item(self, item, quantity):
+        if self.queue.get_item(item) is None:
+            return False
+
+        self.queue.remove_item(item)
+        self.quantity -= quantity
+        self.count -= 1
+        return True
+
+    def clone(self, root_name="root", root=None):
+        return PriceLevel(self.price, self.queue.array, self.comparer, self.key, self.quantity, self.count)
+
+    def commit(self, db):
+        return self.queue.commit(db)
+
+    def roll_back(self):
+        self.queue.roll_back()
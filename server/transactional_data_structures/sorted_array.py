@@ -0,0 +1,120 @@
+from helpers.helper import binary_search_key, comparer_key
+from bisect import bisect_left, bisect_right
+
+
+# Applies sorted insertions and removals to parallel item/key lists in one pass. Everything before the first
+# change is left in place and the tail is spliced back with slice copies. Returns the number of existing
+# items whose position changed.
+def merge_sorted(items, keys, new_items, new_item_keys, tombstone_keys):
+    if len(new_items) == 0 and len(tombstone_keys) == 0:
+        return 0
+
+    first_key = new_item_keys[0] if len(new_items) > 0 else None
+    if len(tombstone_keys) > 0 and (first_key is None or tombstone_keys[0] < first_key):
+        first_key = tombstone_keys[0]
+
+    first = bisect_left(keys, first_key)
+    position = first
+    shift = 0
+    moved = 0
+
+    result_items = []
+    result_keys = []
+
+    new_item_index = 0
+    tomb_stone_index = 0
+
+    while new_item_index < len(new_items) or tomb_stone_index < len(tombstone_keys):
+        is_new_item = tomb_stone_index >= len(tombstone_keys) or (
+            new_item_index < len(new_items) and new_item_keys[new_item_index] < tombstone_keys[tomb_stone_index]
+        )
+
+        key = new_item_keys[new_item_index] if is_new_item else tombstone_keys[tomb_stone_index]
+        index = bisect_left(keys, key, position)
+
+        result_items.extend(items[position:index])
+        result_keys.extend(keys[position:index])
+        if shift != 0:
+            moved += index - position
+        position = index
+
+        if is_new_item:
+            result_items.append(new_items[new_item_index])
+            result_keys.append(key)
+            new_item_index += 1
+            shift += 1
+        else:
+            if index < len(keys) and keys[index] == key:
+                position += 1
+                shift -= 1
+            tomb_stone_index += 1
+
+    if shift != 0:
+        moved += len(keys) - position
+
+    result_items.extend(items[position:])
+    result_keys.extend(keys[position:])
+
+    items[first:] = result_items
+    keys[first:] = result_keys
+
+    return moved
+
+
+class SortedArray:
+    def __init__(self, comparer, items=None, key=None):
+        self.comparer = comparer
+        self.key = comparer_key(comparer) if key is None else key
+        self.items = [] if items is None else items
+        self.keys = [self.key(item) for item in self.items]
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __reversed__(self):
+        return reversed(self.items)
+
+    def index_of(self, item):
+        return binary_search_key(self.keys, self.key(item))
+
+    def index_of_key(self, key):
+        return binary_search_key(self.keys, key)
+
+    def lower_bound(self, key):
+        return bisect_left(self.keys, key)
+
+    def upper_bound(self, key):
+        return bisect_right(self.keys, key)
+
+    def iterate(self, index=None, reverse=False):
+        if reverse:
+            start = len(self.items) - 1 if index is None else index
+            for i in range(start, -1, -1):
+                yield self.keys[i], self.items[i]
+        else:
+            start = 0 if index is None else index
+            for i in range(start, len(self.items)):
+                yield self.keys[i], self.items[i]
+
+    def insert(self, item):
+        key = self.key(item)
+        index = bisect_left(self.keys, key)
+        self.keys.insert(index, key)
+        self.items.insert(index, item)
+        return index
+
+    def merge(self, new_items, new_item_keys, tombstone_keys):
+        return merge_sorted(self.items, self.keys, new_items, new_item_keys, tombstone_keys)
+
+    def remove(self, item):
+        index = self.index_of(item)
+        if index >= 0:
+            del self.keys[index]
+            del self.items[index]
+        return index
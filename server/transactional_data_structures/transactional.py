@@ -1,35 +1,99 @@
-import inspect
+class Transactional(object):
+    tracker = None
+    dirty = False
 
-
-class Transactional:
     def __init__(self):
         pass
 
+    def mark_dirty(self):
+        if not self.dirty and self.tracker is not None:
+            self.dirty = True
+            self.tracker.items.append(self)
+
     def clone(self, root_name="root", root=None):
-        result = self.__class__()
+        result = self.__class__.__new__(self.__class__)
+        result.__dict__.update(self.__dict__)
         if root is None:
             root = result
-        variables = [i for i in dir(self) if not inspect.ismethod(i)]
-        for variable in variables:
-            obj = getattr(self, variable)
+        for variable, obj in self.__dict__.items():
             if variable == root_name:
                 setattr(result, variable, root)
             elif isinstance(obj, Transactional):
-                setattr(obj, variable, obj.clone(root_name, root))
-            else:
-                setattr(result, variable, obj)
+                setattr(result, variable, obj.clone(root_name, root))
         return result
 
     def commit(self, db):
-        variables = [i for i in dir(self) if not inspect.ismethod(i)]
-        for variable in variables:
-            obj = getattr(self, variable)
+        for obj in self.__dict__.values():
             if isinstance(obj, Transactional):
                 obj.commit(db)
 
     def roll_back(self):
-        variables = [i for i in dir(self) if not inspect.ismethod(i)]
-        for variable in variables:
-            obj = getattr(self, variable)
+        for obj in self.__dict__.values():
             if isinstance(obj, Transactional):
                 obj.roll_back()
+
+    def snapshot(self, writer):
+        result = []
+        for variable in sorted(self.__dict__.keys()):
+            obj = self.__dict__[variable]
+            if isinstance(obj, Transactional):
+                result.append((variable, obj.snapshot(writer)))
+        return result
+
+    def load_snapshot(self, state, reader):
+        for (variable, obj_state) in state:
+            self.__dict__[variable].load_snapshot(obj_state, reader)
+
+
+# Class decorator declaring the transactional members of a class once. clone, commit and roll_back are built
+# from the declaration when the class is defined, so they only touch the declared fields and never scan the
+# instance. Fields are cloned, committed, rolled back and snapshotted in declaration order. A clone_init method,
+# if the class defines one, runs on the clone before its fields are cloned.
+def transactional(*field_names):
+    field_names = tuple(field_names)
+
+    def decorate(cls):
+        clone_init = getattr(cls, "clone_init", None)
+
+        def clone(self, root_name="root", root=None):
+            result = cls.__new__(cls)
+            state = result.__dict__
+            state.update(self.__dict__)
+            if root is None:
+                root = result
+            if root_name in state:
+                state[root_name] = root
+            if clone_init is not None:
+                clone_init(result)
+            for field_name in field_names:
+                state[field_name] = state[field_name].clone(root_name, root)
+            return result
+
+        def commit(self, db):
+            state = self.__dict__
+            for field_name in field_names:
+                state[field_name].commit(db)
+
+        def roll_back(self):
+            state = self.__dict__
+            for field_name in field_names:
+                state[field_name].roll_back()
+
+        def snapshot(self, writer):
+            state = self.__dict__
+            return [state[field_name].snapshot(writer) for field_name in field_names]
+
+        def load_snapshot(self, field_states, reader):
+            state = self.__dict__
+            for (field_name, field_state) in zip(field_names, field_states):
+                state[field_name].load_snapshot(field_state, reader)
+
+        cls.transactional_fields = field_names
+        cls.clone = clone
+        cls.commit = commit
+        cls.roll_back = roll_back
+        cls.snapshot = snapshot
+        cls.load_snapshot = load_snapshot
+        return cls
+
+    return decorate
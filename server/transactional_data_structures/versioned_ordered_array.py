@@ -1,65 +1,231 @@
 from transactional import Transactional
-from helpers.helper import  binary_search
+from sorted_array import SortedArray
+from helpers.helper import binary_search_key, comparer_key
+from bisect import bisect_left, bisect_right
+from itertools import islice
 
 
 class VersionedOrderedArray(Transactional):
-    def __init__(self, array, is_in_list, comparer, update_db=False):
+    def __init__(self, array, is_in_list, comparer, update_db=False, array_class=None, key=None):
+        if array_class is None:
+            array_class = SortedArray
+
+        if key is None:
+            key = comparer_key(comparer)
+
+        if isinstance(array, list):
+            array = array_class(comparer, array, key=key)
+
         self.array = array
+        self.array_class = array_class
         self.is_in_list = is_in_list
         self.comparer = comparer
+        self.key = key
         self.tombstones = []
+        self.tombstone_keys = []
         self.new_items = []
+        self.new_item_keys = []
         self.update_items = []
+        self.update_item_keys = []
         self.update_db = update_db
 
     def __iter__(self):
-        for i in range(0, self.get_length()):
-            yield self.__get_item_from_index(i)
+        return self.iter_items()
+
+    def __reversed__(self):
+        return self.iter_items(reverse=True)
+
+    def iter_items(self, start_key=None, reverse=False):
+        # Single pass merge of the backing array with the overlays. Forward iteration starts at the
+        # first item with a key >= start_key, reverse iteration at the last item with a key <= start_key.
+        for (key, item) in self.iter_keyed_items(start_key, reverse):
+            yield item
+
+    def iter_keyed_items(self, start_key=None, reverse=False):
+        if reverse:
+            return self.__iter_items_reverse(start_key)
+        return self.__iter_items_forward(start_key)
+
+    def __iter_items_forward(self, start_key):
+        new_items = self.new_items
+        new_item_keys = self.new_item_keys
+        tombstone_keys = self.tombstone_keys
+        update_items = self.update_items
+        update_item_keys = self.update_item_keys
+
+        if start_key is None:
+            index = 0
+            new_item_index = 0
+            tomb_stone_index = 0
+            update_item_index = 0
+        else:
+            index = self.array.lower_bound(start_key)
+            new_item_index = bisect_left(new_item_keys, start_key)
+            tomb_stone_index = bisect_left(tombstone_keys, start_key)
+            update_item_index = bisect_left(update_item_keys, start_key)
+
+        for (key, item) in self.array.iterate(index):
+            while new_item_index < len(new_items) and new_item_keys[new_item_index] < key:
+                yield new_item_keys[new_item_index], new_items[new_item_index]
+                new_item_index += 1
+
+            while tomb_stone_index < len(tombstone_keys) and tombstone_keys[tomb_stone_index] < key:
+                tomb_stone_index += 1
+
+            if tomb_stone_index < len(tombstone_keys) and tombstone_keys[tomb_stone_index] == key:
+                tomb_stone_index += 1
+                continue
+
+            while update_item_index < len(update_items) and update_item_keys[update_item_index] < key:
+                update_item_index += 1
+
+            if update_item_index < len(update_items) and update_item_keys[update_item_index] == key:
+                yield key, update_items[update_item_index]
+                update_item_index += 1
+            else:
+                yield key, item
+
+        while new_item_index < len(new_items):
+            yield new_item_keys[new_item_index], new_items[new_item_index]
+            new_item_index += 1
+
+    def __iter_items_reverse(self, start_key):
+        new_items = self.new_items
+        new_item_keys = self.new_item_keys
+        tombstone_keys = self.tombstone_keys
+        update_items = self.update_items
+        update_item_keys = self.update_item_keys
+
+        if start_key is None:
+            index = len(self.array) - 1
+            new_item_index = len(new_items) - 1
+            tomb_stone_index = len(tombstone_keys) - 1
+            update_item_index = len(update_items) - 1
+        else:
+            index = self.array.upper_bound(start_key) - 1
+            new_item_index = bisect_right(new_item_keys, start_key) - 1
+            tomb_stone_index = bisect_right(tombstone_keys, start_key) - 1
+            update_item_index = bisect_right(update_item_keys, start_key) - 1
+
+        if index >= 0:
+            for (key, item) in self.array.iterate(index, reverse=True):
+                while new_item_index >= 0 and new_item_keys[new_item_index] > key:
+                    yield new_item_keys[new_item_index], new_items[new_item_index]
+                    new_item_index -= 1
+
+                while tomb_stone_index >= 0 and tombstone_keys[tomb_stone_index] > key:
+                    tomb_stone_index -= 1
+
+                if tomb_stone_index >= 0 and tombstone_keys[tomb_stone_index] == key:
+                    tomb_stone_index -= 1
+                    continue
+
+                while update_item_index >= 0 and update_item_keys[update_item_index] > key:
+                    update_item_index -= 1
+
+                if update_item_index >= 0 and update_item_keys[update_item_index] == key:
+                    yield key, update_items[update_item_index]
+                    update_item_index -= 1
+                else:
+                    yield key, item
+
+        while new_item_index >= 0:
+            yield new_item_keys[new_item_index], new_items[new_item_index]
+            new_item_index -= 1
 
     def get_length(self):
         return len(self.array) - len(self.tombstones) + len(self.new_items)
 
-    def binary_search(self, array, item):
-        return binary_search(array, item, self.comparer)
-
     def get_tombstone_index(self, item):
-        return self.binary_search(self.tombstones, item)
+        return binary_search_key(self.tombstone_keys, self.key(item))
 
     def get_item_index(self, item):
-        return self.binary_search(self.array, item)
+        return self.array.index_of(item)
 
     def get_update_item_index(self, item):
-        return self.binary_search(self.update_items, item)
+        return binary_search_key(self.update_item_keys, self.key(item))
 
     def get_new_item_index(self, item):
-        return self.binary_search(self.new_items, item)
+        return binary_search_key(self.new_item_keys, self.key(item))
 
     def insert_item(self, item):
+        self.mark_dirty()
+
         if self.is_in_list is not None and not self.is_in_list(item):
             return
 
-        tomb_stone_index = self.get_tombstone_index(item)
+        key = self.key(item)
+        tomb_stone_index = binary_search_key(self.tombstone_keys, key)
 
         if tomb_stone_index >= 0:
             del self.tombstones[tomb_stone_index]
-            update_index = self.get_update_item_index(item)
-            self.update_items.insert(-update_index - 1, item)
+            del self.tombstone_keys[tomb_stone_index]
+            update_index = -binary_search_key(self.update_item_keys, key) - 1
+            self.update_items.insert(update_index, item)
+            self.update_item_keys.insert(update_index, key)
         else:
-            new_item_index = self.get_new_item_index(item)
-            self.new_items.insert(-new_item_index - 1, item)
+            new_item_index = -binary_search_key(self.new_item_keys, key) - 1
+            self.new_items.insert(new_item_index, item)
+            self.new_item_keys.insert(new_item_index, key)
 
     def remove_item(self, item):
-        index = self.get_item_index(item)
+        self.mark_dirty()
+
+        key = self.key(item)
+        index = self.array.index_of_key(key)
         if index >= 0:
-            update_index = self.get_update_item_index(item)
+            # Removing an item twice leaves a single tombstone, the item may already have left with a range.
+            tomb_stone_index = binary_search_key(self.tombstone_keys, key)
+            if tomb_stone_index >= 0:
+                return
+
+            update_index = binary_search_key(self.update_item_keys, key)
             if update_index >= 0:
                 del self.update_items[update_index]
-            tomb_stone_index = self.get_tombstone_index(item)
-            self.tombstones.insert(-tomb_stone_index - 1, item)
+                del self.update_item_keys[update_index]
+            tomb_stone_index = -tomb_stone_index - 1
+            self.tombstones.insert(tomb_stone_index, item)
+            self.tombstone_keys.insert(tomb_stone_index, key)
         else:
-            new_item_index = self.get_new_item_index(item)
+            new_item_index = binary_search_key(self.new_item_keys, key)
             if new_item_index >= 0:
                 del self.new_items[new_item_index]
+                del self.new_item_keys[new_item_index]
+
+    def remove_range(self, start_key=None, end_key=None):
+        # Detaches every item from start_key up to but excluding end_key in one step and returns them in order.
+        # The tombstones of the range are replaced with one slice instead of being inserted one at a time.
+        self.mark_dirty()
+
+        items = self.get_range(start_key, end_key)
+
+        if len(items) == 0:
+            return items
+
+        array_items = []
+        array_keys = []
+        index = 0 if start_key is None else self.array.lower_bound(start_key)
+        for (key, item) in self.array.iterate(index):
+            if end_key is not None and key >= end_key:
+                break
+            array_items.append(item)
+            array_keys.append(key)
+
+        for (items_list, keys) in (
+            (self.new_items, self.new_item_keys),
+            (self.update_items, self.update_item_keys),
+            (self.tombstones, self.tombstone_keys)
+        ):
+            lower = 0 if start_key is None else bisect_left(keys, start_key)
+            upper = len(keys) if end_key is None else bisect_left(keys, end_key)
+            if keys is self.tombstone_keys:
+                items_list[lower:upper] = array_items
+                keys[lower:upper] = array_keys
+            else:
+                del items_list[lower:upper]
+                del keys[lower:upper]
+
+        return items
 
     def update_item(self, new_item, old_item):
         if old_item is None:
@@ -69,159 +235,163 @@ class VersionedOrderedArray(Transactional):
         self.insert_item(new_item)
 
     def __get_item_from_item(self, item):
-        new_item_index = self.get_new_item_index(item)
+        key = self.key(item)
+        new_item_index = binary_search_key(self.new_item_keys, key)
 
         if new_item_index >= 0:
             return self.new_items[new_item_index]
 
-        tomb_stone_index = self.get_tombstone_index(item)
+        tomb_stone_index = binary_search_key(self.tombstone_keys, key)
 
         if tomb_stone_index >= 0:
             return None
 
-        update_item_index = self.get_update_item_index(item)
+        update_item_index = binary_search_key(self.update_item_keys, key)
 
         if update_item_index >= 0:
-            return self.update_item[update_item_index]
+            return self.update_items[update_item_index]
 
-        index = self.get_item_index(item)
+        index = self.array.index_of_key(key)
 
         if index >= 0:
             return self.array[index]
 
         return None
 
-    def __initialize_get_item_from_index(self, key):
-        index = key
+    def __get_array_item(self, index):
+        item = self.array[index]
 
-        if index >= len(self.array):
-            index = len(self.array) - 1
+        if len(self.update_items) == 0:
+            return item
 
-        if len(self.array) == 0:
-            new_item_index = 0
-            if len(self.tombstones) == 0:
-                tomb_stone_index = -1
-            else:
-                tomb_stone_index = 0
-            actual_index = 0
-        else:
-            item = self.array[index]
+        update_item_index = self.get_update_item_index(item)
 
-            if len(self.new_items) == 0:
-                new_item_index = -1
-                if len(self.tombstones) == 0:
-                    tomb_stone_index = -1
-                    actual_index = index
-                else:
-                    tomb_stone_index = self.get_tombstone_index(item)
-                    if tomb_stone_index < 0:
-                        tomb_stone_index = -tomb_stone_index - 1
-                    actual_index = index - tomb_stone_index
-            else:
-                tomb_stone_index = self.get_tombstone_index(item)
-                new_item_index = -self.get_new_item_index(item) - 1
-                if tomb_stone_index < 0:
-                    tomb_stone_index = -tomb_stone_index - 1
-                actual_index = index + new_item_index - tomb_stone_index
-
-        if actual_index < key:
-            d = 1
-            tomb_stone_index += 1
-            new_item_index += 1
-        else:
-            d = -1
+        if update_item_index >= 0:
+            return self.update_items[update_item_index]
 
-        return index, actual_index, d, new_item_index, tomb_stone_index
+        return item
 
     def __get_item_from_index(self, key):
-        (index, actual_index, d, new_item_index, tomb_stone_index) = self.__initialize_get_item_from_index(key)
-
-        while True:
-            check_item = False
-
-            if 0 <= index < len(self.array) and 0 <= new_item_index < len(self.new_items):
-                cv = self.comparer(self.new_items[new_item_index], self.array[index])
-
-                if cv == d:
-                    check_item = True
-                else:  # cv == -d:
-                    if actual_index == key:
-                        return self.new_items[new_item_index]
-                    actual_index += d
-                    new_item_index += d
-            elif 0 <= index < len(self.array):
-                check_item = True
-            elif 0 <= new_item_index < len(self.new_items):
-                return self.new_items[key - actual_index + new_item_index]
+        if key < 0 or key >= self.get_length():
+            return None
+
+        # Walk the overlays in order, shifting the index into the backing array by one for every new
+        # item before it and back by one for every tombstone before it.
+        shift = 0
+        new_item_index = 0
+        tomb_stone_index = 0
+
+        while new_item_index < len(self.new_items) or tomb_stone_index < len(self.tombstones):
+            is_new_item = tomb_stone_index >= len(self.tombstones) or (
+                new_item_index < len(self.new_items) and
+                self.new_item_keys[new_item_index] < self.tombstone_keys[tomb_stone_index]
+            )
+
+            if is_new_item:
+                item = self.new_items[new_item_index]
+                index = self.array.index_of_key(self.new_item_keys[new_item_index])
+                if index < 0:
+                    index = -index - 1
+
+                if key - shift < index:
+                    break
+                if key - shift == index:
+                    return item
+
+                shift += 1
+                new_item_index += 1
             else:
-                return None
+                index = self.array.index_of_key(self.tombstone_keys[tomb_stone_index])
 
-            if check_item:
-                check_return_value = False
+                if key - shift < index:
+                    break
 
-                if tomb_stone_index >= len(self.tombstones) or tomb_stone_index < 0:
-                    if new_item_index >= len(self.new_items) or new_item_index < 0:
-                        index += key - actual_index
-                        actual_index = key
+                shift -= 1
+                tomb_stone_index += 1
 
-                    check_return_value = True
-                else:
-                    cvt = self.comparer(self.tombstones[tomb_stone_index], self.array[index])
-
-                    if cvt == 0:
-                        tomb_stone_index += d
-                        index += d
-                    else:
-                        check_return_value = True
-
-                if check_return_value:
-                    if actual_index == key:
-                        item = self.array[index]
-                        update_item_index = self.get_update_item_index(item)
-                        if update_item_index >= 0:
-                            return self.update_items[update_item_index]
-                        else:
-                            return self.array[index]
-                    actual_index += d
-                    index += d
+        return self.__get_array_item(key - shift)
+
+    def get_index(self, index):
+        return self.__get_item_from_index(index)
+
+    def get_slice(self, start, stop, step=None):
+        (start, stop, step) = slice(start, stop, step).indices(self.get_length())
+
+        if (step > 0 and start >= stop) or (step < 0 and start <= stop):
+            return []
+
+        start_key = self.key(self.__get_item_from_index(start))
+        count = abs(stop - start)
+        return list(islice(self.iter_items(start_key, reverse=step < 0), 0, count, abs(step)))
+
+    def get_top(self, count, reverse=False):
+        return list(islice(self.iter_items(reverse=reverse), count))
+
+    def iter_range(self, start_key=None, end_key=None, reverse=False):
+        # Items from start_key up to but excluding end_key, walking down when reverse is set. Either bound
+        # may be None to run from the first or to the last item.
+        for (key, item) in self.iter_keyed_items(start_key, reverse):
+            if end_key is not None and (key <= end_key if reverse else key >= end_key):
+                return
+            yield item
+
+    def get_range(self, start_key=None, end_key=None, reverse=False, count=None):
+        return list(islice(self.iter_range(start_key, end_key, reverse), count))
+
+    def get_item(self, item):
+        return self.__get_item_from_item(item)
 
     def __getitem__(self, key):
         if isinstance(key, int):
             return self.__get_item_from_index(key)
         elif isinstance(key, slice):
-            return
+            return self.get_slice(key.start, key.stop, key.step)
         else:
             return self.__get_item_from_item(key)
 
+    def snapshot(self, writer):
+        return [writer.add_row(item) for (key, item) in self.array.iterate(0)]
+
+    def load_snapshot(self, state, reader):
+        self.array = self.array_class(self.comparer, reader.get_rows(state), key=self.key)
+        self.roll_back()
+
     def clone(self, root_name="root", root=None):
         result = VersionedOrderedArray(
             self.array,
             self.is_in_list,
             self.comparer,
-            update_db=self.update_db
+            update_db=self.update_db,
+            array_class=self.array_class,
+            key=self.key
         )
+        result.tracker = None if root is None else root.tracker
         return result
 
     def commit(self, db):
-        for new_item in self.new_items:
-            index = binary_search(self.array, new_item)
+        for i in range(len(self.update_items)):
+            index = self.array.index_of_key(self.update_item_keys[i])
+            self.array[index].copy_values(self.update_items[i])
             if self.update_db:
-                db.session.add(new_item)
-            self.array.insert(new_item, -index - 1)
+                db.session.add(self.array[index])
 
-        for update_item in self.update_items:
-            index = binary_search(self.array, update_item)
-            self.array[index].copy_values(update_item)
+        if self.update_db:
+            for tombstone_key in self.tombstone_keys:
+                db.session.delete(self.array[self.array.index_of_key(tombstone_key)])
 
-        for tombstone in self.tombstones:
-            index = binary_search(self.array, tombstone)
-            if self.update_db:
-                db.session.remove(tombstone)
-            del self.array[index]
+            for new_item in self.new_items:
+                db.session.add(new_item)
+
+        moved = self.array.merge(self.new_items, self.new_item_keys, self.tombstone_keys)
 
         self.roll_back()
 
+        return moved
+
     def roll_back(self):
         self.new_items = []
+        self.new_item_keys = []
         self.update_items = []
+        self.update_item_keys = []
         self.tombstones = []
+        self.tombstone_keys = []
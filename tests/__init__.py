@@ -0,0 +1,15 @@
+import os
+import sys
+
+SERVER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server")
+
+if SERVER_PATH not in sys.path:
+    sys.path.insert(0, SERVER_PATH)
+
+# The server is written for Python 2 and uses implicit relative imports inside its packages. Python 3 only finds
+# those modules when the package directories are on the path too.
+if sys.version_info[0] >= 3:
+    for package in ("transactional_data_structures", "locks/lock", "locks/reader_writer"):
+        package_path = os.path.join(SERVER_PATH, package)
+        if package_path not in sys.path:
+            sys.path.append(package_path)
@@ -0,0 +1,95 @@
+import random
+import unittest
+from bisect import bisect_left, bisect_right
+
+import tests
+from transactional_data_structures.b_tree_array import BTreeArray
+
+
+def identity(item):
+    return item
+
+
+class BTreeArrayTest(unittest.TestCase):
+    LOAD = 4
+
+    def setUp(self):
+        self.random = random.Random(7)
+
+    def assert_matches(self, tree, model):
+        self.assertEqual(len(tree), len(model))
+        self.assertEqual(list(tree), model)
+        self.assertEqual(list(reversed(tree)), model[::-1])
+        self.assertEqual([tree[i] for i in range(len(model))], model)
+        self.assertEqual(tree.maxes, [leaf[-1] for leaf in tree.leaves])
+
+        for leaf in tree.leaves:
+            self.assertTrue(0 < len(leaf) <= 2 * tree.load)
+
+    def assert_balanced(self, tree):
+        if len(tree.leaves) > 1:
+            for leaf in tree.leaves:
+                self.assertTrue(len(leaf) >= tree.load // 2)
+
+    def test_insert_and_remove(self):
+        tree = BTreeArray(None, key=identity, load=self.LOAD)
+        model = []
+
+        for i in range(400):
+            value = self.random.randint(0, 200)
+            if value in model and self.random.random() < 0.5:
+                self.assertEqual(tree.remove(value), model.index(value))
+                model.remove(value)
+            elif value not in model:
+                self.assertEqual(tree.insert(value), bisect_left(model, value))
+                model.insert(bisect_left(model, value), value)
+            self.assert_matches(tree, model)
+
+        self.assertLess(tree.remove(1000), 0)
+
+    def test_index_and_bounds(self):
+        model = list(range(0, 300, 3))
+        tree = BTreeArray(None, list(model), key=identity, load=self.LOAD)
+
+        for value in range(-2, 302):
+            expected = model.index(value) if value in model else -bisect_left(model, value) - 1
+            self.assertEqual(tree.index_of_key(value), expected)
+            self.assertEqual(tree.lower_bound(value), bisect_left(model, value))
+            self.assertEqual(tree.upper_bound(value), bisect_right(model, value))
+
+    def test_iterate(self):
+        model = list(range(50))
+        tree = BTreeArray(None, list(model), key=identity, load=self.LOAD)
+
+        self.assertEqual([item for (key, item) in tree.iterate(17)], model[17:])
+        self.assertEqual([item for (key, item) in tree.iterate(17, reverse=True)], model[17::-1])
+        self.assertEqual(list(tree.iterate(50)), [])
+
+    def test_merge(self):
+        tree = BTreeArray(None, key=identity, load=self.LOAD)
+        model = []
+
+        for i in range(60):
+            new_items = sorted(set(self.random.randint(0, 500) for j in range(self.random.randint(0, 12))) - set(model))
+            tombstones = sorted(self.random.sample(model, min(len(model), self.random.randint(0, 12))))
+
+            tree.merge(new_items, list(new_items), tombstones)
+            model = sorted((set(model) - set(tombstones)) | set(new_items))
+
+            self.assert_matches(tree, model)
+            self.assert_balanced(tree)
+
+    def test_merge_rebalances_tombstoned_leaves(self):
+        tree = BTreeArray(None, list(range(40)), key=identity, load=self.LOAD)
+
+        # Leave a single item in every leaf.
+        tombstones = [item for item in range(40) if item % self.LOAD != 0]
+        tree.merge([], [], tombstones)
+
+        self.assert_matches(tree, list(range(0, 40, self.LOAD)))
+        self.assert_balanced(tree)
+        self.assertLess(len(tree.leaves), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
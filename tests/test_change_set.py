@@ -0,0 +1,91 @@
+import unittest
+
+import tests
+from trade_engine.group_commit.change_set import ChangeSet
+
+try:
+    from flask import Flask
+    from flask_sqlalchemy import SQLAlchemy
+    from sqlalchemy import event
+except ImportError:
+    Flask = None
+
+
+@unittest.skipIf(Flask is None, "flask_sqlalchemy is not installed")
+class ChangeSetTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.db = db = SQLAlchemy(self.app)
+
+        class User(db.Model):
+            user_id = db.Column(db.Integer, primary_key=True)
+            balance = db.Column(db.Integer)
+
+        class Order(db.Model):
+            equity_id = db.Column(db.Integer, primary_key=True)
+            order_id = db.Column(db.Integer, primary_key=True)
+            quantity = db.Column(db.Integer)
+
+        self.User = User
+        self.Order = Order
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+
+        self.statements = []
+        event.listen(db.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: self.statements.append(statement.split()[0]))
+
+    def tearDown(self):
+        self.db.session.remove()
+        self.context.pop()
+
+    def apply(self, changes):
+        self.statements = []
+        ChangeSet.apply_changes(changes, self.db)
+        self.db.session.commit()
+        statements = self.statements
+        self.db.session.expire_all()
+        return statements
+
+    def test_set_based_writes(self):
+        changes = [(ChangeSet.ADD, self.User, {"user_id": i, "balance": i}) for i in range(ChangeSet.QUERY_SIZE + 1)]
+        changes.append((ChangeSet.ADD, self.Order, {"equity_id": 1, "order_id": 1, "quantity": 5}))
+
+        statements = self.apply(changes)
+
+        self.assertEqual(statements.count("SELECT"), 3)
+        self.assertEqual(self.User.query.count(), ChangeSet.QUERY_SIZE + 1)
+        self.assertEqual(self.db.session.get(self.Order, (1, 1)).quantity, 5)
+
+    def test_last_change_wins_and_replay_is_harmless(self):
+        self.apply([
+            (ChangeSet.ADD, self.User, {"user_id": 1, "balance": 10}),
+            (ChangeSet.ADD, self.User, {"user_id": 2, "balance": 20}),
+            (ChangeSet.ADD, self.Order, {"equity_id": 1, "order_id": 1, "quantity": 5}),
+            (ChangeSet.ADD, self.Order, {"equity_id": 1, "order_id": 2, "quantity": 6})
+        ])
+
+        changes = [
+            (ChangeSet.ADD, self.User, {"user_id": 1, "balance": 11}),
+            (ChangeSet.ADD, self.User, {"user_id": 3, "balance": 30}),
+            (ChangeSet.ADD, self.User, {"user_id": 1, "balance": 12}),
+            (ChangeSet.DELETE, self.User, {"user_id": 2, "balance": 20}),
+            (ChangeSet.DELETE, self.Order, {"equity_id": 1, "order_id": 1, "quantity": 5}),
+            (ChangeSet.DELETE, self.Order, {"equity_id": 1, "order_id": 2, "quantity": 6}),
+            (ChangeSet.ADD, self.Order, {"equity_id": 1, "order_id": 2, "quantity": 7})
+        ]
+
+        for i in range(2):
+            self.apply(changes)
+
+            self.assertEqual(self.db.session.get(self.User, 1).balance, 12)
+            self.assertIsNone(self.db.session.get(self.User, 2))
+            self.assertEqual(self.db.session.get(self.User, 3).balance, 30)
+            self.assertIsNone(self.db.session.get(self.Order, (1, 1)))
+            self.assertEqual(self.db.session.get(self.Order, (1, 2)).quantity, 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
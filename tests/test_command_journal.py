@@ -0,0 +1,202 @@
+import os
+import shutil
+import tempfile
+import unittest
+from operator import neg
+
+import tests
+from trade_engine.command_journal.command_journal import CommandJournal
+from trade_engine.command_journal.replay_journal import replay_journal
+from transactional_data_structures.dictionary_price_level_version import DictionaryPriceLevelVersion
+
+
+class Column(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class Table(object):
+    def __init__(self, column_names):
+        self.columns = [Column(name) for name in column_names]
+
+
+class ClassManager(object):
+    def __init__(self, model_class):
+        self.model_class = model_class
+
+    def new_instance(self):
+        return self.model_class.__new__(self.model_class)
+
+
+class Mapper(object):
+    def __init__(self, model_class):
+        self.class_manager = ClassManager(model_class)
+
+
+# The columns and mapper journaled models are encoded and rebuilt through.
+class Order(object):
+    def __init__(self, user_id, is_long, price, quantity, equity_id=1):
+        self.order_id = None
+        self.user_id = user_id
+        self.equity_id = equity_id
+        self.is_long = is_long
+        self.price = price
+        self.quantity = quantity
+        self.filled_quantity = 0
+        self.is_closed = False
+
+    def copy_values(self, order):
+        self.filled_quantity = order.filled_quantity
+        self.is_closed = order.is_closed
+
+    def clone(self):
+        result = Order(self.user_id, self.is_long, self.price, self.quantity, self.equity_id)
+        result.order_id = self.order_id
+        result.copy_values(self)
+        return result
+
+    @staticmethod
+    def open_quantity(order):
+        return order.quantity - order.filled_quantity
+
+    @staticmethod
+    def id_key(order):
+        return order.order_id
+
+
+Order.__table__ = Table(["order_id", "user_id", "equity_id", "is_long", "price", "quantity", "filled_quantity",
+                         "is_closed"])
+Order.__mapper__ = Mapper(Order)
+
+
+# Runs and journals commands the way TradeEngine does: the record is encoded before the command changes its
+# arguments and appended once the command committed.
+class Engine(object):
+    def __init__(self, command_journal=None):
+        self.command_journal = command_journal
+        self.next_order_id = 1
+        self.books = {
+            True: DictionaryPriceLevelVersion({}, {}, "equity_id", "price", Order.open_quantity, None, Order.id_key,
+                                              level_key=neg),
+            False: DictionaryPriceLevelVersion({}, {}, "equity_id", "price", Order.open_quantity, None,
+                                               Order.id_key)
+        }
+
+    def execute_func(self, quick_lock_func, func, *args, **kwargs):
+        record = None if self.command_journal is None else CommandJournal.encode(func, args, kwargs)
+        getattr(self, func)(*args, **kwargs)
+        for book in self.books.values():
+            book.commit(None)
+        if record is not None:
+            self.command_journal.append(record)
+
+    def _place_order(self, order):
+        order.order_id = self.next_order_id
+        self.next_order_id += 1
+
+        book = self.books[not order.is_long]
+        for matched_order in list(book.iter_items(order)):
+            crosses = matched_order.price <= order.price if order.is_long else matched_order.price >= order.price
+            if not crosses or Order.open_quantity(order) == 0:
+                break
+
+            quantity = min(Order.open_quantity(order), Order.open_quantity(matched_order))
+            filled_order = matched_order.clone()
+            filled_order.filled_quantity += quantity
+            order.filled_quantity += quantity
+
+            if Order.open_quantity(filled_order) == 0:
+                book.remove_item(matched_order)
+            else:
+                book.update_item(filled_order, matched_order)
+
+        if Order.open_quantity(order) == 0:
+            order.is_closed = True
+        else:
+            self.books[order.is_long].insert_item(order)
+
+    def _cancel_order(self, order, reason=None):
+        self.books[order.is_long].remove_item(order)
+
+    def get_book(self):
+        equity = Order(None, True, 0, 0)
+        return dict(
+            (is_long, [
+                (order.order_id, order.user_id, order.price, Order.open_quantity(order))
+                for order in self.books[is_long].iter_items(equity)
+            ])
+            for is_long in self.books
+        )
+
+
+class CommandJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "commands.journal")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_record_is_taken_before_the_command_runs(self):
+        order = Order(1, True, 100, 5)
+        record = CommandJournal.encode("_place_order", (order,), {"reason": "test"})
+
+        order.order_id = 7
+        order.filled_quantity = 5
+        order.is_closed = True
+
+        journal = CommandJournal(self.path)
+        journal.append(record)
+        journal.close()
+
+        records = list(CommandJournal.read_records(self.path))
+        self.assertEqual(len(records), 1)
+        (offset, sequence, func, args, kwargs) = records[0]
+        self.assertEqual((sequence, func, kwargs), (1, "_place_order", {"reason": "test"}))
+        self.assertIsNot(args[0], order)
+        self.assertEqual((args[0].order_id, args[0].filled_quantity, args[0].is_closed), (None, 0, False))
+
+    def test_replay_crossing_order(self):
+        journal = CommandJournal(self.path)
+        engine = Engine(journal)
+
+        resting = [Order(1, False, 101, 3), Order(2, False, 102, 4), Order(3, False, 102, 2), Order(4, True, 99, 5)]
+        for order in resting:
+            engine.execute_func(None, "_place_order", order)
+        engine.execute_func(None, "_cancel_order", resting[3], reason="user")
+
+        # Crosses two levels, fills the first two asks and part of the third.
+        crossing = Order(5, True, 102, 8)
+        engine.execute_func(None, "_place_order", crossing)
+        self.assertTrue(crossing.is_closed)
+
+        engine.execute_func(None, "_place_order", Order(6, True, 100, 1))
+        journal.close()
+
+        replayed = Engine()
+        self.assertEqual(replay_journal(replayed, self.path), 7)
+
+        self.assertEqual(replayed.get_book(), engine.get_book())
+        self.assertEqual(engine.get_book(), {True: [(6, 6, 100, 1)], False: [(3, 3, 102, 1)]})
+        self.assertEqual(replayed.next_order_id, engine.next_order_id)
+
+    def test_recover_cuts_torn_tail(self):
+        journal = CommandJournal(self.path)
+        journal.append(CommandJournal.encode("_place_order", (Order(1, True, 100, 5),)))
+        journal.append(CommandJournal.encode("_place_order", (Order(2, True, 100, 5),)))
+        journal.close()
+
+        with open(self.path, "r+b") as journal_file:
+            journal_file.truncate(os.path.getsize(self.path) - 1)
+
+        journal = CommandJournal(self.path)
+        self.assertEqual(journal.sequence, 1)
+        self.assertEqual(journal.append(CommandJournal.encode("_cancel_order", ())), 2)
+        journal.close()
+
+        self.assertEqual([record[1:3] for record in CommandJournal.read_records(self.path)],
+                         [(1, "_place_order"), (2, "_cancel_order")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+import random
+import unittest
+from operator import neg
+
+import tests
+from transactional_data_structures.dictionary_price_level_version import DictionaryPriceLevelVersion
+
+
+class Order(object):
+    def __init__(self, order_id, price, quantity, filled_quantity=0, equity_id=1):
+        self.equity_id = equity_id
+        self.order_id = order_id
+        self.price = price
+        self.quantity = quantity
+        self.filled_quantity = filled_quantity
+
+    def clone(self):
+        return Order(self.order_id, self.price, self.quantity, self.filled_quantity, self.equity_id)
+
+    def copy_values(self, order):
+        self.price = order.price
+        self.quantity = order.quantity
+        self.filled_quantity = order.filled_quantity
+
+    @staticmethod
+    def open_quantity(order):
+        return order.quantity - order.filled_quantity
+
+    @staticmethod
+    def id_key(order):
+        return order.order_id
+
+
+EQUITY = Order(0, 0, 0)
+
+
+def price_levels(is_long):
+    return DictionaryPriceLevelVersion({}, {}, "equity_id", "price", Order.open_quantity, None, Order.id_key,
+                                       level_key=neg if is_long else None)
+
+
+def fill(orders, order, quantity):
+    filled_order = order.clone()
+    filled_order.filled_quantity += quantity
+
+    if Order.open_quantity(filled_order) == 0:
+        orders.remove_item(order)
+    else:
+        orders.update_item(filled_order, order)
+
+    return filled_order
+
+
+class DictionaryPriceLevelVersionTest(unittest.TestCase):
+    def setUp(self):
+        self.random = random.Random(5)
+
+    def get_orders(self, orders):
+        return [(order.order_id, order.price, Order.open_quantity(order)) for order in orders.get_list(EQUITY)]
+
+    def test_add(self):
+        root = price_levels(False)
+        orders = root.clone()
+
+        orders.insert_item(Order(1, 101, 5))
+        orders.insert_item(Order(2, 100, 3))
+        orders.insert_item(Order(3, 101, 2))
+        orders.insert_item(Order(4, 102, 1, equity_id=2))
+
+        self.assertEqual(orders.get_depth(EQUITY), [(100, 3, 1), (101, 7, 2)])
+        self.assertEqual(orders.get_depth(EQUITY, reverse=True), [(101, 7, 2), (100, 3, 1)])
+        self.assertEqual(self.get_orders(orders), [(2, 100, 3), (1, 101, 5), (3, 101, 2)])
+        self.assertEqual(orders.get_best_item(EQUITY).order_id, 2)
+        self.assertEqual(root.get_depth(EQUITY), [])
+
+        orders.commit(None)
+
+        self.assertEqual(root.get_depth(EQUITY), [(100, 3, 1), (101, 7, 2)])
+        self.assertEqual(root.get_depth(Order(0, 0, 0, equity_id=2)), [(102, 1, 1)])
+        self.assertEqual(list(root.prices[1]), [100, 101])
+
+        # Later orders queue behind the committed ones of their level.
+        orders.insert_item(Order(5, 101, 4))
+        orders.insert_item(Order(6, 99, 1))
+        self.assertEqual([order.order_id for order in orders.iter_items(EQUITY, 100)], [6, 2])
+        self.assertEqual([order.order_id for order in orders.iter_items(EQUITY)], [6, 2, 1, 3, 5])
+        self.assertEqual(orders.get_level(EQUITY, 101).quantity, 11)
+        self.assertEqual(root.get_level(EQUITY, 101).quantity, 7)
+
+    def test_bids_best_first(self):
+        orders = price_levels(True).clone()
+
+        for (order_id, price) in ((1, 100), (2, 102), (3, 101), (4, 102)):
+            orders.insert_item(Order(order_id, price, 1))
+
+        self.assertEqual([level[0] for level in orders.get_depth(EQUITY)], [102, 101, 100])
+        self.assertEqual([order.order_id for order in orders.iter_items(EQUITY, 101)], [2, 4, 3])
+
+        orders.commit(None)
+        self.assertEqual([level[0] for level in orders.get_depth(EQUITY)], [102, 101, 100])
+
+    def test_fill(self):
+        root = price_levels(False)
+        orders = root.clone()
+        first = Order(1, 100, 5)
+        second = Order(2, 100, 3)
+        third = Order(3, 101, 2)
+        for order in (first, second, third):
+            orders.insert_item(order)
+        orders.commit(None)
+
+        # A partial fill keeps the order at the head of its level.
+        first = fill(orders, first, 2)
+        self.assertEqual(self.get_orders(orders), [(1, 100, 3), (2, 100, 3), (3, 101, 2)])
+        self.assertEqual(orders.get_depth(EQUITY), [(100, 6, 2), (101, 2, 1)])
+        self.assertEqual(root.get_depth(EQUITY), [(100, 8, 2), (101, 2, 1)])
+
+        # Filling the whole level removes it.
+        fill(orders, first, 3)
+        fill(orders, second, 3)
+        self.assertIsNone(orders.get_level(EQUITY, 100))
+        self.assertEqual(orders.get_best(EQUITY).price, 101)
+        self.assertEqual(orders.get_depth(EQUITY), [(101, 2, 1)])
+
+        orders.commit(None)
+
+        self.assertEqual(root.get_depth(EQUITY), [(101, 2, 1)])
+        self.assertEqual(list(root.prices[1]), [101])
+        self.assertNotIn(100, root.dic[1])
+
+        fill(orders, third, 2)
+        orders.commit(None)
+        self.assertEqual(root.get_depth(EQUITY), [])
+        self.assertNotIn(1, root.dic)
+        self.assertNotIn(1, root.prices)
+
+    def test_roll_back(self):
+        root = price_levels(False)
+        orders = root.clone()
+        order = Order(1, 100, 5)
+        orders.insert_item(order)
+        orders.commit(None)
+
+        fill(orders, order, 5)
+        orders.insert_item(Order(2, 105, 1))
+        orders.roll_back()
+
+        self.assertEqual(self.get_orders(orders), [(1, 100, 5)])
+        self.assertEqual(orders.get_depth(EQUITY), [(100, 5, 1)])
+
+    def test_against_model(self):
+        root = price_levels(False)
+        orders = root.clone()
+        # price -> [[order, open quantity]] oldest first
+        model = {}
+        order_id = 0
+
+        for i in range(400):
+            resting = [entry for price in sorted(model) for entry in model[price]]
+
+            if len(resting) == 0 or self.random.random() < 0.4:
+                order_id += 1
+                price = self.random.randint(95, 105)
+                order = Order(order_id, price, self.random.randint(1, 5))
+                orders.insert_item(order)
+                model.setdefault(price, []).append([order, order.quantity])
+            else:
+                entry = self.random.choice(resting)
+                (order, quantity) = entry
+                quantity = self.random.randint(1, quantity)
+                entry[0] = fill(orders, order, quantity)
+                entry[1] -= quantity
+                if entry[1] == 0:
+                    level = model[order.price]
+                    level.remove(entry)
+                    if len(level) == 0:
+                        del model[order.price]
+
+            if self.random.random() < 0.2:
+                orders.commit(None)
+
+            expected = [(entry[0].order_id, price, entry[1]) for price in sorted(model) for entry in model[price]]
+            self.assertEqual(self.get_orders(orders), expected)
+            self.assertEqual(orders.get_depth(EQUITY), [
+                (price, sum(entry[1] for entry in model[price]), len(model[price])) for price in sorted(model)
+            ])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import threading
+import unittest
+
+import tests
+from locks.lock_set import LockSet
+from locks.deadlock_error import DeadlockError
+from locks.wait_for_graph import WaitForGraph
+from locks.lock.lock_dic import LockDic
+
+
+class LockSetTest(unittest.TestCase):
+    def test_add_keeps_order(self):
+        lock_set = LockSet([("uu", 3), ("e", 7), ("e", 2), ("uu", 3)])
+
+        self.assertEqual(list(lock_set), [("e", 2), ("e", 7), ("uu", 3)])
+        self.assertFalse(lock_set.add(("e", 7)))
+        self.assertTrue(lock_set.add_kind("e", 5))
+        self.assertEqual(list(lock_set), [("e", 2), ("e", 5), ("e", 7), ("uu", 3)])
+        self.assertEqual(list(reversed(lock_set)), [("uu", 3), ("e", 7), ("e", 5), ("e", 2)])
+        self.assertIn(("e", 5), lock_set)
+
+    def test_union(self):
+        lock_set = LockSet([("e", 1), ("e", 4)])
+        other = LockSet([("e", 2), ("e", 4), ("uu", 1)])
+
+        union = lock_set.union(other)
+
+        self.assertEqual(list(union), [("e", 1), ("e", 2), ("e", 4), ("uu", 1)])
+        self.assertTrue(union.contains_all(lock_set))
+        self.assertTrue(union.contains_all(other))
+        self.assertEqual(list(lock_set), [("e", 1), ("e", 4)])
+        self.assertIs(union.union(lock_set), union)
+        self.assertIs(lock_set.union(None), lock_set)
+
+    def test_contains_all(self):
+        lock_set = LockSet([("e", 1), ("e", 2)])
+
+        self.assertTrue(lock_set.contains_all(None))
+        self.assertTrue(lock_set.contains_all(LockSet([("e", 2)])))
+        self.assertFalse(lock_set.contains_all(LockSet([("e", 3)])))
+
+    def test_common_prefix_length(self):
+        lock_set = LockSet([("e", 1), ("e", 2), ("uu", 1)])
+
+        self.assertEqual(lock_set.common_prefix_length(LockSet([("e", 1), ("e", 2), ("uu", 2)])), 2)
+        self.assertEqual(lock_set.common_prefix_length(LockSet([("e", 0)])), 0)
+        self.assertEqual(lock_set.common_prefix_length(lock_set), 3)
+
+
+class LockDicTest(unittest.TestCase):
+    TIMEOUT = 10
+
+    def setUp(self):
+        self.wait_for_graph = WaitForGraph()
+        self.lock_dic = LockDic(wait_for_graph=self.wait_for_graph)
+
+    def test_reentrant(self):
+        self.assertTrue(self.lock_dic.acquire(("e", 1)))
+        self.assertTrue(self.lock_dic.acquire(("e", 1)))
+        self.lock_dic.release(("e", 1))
+
+        acquired = []
+        thread = threading.Thread(target=lambda: acquired.append(self.lock_dic.acquire(("e", 1), 0.01)))
+        thread.start()
+        thread.join(self.TIMEOUT)
+        self.assertEqual(acquired, [False])
+
+        self.lock_dic.release(("e", 1))
+        self.assertTrue(self.lock_dic.try_acquire(("e", 1)))
+        self.lock_dic.release(("e", 1))
+
+    def test_deadlock_detection_and_retry(self):
+        first_key = ("e", 1)
+        second_key = ("e", 2)
+        holding = [threading.Event(), threading.Event()]
+        older_started = threading.Event()
+        results = {}
+        errors = []
+
+        # The first attempt takes the locks in the order given, the way a command grows its lock set while it runs.
+        # A DeadlockError releases what the attempt holds and starts again in the same transaction, taking the
+        # locks in LockSet order, as execute_func does.
+        def run(name, index, keys):
+            self.wait_for_graph.begin_transaction()
+            if index == 0:
+                older_started.set()
+            deadlocks = 0
+
+            try:
+                while True:
+                    held = []
+                    try:
+                        for key in (keys if deadlocks == 0 else LockSet(keys)):
+                            if not self.lock_dic.acquire(key, self.TIMEOUT):
+                                raise Exception("Timeout")
+                            held.append(key)
+                            if deadlocks == 0 and len(held) == 1:
+                                holding[index].set()
+                                holding[1 - index].wait(self.TIMEOUT)
+                        break
+                    except DeadlockError:
+                        deadlocks += 1
+                    finally:
+                        for key in reversed(held):
+                            self.lock_dic.release(key)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                self.wait_for_graph.end_transaction()
+
+            results[name] = deadlocks
+
+        older = threading.Thread(target=run, args=("older", 0, (first_key, second_key)))
+        younger = threading.Thread(target=run, args=("younger", 1, (second_key, first_key)))
+
+        older.start()
+        older_started.wait(self.TIMEOUT)
+        younger.start()
+        older.join(self.TIMEOUT)
+        younger.join(self.TIMEOUT)
+
+        self.assertEqual(errors, [])
+        # The youngest transaction of the cycle is the victim, the older one keeps waiting.
+        self.assertEqual(results, {"older": 0, "younger": 1})
+
+        stats = self.wait_for_graph.get_stats()
+        self.assertEqual(sum(stat["deadlocks"] for stat in stats.values()), 1)
+        self.assertEqual(sum(stat["timeouts"] for stat in stats.values()), 0)
+
+        self.assertTrue(self.lock_dic.try_acquire(first_key))
+        self.assertTrue(self.lock_dic.try_acquire(second_key))
+        self.lock_dic.release(second_key)
+        self.lock_dic.release(first_key)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+
+import tests
+from transactional_data_structures.transactional import Transactional, transactional
+from transactional_data_structures.dictionary_version import DictionaryVersion
+from transactional_data_structures.dirty_tracker import DirtyTracker
+
+
+class Item(object):
+    def __init__(self, item_id, value):
+        self.item_id = item_id
+        self.value = value
+
+    def clone(self):
+        return Item(self.item_id, self.value)
+
+    def copy_values(self, item):
+        self.value = item.value
+
+
+@transactional("items", "other_items")
+class Holder(Transactional):
+    def __init__(self):
+        self.events = None
+        self.items = DictionaryVersion({}, "item_id")
+        self.other_items = DictionaryVersion({}, "item_id")
+        self.clone_count = 0
+
+    def clone_init(self):
+        self.tracker = DirtyTracker()
+        self.clone_count += 1
+
+
+class TransactionalTest(unittest.TestCase):
+    def test_is_new_style(self):
+        # Python 2 old-style classes have no __new__, which clone relies on.
+        self.assertTrue(issubclass(Transactional, object))
+        self.assertTrue(hasattr(Holder, "__new__"))
+
+    def test_clone_shares_committed_state(self):
+        holder = Holder()
+        holder.items.dic[1] = Item(1, "a")
+
+        context = holder.clone()
+
+        self.assertIsInstance(context, Holder)
+        self.assertIsNot(context.items, holder.items)
+        self.assertIs(context.items.dic, holder.items.dic)
+        self.assertIs(context.items.tracker, context.tracker)
+        self.assertEqual(context.clone_count, 1)
+        self.assertEqual(holder.clone_count, 0)
+        self.assertEqual(context.items.get_item_from_key(1).value, "a")
+
+    def test_commit(self):
+        holder = Holder()
+        context = holder.clone()
+
+        context.items.insert_item(Item(1, "a"))
+        self.assertIsNone(holder.items.get_item_from_key(1))
+        self.assertEqual(context.tracker.items, [context.items])
+
+        context.tracker.commit(None)
+
+        self.assertEqual(holder.items.get_item_from_key(1).value, "a")
+        self.assertEqual(context.tracker.items, [])
+        self.assertFalse(context.items.dirty)
+
+    def test_roll_back(self):
+        holder = Holder()
+        holder.items.dic[1] = Item(1, "a")
+        context = holder.clone()
+
+        context.items.update_item(Item(1, "b"), holder.items.dic[1])
+        context.other_items.insert_item(Item(2, "c"))
+        self.assertEqual(context.items.get_item_from_key(1).value, "b")
+
+        context.tracker.roll_back()
+
+        self.assertEqual(context.items.get_item_from_key(1).value, "a")
+        self.assertIsNone(context.other_items.get_item_from_key(2))
+        self.assertEqual(holder.items.dic[1].value, "a")
+
+    def test_generated_commit_and_roll_back(self):
+        holder = Holder()
+        context = holder.clone()
+
+        context.items.insert_item(Item(1, "a"))
+        context.roll_back()
+        self.assertIsNone(context.items.get_item_from_key(1))
+
+        context.other_items.insert_item(Item(2, "b"))
+        context.commit(None)
+        self.assertEqual(holder.other_items.get_item_from_key(2).value, "b")
+
+    def test_base_clone(self):
+        leaf = DictionaryVersion({}, "item_id")
+        result = Transactional.clone(leaf)
+
+        self.assertIsInstance(result, DictionaryVersion)
+        self.assertIs(result.dic, leaf.dic)
+
+
+if __name__ == "__main__":
+    unittest.main()
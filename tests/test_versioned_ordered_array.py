@@ -0,0 +1,150 @@
+import random
+import unittest
+from bisect import bisect_left
+
+import tests
+from transactional_data_structures.versioned_ordered_array import VersionedOrderedArray
+from transactional_data_structures.sorted_array import SortedArray
+from transactional_data_structures.b_tree_array import BTreeArray
+
+
+class Item(object):
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+
+    def copy_values(self, item):
+        self.value = item.value
+
+
+def item_key(item):
+    return item.key
+
+
+class SmallBTreeArray(BTreeArray):
+    def __init__(self, comparer, items=None, key=None):
+        BTreeArray.__init__(self, comparer, items, key=key, load=4)
+
+
+class VersionedOrderedArrayTestMixin(object):
+    array_class = None
+
+    def setUp(self):
+        self.random = random.Random(11)
+        self.committed = [Item(key, key) for key in range(0, 100, 2)]
+        self.array = VersionedOrderedArray(list(self.committed), None, None, array_class=self.array_class,
+                                           key=item_key)
+        self.model = [(item.key, item.value) for item in self.committed]
+
+    def keys(self):
+        return [key for (key, value) in self.model]
+
+    def assert_matches(self, array, model):
+        pairs = lambda items: [(item.key, item.value) for item in items]
+
+        self.assertEqual(array.get_length(), len(model))
+        self.assertEqual(pairs(array), model)
+        self.assertEqual(pairs(reversed(array)), model[::-1])
+        self.assertEqual(pairs([array[i] for i in range(len(model))]), model)
+        self.assertIsNone(array[len(model)])
+
+        for (start, stop, step) in ((None, None, None), (3, 17, None), (2, 30, 3), (None, None, -1), (25, 4, -2)):
+            self.assertEqual(pairs(array[start:stop:step]), model[start:stop:step])
+
+        for (start_key, end_key) in ((None, None), (11, 40), (40, None), (None, 11)):
+            expected = [
+                pair for pair in model
+                if (start_key is None or pair[0] >= start_key) and (end_key is None or pair[0] < end_key)
+            ]
+            self.assertEqual(pairs(array.get_range(start_key, end_key)), expected)
+            self.assertEqual(pairs(array.get_range(end_key, start_key, reverse=True)),
+                             [pair for pair in model[::-1]
+                              if (end_key is None or pair[0] <= end_key) and
+                              (start_key is None or pair[0] > start_key)])
+
+    def apply_random_change(self):
+        keys = self.keys()
+        action = self.random.randint(0, 3)
+
+        if action == 0:
+            key = self.random.randint(0, 120)
+            if key not in keys:
+                self.array.insert_item(Item(key, -key))
+                self.model.insert(bisect_left(keys, key), (key, -key))
+        elif action == 1 and len(keys) > 0:
+            key = self.random.choice(keys)
+            self.array.remove_item(Item(key, None))
+            del self.model[keys.index(key)]
+        elif action == 2 and len(keys) > 0:
+            key = self.random.choice(keys)
+            value = self.random.randint(1000, 2000)
+            self.array.update_item(Item(key, value), self.array.get_item(Item(key, None)))
+            self.model[keys.index(key)] = (key, value)
+        else:
+            start_key = self.random.randint(0, 120)
+            end_key = start_key + self.random.randint(0, 6)
+            removed = self.array.remove_range(start_key, end_key)
+            expected = [pair for pair in self.model if start_key <= pair[0] < end_key]
+            self.assertEqual([(item.key, item.value) for item in removed], expected)
+            self.model = [pair for pair in self.model if not start_key <= pair[0] < end_key]
+
+    def test_overlay(self):
+        for i in range(300):
+            self.apply_random_change()
+            self.assert_matches(self.array, self.model)
+
+    def test_get_item(self):
+        self.array.insert_item(Item(3, "new"))
+        self.array.remove_item(Item(4, None))
+        self.array.update_item(Item(6, "updated"), self.array.get_item(Item(6, None)))
+
+        self.assertEqual(self.array.get_item(Item(3, None)).value, "new")
+        self.assertIsNone(self.array.get_item(Item(4, None)))
+        self.assertEqual(self.array.get_item(Item(6, None)).value, "updated")
+        self.assertEqual(self.array.get_item(Item(8, None)).value, 8)
+        self.assertIsNone(self.array.get_item(Item(5, None)))
+
+    def test_commit(self):
+        for i in range(20):
+            for j in range(15):
+                self.apply_random_change()
+
+            self.array.commit(None)
+
+            self.assertEqual(self.array.new_items, [])
+            self.assertEqual(self.array.tombstones, [])
+            self.assertEqual(self.array.update_items, [])
+            self.assertEqual([(item.key, item.value) for item in self.array.array], self.model)
+            self.assert_matches(self.array, self.model)
+
+    def test_roll_back(self):
+        committed = list(self.model)
+
+        for i in range(30):
+            self.apply_random_change()
+        self.array.roll_back()
+
+        self.assert_matches(self.array, committed)
+
+    def test_clone_is_isolated(self):
+        clone = self.array.clone()
+        clone.insert_item(Item(1, 1))
+        clone.remove_item(Item(0, None))
+
+        self.assert_matches(self.array, self.model)
+
+        clone.commit(None)
+        self.assertEqual(self.array.get_item(Item(1, None)).value, 1)
+        self.assertIsNone(self.array.get_item(Item(0, None)))
+
+
+class SortedArrayVersionedOrderedArrayTest(VersionedOrderedArrayTestMixin, unittest.TestCase):
+    array_class = SortedArray
+
+
+class BTreeArrayVersionedOrderedArrayTest(VersionedOrderedArrayTestMixin, unittest.TestCase):
+    array_class = SmallBTreeArray
+
+
+if __name__ == "__main__":
+    unittest.main()